@@ -0,0 +1,149 @@
+"""
+Benchmark PASO 7/8.1 de append_agpe_ans: construcción por filas (iterrows + dict)
+vs. construcción columnar. Verifica además que ambas den el mismo resultado.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_filas_append [n_filas]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from src.export.append_agpe_ans import (
+    COLUMNAS_MIN_CONTROLADAS,
+    _construir_filas_nuevas,
+    _cruzar_bdpcp,
+    _safe_str,
+)
+from src.export.servicio_bdpcp import mapa_bdpcp
+
+
+HEADERS_ANS = list(COLUMNAS_MIN_CONTROLADAS)
+
+
+def _filas_por_iterrows(df_clean_datos, df_vis_datos, df_bdpcp):
+    # Implementación anterior (PASO 7 + PASO 8 + PASO 8.1). La regla 1RA VISITA => C07
+    # ya no va aquí: se aplica una sola vez con las reglas ANS (config/reglas_ans.yaml).
+    def _blank_row_dict():
+        d = {h: "" for h in HEADERS_ANS}
+        for h in COLUMNAS_MIN_CONTROLADAS:
+            if h not in d:
+                d[h] = ""
+        return d
+
+    nuevas_filas = []
+    for _, row in df_clean_datos.iterrows():
+        pedido = _safe_str(row.get("PEDIDO", "")).upper()
+        if pedido == "":
+            continue
+        d = _blank_row_dict()
+        d["PEDIDO"] = pedido
+        d["DIRECCION"] = _safe_str(row.get("DIRECCION", ""))
+        d["MUNICIPIO"] = _safe_str(row.get("MUNICIPIO", ""))
+        d["CLIENTE"] = _safe_str(row.get("CLIENTE", "")).upper()
+        d["SUBZONA"] = _safe_str(row.get("SUBZONA", "")).upper()
+        d["TIPO_VISITA"] = _safe_str(row.get("TIPO_VISITA", ""))
+        d["DETALLE_VISITA"] = _safe_str(row.get("DETALLE_VISITA", "")).upper()
+        d["COORDENADAX"] = _safe_str(row.get("COORDENADAX", ""))
+        d["COORDENADAY"] = _safe_str(row.get("COORDENADAY", ""))
+        d["TIPO_MEDIDOR"] = _safe_str(row.get("TIPO_MEDIDOR", ""))
+        d["URBANO_RURAL"] = _safe_str(row.get("URBANO_RURAL", "")).upper()
+        d["FECHA_CAMBIO_ESTADO"] = _safe_str(row.get("FECHA_CAMBIO_ESTADO", ""))
+        nuevas_filas.append(d)
+
+    for _, row in df_vis_datos.iterrows():
+        pedido = _safe_str(row.get("PEDIDO", "")).upper()
+        if pedido == "":
+            continue
+        d = _blank_row_dict()
+        d["PEDIDO"] = pedido
+        d["DIRECCION"] = _safe_str(row.get("DIRECCION", ""))
+        d["MUNICIPIO"] = _safe_str(row.get("MUNICIPIO", ""))
+        d["CLIENTE"] = _safe_str(row.get("CLIENTE", "")).upper()
+        d["SUBZONA"] = _safe_str(row.get("SUBZONA", "")).upper()
+        d["PROMOTOR"] = _safe_str(row.get("PROMOTOR", ""))
+        d["CELULAR"] = _safe_str(row.get("CELULAR", ""))
+        d["POTENCIA_AC_KW"] = _safe_str(row.get("POTENCIA_AC_KW", ""))
+        d["DETALLE_VISITA"] = _safe_str(row.get("DETALLE_VISITA", "")).upper()
+        d["COORDENADAX"] = _safe_str(row.get("COORDENADAX", ""))
+        d["COORDENADAY"] = _safe_str(row.get("COORDENADAY", ""))
+        d["URBANO_RURAL"] = _safe_str(row.get("URBANO_RURAL", "")).upper()
+        d["TIPO_VISITA"] = _safe_str(row.get("TIPO_VISITA", "")).upper()
+        d["OBSERVACION"] = _safe_str(row.get("OBSERVACION", "")).upper()
+        d["FECHA_CAMBIO_ESTADO"] = _safe_str(row.get("FECHA_CAMBIO_ESTADO", ""))
+        nuevas_filas.append(d)
+
+    bdpcp_map = {}
+    for _, r in df_bdpcp.iterrows():
+        p = _safe_str(r.get("PEDIDO", "")).upper()
+        if p:
+            bdpcp_map[p] = {
+                "PROMOTOR": _safe_str(r.get("PROMOTOR", "")),
+                "CELULAR": _safe_str(r.get("CELULAR", "")),
+                "POTENCIA_AC_KW": _safe_str(r.get("POTENCIA_AC_KW", "")),
+            }
+
+    for d in nuevas_filas:
+        p = _safe_str(d.get("PEDIDO", "")).upper()
+        if p in bdpcp_map:
+            for c in ("PROMOTOR", "CELULAR", "POTENCIA_AC_KW"):
+                if _safe_str(d.get(c, "")) == "":
+                    d[c] = bdpcp_map[p].get(c, "")
+
+    return pd.DataFrame([[d.get(h, "") for h in HEADERS_ANS] for d in nuevas_filas], columns=HEADERS_ANS)
+
+
+def _filas_columnar(df_clean_datos, df_vis_datos, df_bdpcp):
+    df_nuevas = _construir_filas_nuevas(df_clean_datos, df_vis_datos, HEADERS_ANS)
+    return _cruzar_bdpcp(df_nuevas, mapa_bdpcp(df_bdpcp))
+
+
+def _datos_sinteticos(n, semilla=11):
+    rng = np.random.default_rng(semilla)
+    pedidos = rng.integers(10_000_000, 99_999_999, n).astype(str)
+    detalles = np.array(["1RA VISITA", "2DA VISITA Y DOCUMENTOS", "DOCUMENTOS", "DIRECTA", ""], dtype=object)
+    comun = {
+        "PEDIDO": pedidos,
+        "DIRECCION": [f" CL {i} # {i % 90}-{i % 50} " for i in range(n)],
+        "MUNICIPIO": rng.choice(["MEDELLIN", "ENVIGADO", "RIONEGRO"], n),
+        "CLIENTE": [f"cliente {i}" for i in range(n)],
+        "SUBZONA": rng.choice(["oriente", "METROPOLITANA", ""], n),
+        "DETALLE_VISITA": rng.choice(detalles, n),
+        "COORDENADAX": rng.uniform(-76, -75, n).round(6).astype(str),
+        "COORDENADAY": rng.uniform(6, 7, n).round(6).astype(str),
+        "URBANO_RURAL": rng.choice(["urbano", "rural"], n),
+        "FECHA_CAMBIO_ESTADO": ["2026/01/23 15:11:46"] * n,
+    }
+    df_clean = pd.DataFrame({**comun, "TIPO_VISITA": rng.choice(["C08", "C09", ""], n), "TIPO_MEDIDOR": ""})
+    df_vis = pd.DataFrame({**comun, "PROMOTOR": rng.choice(["", "ANA"], n), "CELULAR": "", "POTENCIA_AC_KW": ""})
+    df_bdpcp = pd.DataFrame({
+        "PEDIDO": rng.choice(pedidos, n // 2),
+        "PROMOTOR": "PROMOTOR BD",
+        "CELULAR": "3000000000",
+        "POTENCIA_AC_KW": "5.5",
+    })
+    return df_clean, df_vis, df_bdpcp
+
+
+def main(n=50_000):
+    df_clean, df_vis, df_bdpcp = _datos_sinteticos(n)
+    total = 2 * n
+
+    t0 = time.perf_counter()
+    antes = _filas_por_iterrows(df_clean, df_vis, df_bdpcp)
+    t_antes = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    despues = _filas_columnar(df_clean, df_vis, df_bdpcp)
+    t_despues = time.perf_counter() - t0
+
+    pd.testing.assert_frame_equal(antes, despues.reset_index(drop=True), check_dtype=False)
+
+    print(f"Filas: {total:,} (resultado idéntico)")
+    print(f"iterrows + dict: {t_antes:.2f} s  ({total / t_antes:,.0f} filas/s)")
+    print(f"columnar:        {t_despues:.2f} s  ({total / t_despues:,.0f} filas/s)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
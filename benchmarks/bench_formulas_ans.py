@@ -0,0 +1,85 @@
+"""
+Benchmark modo estático vs. modo fórmulas de AGPE_ANS: tamaño del archivo y
+tiempo de apertura (openpyxl y pandas) sobre una hoja grande sintética.
+Excel no está disponible aquí: el recálculo al abrir en Excel no se mide.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_formulas_ans [n_filas]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+from src.export.append_agpe_ans import COLUMNAS_MIN_CONTROLADAS, _calcular_ans_nuevas
+from src.export.formulas_ans import asegurar_hoja_festivos, formulas_ans
+
+
+def _datos(n, seed=5):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame("", index=pd.RangeIndex(2, n + 2), columns=COLUMNAS_MIN_CONTROLADAS, dtype=object)
+    df["PEDIDO"] = rng.integers(10_000_000, 99_999_999, n).astype(str)
+    df["DIRECCION"] = [f"CL {i} # {i % 90}-{i % 50}" for i in range(n)]
+    df["MUNICIPIO"] = rng.choice(["MEDELLIN", "ENVIGADO", "RIONEGRO"], n)
+    df["CLIENTE"] = [f"CLIENTE {i}" for i in range(n)]
+    df["TIPO_VISITA"] = rng.choice(["C07", "C08", "C09"], n)
+    df["DETALLE_VISITA"] = rng.choice(["1RA VISITA", "2DA VISITA Y DOCUMENTOS", "DOCUMENTOS", "DIRECTA"], n)
+    fechas = pd.Timestamp("2026-01-01") + pd.to_timedelta(rng.integers(0, 90 * 24 * 60, n), unit="min")
+    df["FECHA_CAMBIO_ESTADO"] = fechas.strftime("%Y-%m-%d %H:%M:%S")
+    df["FECHA_CIERRE_FENIX"] = None
+    df["FECHA_LIMITE_ANS"] = ""
+    return _calcular_ans_nuevas(df)
+
+
+def _guardar(df, ruta, formulas):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "AGPE_ANS"
+    ws.append(list(df.columns))
+    posiciones = {c: i for i, c in enumerate(df.columns, start=1)}
+
+    datos = df.astype(object)
+    if formulas:
+        for fila, col, valor in formulas_ans(datos, posiciones):
+            datos.at[fila, col] = valor
+        asegurar_hoja_festivos(wb)
+
+    for fila in datos.itertuples(index=False, name=None):
+        ws.append([None if v == "" else v for v in fila])
+    wb.save(ruta)
+
+
+def _medir(ruta):
+    t = time.perf_counter()
+    wb = load_workbook(ruta, read_only=True)
+    for _ in wb.active.iter_rows(values_only=True):
+        pass
+    wb.close()
+    t_openpyxl = time.perf_counter() - t
+
+    t = time.perf_counter()
+    pd.read_excel(ruta, dtype=str)
+    t_pandas = time.perf_counter() - t
+    return ruta.stat().st_size, t_openpyxl, t_pandas
+
+
+def main(n):
+    df = _datos(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        for nombre, formulas in (("estático", False), ("fórmulas", True)):
+            ruta = Path(tmp) / f"agpe_ans_{'formulas' if formulas else 'estatico'}.xlsx"
+            t = time.perf_counter()
+            _guardar(df, ruta, formulas)
+            t_guardar = time.perf_counter() - t
+            tam, t_openpyxl, t_pandas = _medir(ruta)
+            print(
+                f"{nombre:9} | {tam / 1_048_576:6.2f} MB | guardar {t_guardar:5.2f} s | "
+                f"abrir openpyxl {t_openpyxl:5.2f} s | pandas {t_pandas:5.2f} s"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,57 @@
+"""
+Micro-benchmark: normalizador compartido vs. la cadena anterior de str.replace.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_normalizador_texto [n_valores]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from src.transform.normalizador_texto import normalizar_texto
+
+
+def _cadena_anterior(serie):
+    # Equivalente a _norm_headers de append_agpe_ans antes del normalizador compartido
+    return (
+        serie.astype(str)
+        .str.strip()
+        .str.upper()
+        .str.replace(" ", "_", regex=False)
+        .str.replace("Á", "A")
+        .str.replace("É", "E")
+        .str.replace("Í", "I")
+        .str.replace("Ó", "O")
+        .str.replace("Ú", "U")
+    )
+
+
+def _columna_sintetica(n, n_unicos=20_000, semilla=7):
+    rng = np.random.default_rng(semilla)
+    base = [
+        "José Muñoz", "MarÃ­a Peña", "  Medellín ", "CALLE 10 # 43-12", "Envigado",
+        "Güepsa", "Nariño", "Itagüí", "El Peñol", "DirecciÃ³n rural",
+    ]
+    unicos = np.array([f"{base[i % len(base)]} {i}" for i in range(n_unicos)], dtype=object)
+    return pd.Series(unicos[rng.integers(0, n_unicos, n)], dtype=object)
+
+
+def main(n=1_000_000):
+    serie = _columna_sintetica(n)
+
+    t0 = time.perf_counter()
+    _cadena_anterior(serie)
+    t_anterior = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    normalizar_texto(serie, mayusculas=True, reparar=True, sin_tildes=True, espacios_a="_")
+    t_nuevo = time.perf_counter() - t0
+
+    print(f"Valores: {n:,} ({serie.nunique():,} únicos)")
+    print(f"Cadena str.replace anterior: {t_anterior:.3f} s")
+    print(f"normalizar_texto:            {t_nuevo:.3f} s  (x{t_anterior / t_nuevo:.1f})")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,86 @@
+"""
+Benchmark de agregar pocas filas a un AGPE_ANS grande: openpyxl (cargar todo
+el libro + guardar) vs. parche XML de la hoja (parche_xlsx.parchear_hoja).
+Verifica además que ambos dejen los mismos valores.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_parche_xlsx [n_filas] [n_nuevas]
+"""
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from openpyxl.worksheet.table import Table, TableStyleInfo
+
+from src.export.append_agpe_ans import COLUMNAS_MIN_CONTROLADAS
+from src.export.parche_xlsx import parchear_hoja
+
+
+def _libro(ruta, n):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "AGPE_ANS"
+    ws.append(COLUMNAS_MIN_CONTROLADAS)
+    base = datetime(2026, 1, 1, 8, 0, 0)
+    for i in range(n):
+        fila = [f"TEXTO {i % 97}" for _ in COLUMNAS_MIN_CONTROLADAS]
+        fila[0] = str(20_000_000 + i)
+        fila[COLUMNAS_MIN_CONTROLADAS.index("FECHA_LIMITE_ANS")] = base + timedelta(minutes=i)
+        fila[COLUMNAS_MIN_CONTROLADAS.index("DIAS_RESTANTES")] = i % 30
+        ws.append(fila)
+    tabla = Table(displayName="tbl_AGPE_ANS", ref=f"A1:{ws.cell(1, ws.max_column).column_letter}{n + 1}")
+    tabla.tableStyleInfo = TableStyleInfo(name="TableStyleMedium9", showRowStripes=True)
+    ws.add_table(tabla)
+    wb.save(ruta)
+
+
+def _nuevas(n, m):
+    base = datetime(2026, 6, 1, 9, 30, 0)
+    cambios = {}
+    for j in range(m):
+        fila = {c: f"NUEVO {j}" for c in range(1, len(COLUMNAS_MIN_CONTROLADAS) + 1)}
+        fila[COLUMNAS_MIN_CONTROLADAS.index("FECHA_LIMITE_ANS") + 1] = base + timedelta(hours=j)
+        fila[COLUMNAS_MIN_CONTROLADAS.index("DIAS_RESTANTES") + 1] = j
+        cambios[n + 2 + j] = fila
+    return cambios
+
+
+def _con_openpyxl(ruta, cambios):
+    wb = load_workbook(ruta)
+    ws = wb.active
+    for fila, celdas in cambios.items():
+        for col, v in celdas.items():
+            ws.cell(row=fila, column=col).value = v
+    ws.tables["tbl_AGPE_ANS"].ref = f"A1:{ws.cell(1, ws.max_column).column_letter}{ws.max_row}"
+    wb.save(ruta)
+
+
+def main(n, m):
+    cambios = _nuevas(n, m)
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp) / "base.xlsx"
+        _libro(base, n)
+        print(f"Libro: {n:,} filas ({base.stat().st_size / 1_048_576:.1f} MB), agregando {m} filas")
+
+        rutas = {}
+        for nombre, funcion in (("openpyxl", _con_openpyxl), ("parche XML", parchear_hoja)):
+            ruta = Path(tmp) / f"{nombre.replace(' ', '_')}.xlsx"
+            shutil.copy(base, ruta)
+            t = time.perf_counter()
+            funcion(ruta, cambios)
+            print(f"{nombre:10}: {time.perf_counter() - t:6.2f} s")
+            rutas[nombre] = ruta
+
+        a, b = (pd.read_excel(r, dtype=str).tail(m + 5) for r in rutas.values())
+        print("Resultado idéntico" if a.equals(b) else "⚠️ Los resultados difieren")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+    )
@@ -0,0 +1,72 @@
+"""
+Benchmark del formato de AGPE_CLEAN: openpyxl (cargar el libro, formatear,
+autoajustar anchos celda a celda y guardar) vs. plantilla en caché + volcado
+por streaming desde el staging. Mide varios tamaños para ver el crecimiento
+y verifica que ambos caminos dejen los mismos datos.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_preparar_clean [n_filas ...]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+import pandas as pd
+from openpyxl import load_workbook
+
+from src.extract.consolidar_c09_c07 import COLUMNAS_MERGE
+from src.export.preparar_agpe_clean_excel import (
+    _autoajustar_anchos,
+    _formatear_hoja,
+    _generar_desde_staging,
+)
+from src.export.staging_agpe_clean import escribir_staging
+
+
+def _df(n):
+    datos = {c: [f"{c.upper()} {i % 113}" for i in range(n)] for c in COLUMNAS_MERGE}
+    datos[COLUMNAS_MERGE[0]] = [str(20_000_000 + i) for i in range(n)]
+    for c in ("Detalle Visita", "Tipo Medidor"):
+        if c in datos:
+            datos[c] = [None] * n
+    return pd.DataFrame(datos)
+
+
+def _con_openpyxl(ruta):
+    wb = load_workbook(ruta)
+    ws = wb.active
+    _formatear_hoja(wb, ws)
+    _autoajustar_anchos(ws)
+    wb.save(ruta)
+    wb.close()
+
+
+def main(tamanos):
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in tamanos:
+            df = _df(n)
+            tiempos = {}
+            for nombre in ("openpyxl", "plantilla"):
+                carpeta = Path(tmp) / nombre
+                carpeta.mkdir(exist_ok=True)
+                ruta = carpeta / "AGPE_CLEAN.xlsx"
+                df.to_excel(ruta, index=False)
+                escribir_staging(df, ruta)
+
+                t = time.perf_counter()
+                if nombre == "openpyxl":
+                    _con_openpyxl(ruta)
+                else:
+                    _generar_desde_staging(ruta)  # la plantilla queda en caché desde el primer tamaño
+                tiempos[nombre] = time.perf_counter() - t
+
+            a, b = (pd.read_excel(Path(tmp) / nombre / "AGPE_CLEAN.xlsx", dtype=str) for nombre in tiempos)
+            igual = "idéntico" if a.equals(b) else "⚠️ difiere"
+            print(
+                f"{n:>8,} filas | openpyxl: {tiempos['openpyxl']:7.2f} s | "
+                f"plantilla: {tiempos['plantilla']:6.2f} s | resultado {igual}"
+            )
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [5_000, 20_000, 50_000])
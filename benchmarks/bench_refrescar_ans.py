@@ -0,0 +1,71 @@
+"""
+Benchmark del refresco de ANS: recálculo fila por fila (fórmula del PASO 9.1)
+vs. recalcular_ans vectorizado. Verifica además que ambos den el mismo resultado.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_refrescar_ans [n_filas]
+"""
+import sys
+import time
+from datetime import date
+import numpy as np
+import pandas as pd
+
+from src.export.refrescar_ans import recalcular_ans
+from src.transform.reglas_ans import estado_por_dias
+
+
+def _datos(n, seed=7):
+    rng = np.random.default_rng(seed)
+    limite = pd.Timestamp("2026-01-01") + pd.to_timedelta(rng.integers(0, 120, n), unit="D")
+    limite = limite.strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object)
+    limite[rng.random(n) < 0.1] = None
+
+    cierre = np.where(rng.random(n) < 0.3, "2026-02-01 00:00:00", None)
+    return pd.DataFrame(
+        {
+            "FECHA_CIERRE_FENIX": cierre,
+            "FECHA_LIMITE_ANS": limite,
+            "DIAS_RESTANTES": rng.integers(-30, 30, n),
+            "ESTADO_ANS": rng.choice(["VENCIDO", "ALERTA", "A TIEMPO", ""], n),
+        },
+        index=pd.RangeIndex(2, n + 2, name="fila"),
+        dtype=object,
+    )
+
+
+def _por_filas(df, hoy):
+    cambios = []
+    for fila, cierre, limite, dias_act, estado_act in df.itertuples(name=None):
+        if cierre or not limite:
+            continue
+        dias = (pd.to_datetime(limite).date() - hoy).days
+        estado = estado_por_dias(dias)
+        if dias_act != dias:
+            cambios.append((fila, "DIAS_RESTANTES", dias))
+        if estado_act != estado:
+            cambios.append((fila, "ESTADO_ANS", estado))
+    return cambios
+
+
+def main(n):
+    df = _datos(n)
+    hoy = date(2026, 2, 15)
+
+    t = time.perf_counter()
+    esperado = _por_filas(df, hoy)
+    t_filas = time.perf_counter() - t
+
+    t = time.perf_counter()
+    cambios, abiertas = recalcular_ans(df, hoy)
+    t_vec = time.perf_counter() - t
+
+    assert sorted(esperado) == sorted(cambios), "❌ Los resultados no coinciden"
+
+    print(f"Filas: {n} | abiertas evaluadas: {abiertas} | celdas que cambian: {len(cambios)}")
+    print(f"Fila por fila: {t_filas:.2f} s ({n / t_filas:,.0f} filas/s)")
+    print(f"Vectorizado:   {t_vec:.2f} s ({n / t_vec:,.0f} filas/s)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,54 @@
+"""
+Benchmark de vaciar una hoja dejando los encabezados: openpyxl (cargar +
+delete_rows + guardar) vs. truncado del XML de la hoja
+(parche_xlsx.truncar_a_encabezados). Verifica que ambos dejen los mismos
+encabezados.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_truncar_xlsx [n_filas ...]
+"""
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+import pandas as pd
+from openpyxl import load_workbook
+
+from benchmarks.bench_parche_xlsx import _libro
+from src.export.parche_xlsx import truncar_a_encabezados
+
+
+def _con_openpyxl(ruta):
+    wb = load_workbook(ruta)
+    ws = wb.active
+    if ws.max_row > 1:
+        ws.delete_rows(2, ws.max_row - 1)
+    wb.save(ruta)
+
+
+def main(tamanos):
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in tamanos:
+            base = Path(tmp) / f"base_{n}.xlsx"
+            _libro(base, n)
+
+            tiempos, rutas = {}, {}
+            for nombre, funcion in (("openpyxl", _con_openpyxl), ("XML", truncar_a_encabezados)):
+                ruta = Path(tmp) / f"{nombre}_{n}.xlsx"
+                shutil.copy(base, ruta)
+                t = time.perf_counter()
+                funcion(ruta)
+                tiempos[nombre] = time.perf_counter() - t
+                rutas[nombre] = ruta
+
+            a, b = (pd.read_excel(r, dtype=str) for r in rutas.values())
+            igual = "idéntico" if a.equals(b) and a.empty else "⚠️ difiere"
+            print(
+                f"{n:>8,} filas ({base.stat().st_size / 1_048_576:5.1f} MB) | "
+                f"openpyxl: {tiempos['openpyxl']:7.2f} s | XML: {tiempos['XML']:5.2f} s | resultado {igual}"
+            )
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 50_000])
@@ -0,0 +1,121 @@
+"""
+Benchmark del modo actualizar del append (_refrescar_existentes): una foto
+de N pedidos que ya están en el almacén, con k pedidos cambiados. Sin
+huellas guardadas (primera corrida) se comparan todas las filas; con
+huellas, el costo sigue a k. Verifica que solo cambien las celdas tocadas
+y que las filas nuevas sean las mismas que agregaría el modo normal (menos
+los pedidos con fila abierta).
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_upsert_ans [n_filas]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from src.export.almacen_ans import AlmacenANS
+from src.export.append_agpe_ans import COLUMNAS_MIN_CONTROLADAS, SALIDAS_ANS, _refrescar_existentes
+
+
+def _almacen(carpeta, n, seed=7):
+    rng = np.random.default_rng(seed)
+    wb = Workbook()
+    ws = wb.active
+    ws.append(COLUMNAS_MIN_CONTROLADAS)
+    for i in range(n):
+        fila = {c: "" for c in COLUMNAS_MIN_CONTROLADAS}
+        fila.update(
+            PEDIDO=str(20_000_000 + i),
+            DIRECCION=f"CL {i % 97} # {i % 13}-{i % 7}",
+            MUNICIPIO="MEDELLIN",
+            DETALLE_VISITA="DIRECTA",
+            TIPO_VISITA="C09",
+            COORDENADAX=f"-75.{rng.integers(10**7, 10**8)}",
+            COORDENADAY=f"6.{rng.integers(10**7, 10**8)}",
+            FECHA_CAMBIO_ESTADO="2026-01-21 08:55:56",
+        )
+        ws.append([fila[c] or None for c in COLUMNAS_MIN_CONTROLADAS])
+
+    almacen = AlmacenANS(Path(carpeta) / "AGPE_ANS.xlsm", Path(carpeta) / "AGPE_ANS.sqlite")
+    almacen.importar_desde_hoja(ws)
+    return almacen
+
+
+def _foto(almacen, k):
+    df = almacen.consultar(COLUMNAS_MIN_CONTROLADAS).reset_index(drop=True)
+    df = df.astype(object).where(df.notna(), "").map(str)
+    df[SALIDAS_ANS] = ""
+    df.loc[: k - 1, "DIRECCION"] = "CL NUEVA 1"
+    return df
+
+
+def _verificar_modos(carpeta, n):
+    """
+    Mismo lote en los dos modos. El normal agrega todo el lote; el actualizar
+    debe dejar como nuevas exactamente esas filas menos las de pedidos con fila
+    abierta: pedidos cerrados con la misma huella y filas repetidas de pedidos
+    nuevos no se pierden.
+    """
+    almacen = _almacen(carpeta, n, seed=11)
+    try:
+        foto = _foto(almacen, 0)
+        _, _, huellas = _refrescar_existentes(almacen, foto)
+        almacen.guardar_huellas(huellas)
+
+        filas = almacen.consultar(["PEDIDO"]).index[::10]
+        almacen.actualizar_celdas([(int(f), "FECHA_CIERRE_FENIX", "2025-12-01") for f in filas])
+        cerrados = foto["PEDIDO"].iloc[::10]
+
+        nuevos = foto.iloc[:5].assign(PEDIDO=[str(90_000_000 + i) for i in range(5)])
+        lote = pd.concat([foto, foto.iloc[::10], nuevos, nuevos], ignore_index=True)
+
+        filas_nuevas, cambios, _ = _refrescar_existentes(almacen, lote)
+        modo_normal = lote[~lote["PEDIDO"].isin(set(foto["PEDIDO"]) - set(cerrados))]
+
+        assert filas_nuevas.equals(modo_normal), "❌ El modo actualizar perdió o cambió filas nuevas"
+        assert not cambios, "❌ Celdas cambiadas inesperadas"
+        print(f"{n:>8,} pedidos | mismas {len(filas_nuevas):,} filas nuevas en los dos modos")
+    finally:
+        almacen.cerrar()
+
+
+def main(n):
+    with tempfile.TemporaryDirectory() as tmp:
+        almacen = _almacen(tmp, n)
+        try:
+            for k in (0, 10, 1_000, n):
+                if k > n:
+                    continue
+                foto = _foto(almacen, k)
+                almacen.con.execute("DELETE FROM huellas_pedido")
+
+                t = time.perf_counter()
+                _, cambios, huellas = _refrescar_existentes(almacen, foto)
+                t_sin = time.perf_counter() - t
+                almacen.guardar_huellas(huellas)
+
+                # Misma foto ya aplicada salvo k pedidos: solo se comparan esos
+                foto = _foto(almacen, k)
+                foto.loc[: k - 1, "DIRECCION"] = "CL NUEVA 2"
+                t = time.perf_counter()
+                _, cambios_k, _ = _refrescar_existentes(almacen, foto)
+                t_con = time.perf_counter() - t
+
+                assert len(cambios) == k and len(cambios_k) == k, "❌ Celdas cambiadas inesperadas"
+                print(
+                    f"{n:>8,} pedidos | {k:>7,} cambiados | sin huellas: {t_sin:6.2f} s | "
+                    f"con huellas: {t_con:6.2f} s | celdas: {len(cambios_k):,}"
+                )
+        finally:
+            almacen.cerrar()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _verificar_modos(tmp, min(n, 10_000))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
@@ -1,3 +1,5 @@
+from multiprocessing import freeze_support
+
 from src.ui.panel_agpe import iniciar_panel
 
 def main():
@@ -5,4 +7,6 @@ def main():
     iniciar_panel()
 
 if __name__ == "__main__":
+    # Necesario para el modo paralelo de consolidación en el .exe (PyInstaller)
+    freeze_support()
     main()
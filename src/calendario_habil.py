@@ -0,0 +1,170 @@
+# src/calendario_habil.py
+from datetime import date
+from functools import lru_cache
+import threading
+import numpy as np
+import pandas as pd
+import holidays
+
+
+# ============================================================
+# CALENDARIO DE DÍAS HÁBILES (COLOMBIA)
+# ------------------------------------------------------------
+# Hábil = lunes a viernes que no es festivo en Colombia (holidays.Colombia,
+# incluye los trasladados por Ley Emiliani). Lo usan el cálculo de ANS y el
+# calendario de la UI, así los límites y los festivos pintados coinciden.
+# ============================================================
+
+# Años precomputados alrededor del año actual (se amplía solo si hace falta)
+_MARGEN_ANIOS = 10
+
+
+@lru_cache(maxsize=None)
+def festivos_colombia(anio_desde: int, anio_hasta: int | None = None) -> frozenset:
+    """
+    Festivos de Colombia (date) entre anio_desde y anio_hasta, ambos incluidos.
+    """
+    anio_hasta = anio_hasta or anio_desde
+    return frozenset(holidays.country_holidays("CO", years=range(anio_desde, anio_hasta + 1)))
+
+
+class CalendarioHabil:
+    """
+    Días hábiles precomputados para [anio_desde, anio_hasta]:
+    - ordinal[i]: cuántos días hábiles hay ANTES del día i del rango.
+    - habiles: los días hábiles en orden (datetime64[D]).
+    Con eso "fecha + N hábiles" y "hábiles entre dos fechas" son búsquedas O(1).
+    """
+
+    def __init__(self, anio_desde: int, anio_hasta: int):
+        self.anio_desde = anio_desde
+        self.anio_hasta = anio_hasta
+        self.inicio = np.datetime64(f"{anio_desde}-01-01", "D")
+        self.fin = np.datetime64(f"{anio_hasta + 1}-01-01", "D")
+
+        self.festivos = festivos_colombia(anio_desde, anio_hasta)
+        dias = np.arange(self.inicio, self.fin, dtype="datetime64[D]")
+        es_habil = np.is_busday(dias, holidays=np.array(sorted(self.festivos), dtype="datetime64[D]"))
+
+        self.ordinal = np.concatenate([[0], np.cumsum(es_habil)])
+        self.habiles = dias[es_habil]
+
+    def cubre(self, desde, hasta) -> bool:
+        return self.inicio <= desde and hasta < self.fin
+
+    def _posicion(self, dias):
+        return (dias - self.inicio).astype(np.int64)
+
+    def sumar(self, dias, n):
+        """
+        dias (datetime64[D]) + n días hábiles. Si el día no es hábil, se cuenta
+        desde el hábil anterior (igual que pandas CustomBusinessDay).
+        """
+        # ordinal[pos + 1] - 1 = número del día hábil en (o justo antes de) cada día
+        return self.habiles[self.ordinal[self._posicion(dias) + 1] - 1 + n]
+
+    def contar(self, desde, hasta):
+        """
+        Días hábiles en [desde, hasta) (igual que numpy.busday_count).
+        """
+        return self.ordinal[self._posicion(hasta)] - self.ordinal[self._posicion(desde)]
+
+
+_CALENDARIO = None
+_CANDADO = threading.Lock()
+
+
+def obtener_calendario(desde=None, hasta=None) -> CalendarioHabil:
+    """
+    Calendario compartido; se reconstruye (más amplio) si las fechas pedidas
+    quedan fuera del rango precomputado.
+    """
+    global _CALENDARIO
+    hoy = date.today().year
+    desde = np.datetime64(desde or f"{hoy}-01-01", "D")
+    hasta = np.datetime64(hasta or desde, "D")
+
+    with _CANDADO:
+        # El margen cubre "fecha + N hábiles" cerca del fin del rango
+        if _CALENDARIO is None or not _CALENDARIO.cubre(desde, hasta + 366):
+            anio_desde = min(desde.astype(object).year, hoy - _MARGEN_ANIOS)
+            anio_hasta = max(hasta.astype(object).year + 1, hoy + _MARGEN_ANIOS)
+            if _CALENDARIO is not None:
+                anio_desde = min(anio_desde, _CALENDARIO.anio_desde)
+                anio_hasta = max(anio_hasta, _CALENDARIO.anio_hasta)
+            _CALENDARIO = CalendarioHabil(anio_desde, anio_hasta)
+        return _CALENDARIO
+
+
+# ============================================================
+# API (escalar o vectorizada)
+# ============================================================
+
+def es_festivo(d) -> bool:
+    d = pd.Timestamp(d).date()
+    return d in festivos_colombia(d.year)
+
+
+def _como_fechas(valores):
+    """
+    Escalar o array-like -> (DatetimeIndex, es_escalar, índice de Series o None).
+    """
+    indice = valores.index if isinstance(valores, pd.Series) else None
+    es_escalar = np.ndim(valores) == 0
+    if es_escalar:
+        valores = [valores]
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(valores)
+    fechas = pd.DatetimeIndex(pd.to_datetime(serie, errors="coerce"))
+    return fechas, es_escalar, indice
+
+
+def _salida(valores, es_escalar, indice):
+    if es_escalar:
+        return valores[0]
+    if indice is not None:
+        return pd.Series(valores, index=indice)
+    return valores
+
+
+def sumar_dias_habiles(fechas, n):
+    """
+    fechas + n días hábiles (conserva la hora). Escalar -> Timestamp;
+    Series -> Series; array -> DatetimeIndex. `n` puede ser escalar o array.
+    NaT o n nulo -> NaT.
+    """
+    fechas, es_escalar, indice = _como_fechas(fechas)
+    n = np.broadcast_to(np.asarray(n, dtype=float), fechas.shape)
+
+    validas = fechas.notna() & ~np.isnan(n)
+    resultado = np.full(fechas.shape, np.datetime64("NaT"), dtype="datetime64[ns]")
+
+    if validas.any():
+        dias = fechas[validas].values.astype("datetime64[D]")
+        cal = obtener_calendario(dias.min(), dias.max())
+        destino = cal.sumar(dias, n[validas].astype(np.int64))
+        hora = fechas[validas].values - dias.astype("datetime64[ns]")
+        resultado[validas] = destino.astype("datetime64[ns]") + hora
+
+    return _salida(pd.DatetimeIndex(resultado), es_escalar, indice)
+
+
+def dias_habiles_entre(desde, hasta):
+    """
+    Días hábiles en [desde, hasta) (por fecha, sin hora). Escalar -> int;
+    Series -> Series; array -> ndarray (NaN donde falte alguna fecha).
+    """
+    desde, es_escalar, indice = _como_fechas(desde)
+    hasta, _, _ = _como_fechas(hasta)
+
+    validas = desde.notna() & hasta.notna()
+    resultado = np.full(desde.shape, np.nan)
+
+    if validas.any():
+        d = desde[validas].values.astype("datetime64[D]")
+        h = hasta[validas].values.astype("datetime64[D]")
+        cal = obtener_calendario(min(d.min(), h.min()), max(d.max(), h.max()))
+        resultado[validas] = cal.contar(d, h)
+
+    if es_escalar:
+        return int(resultado[0]) if validas[0] else None
+    return _salida(resultado, es_escalar, indice)
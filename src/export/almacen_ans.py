@@ -0,0 +1,799 @@
+from pathlib import Path
+from datetime import date, datetime, time
+import json
+import re
+import sqlite3
+import pandas as pd
+from openpyxl import load_workbook
+
+from src.export.columnas_hoja import ColumnasHoja
+from src.export.servicio_bdpcp import COLUMNAS_BDPCP
+from src.huella_archivo import huella_archivo, huella_vigente
+
+
+# ============================================================
+# ALMACÉN SQLITE DE AGPE_ANS
+# ------------------------------------------------------------
+# AGPE_ANS.sqlite es el sistema de registro: el append inserta ahí (en una
+# transacción) y las lecturas son consultas con índice.
+# AGPE_ANS.xlsm queda como vista exportada para quienes trabajan en Excel:
+# se parchea solo con lo pendiente y, si alguien lo editó (OBSERVACION,
+# REVISOR...), se re-importa antes de volver a escribir.
+# ============================================================
+
+# Columnas con índice (además de PEDIDO)
+COLUMNAS_INDEXADAS = ["ESTADO_ANS", "FECHA_LIMITE_ANS", "SUBZONA", "TIPO_VISITA"]
+
+# Columnas que se completan desde BDPCP: los pedidos con alguna vacía van a `huecos`
+COLUMNAS_ENRIQUECIDAS = COLUMNAS_BDPCP
+
+# Límite de parámetros por consulta IN (...) de SQLite
+_LOTE_SQL = 900
+
+# Fechas/horas se guardan como texto ISO (ordenable) y vuelven a Excel como fecha/hora
+_PATRON_FECHA = re.compile(r"^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2})?$")
+_PATRON_HORA = re.compile(r"^\d{2}:\d{2}:\d{2}$")
+
+
+def ruta_almacen_default(ruta_ans: Path) -> Path:
+    return Path(ruta_ans).with_suffix(".sqlite")
+
+
+def _texto(v):
+    if v is None:
+        return ""
+    return str(v).strip()
+
+
+def _clave(v):
+    return _texto(v).upper()
+
+
+def _col(nombre):
+    """
+    Identificador SQL entre comillas (los encabezados son nombres de columna).
+    """
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+
+def _a_sql(v):
+    """
+    Valor de celda -> valor SQLite (vacíos -> NULL, fechas/horas -> texto ISO).
+    """
+    if v is None:
+        return None
+    if isinstance(v, str):
+        return v if v.strip() != "" else None
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(v, date):
+        return v.strftime("%Y-%m-%d")
+    if isinstance(v, time):
+        return v.strftime("%H:%M:%S")
+    if hasattr(v, "item"):
+        v = v.item()  # escalares numpy
+    if isinstance(v, float) and v != v:
+        return None
+    if isinstance(v, (int, float)):
+        return v
+    return str(v)
+
+
+def _a_excel(columna, v):
+    """
+    Valor SQLite -> celda (FECHA_* / HORA_* en ISO vuelven a ser fecha/hora).
+    """
+    if isinstance(v, str):
+        if columna.startswith("FECHA") and _PATRON_FECHA.match(v):
+            return datetime.fromisoformat(v)
+        if columna.startswith("HORA") and _PATRON_HORA.match(v):
+            return time.fromisoformat(v)
+    return v
+
+
+class AlmacenANS:
+    """
+    Sistema de registro de AGPE_ANS en SQLite.
+
+    - registros: una fila por fila de la hoja (la clave es `fila`: un PEDIDO puede
+      tener varias filas, una por visita), con todas las columnas de AGPE_ANS.
+    - pendiente = 1: fila insertada que aún no se escribió en el .xlsm.
+    - celdas_pendientes: celdas de filas existentes modificadas en el almacén.
+    - meta: encabezados de la hoja y huella del .xlsm con el que está sincronizado.
+    - huecos: pedidos con alguna COLUMNAS_ENRIQUECIDAS vacía y la versión de BDPCP
+      contra la que se revisaron por última vez (0 = nunca).
+    - archivados: pedidos con filas movidas al archivo (un Parquet por mes de
+      cierre, ver archivo_ans); cuentan en contiene / total_pedidos.
+    - diario_lotes: lotes del append ya insertados cuyas fuentes aún no se
+      limpiaron, con la huella de cada fuente al leerla (se registran en la
+      misma transacción que sus filas).
+    - huellas_pedido: huella del último contenido de fuente aplicado a cada
+      pedido (modo actualizar del append: si no cambió, no se compara nada).
+    """
+
+    def __init__(self, ruta_ans: Path, ruta_db: Path | None = None):
+        self.ruta_ans = Path(ruta_ans)
+        self.ruta_db = Path(ruta_db) if ruta_db else ruta_almacen_default(self.ruta_ans)
+        self.ruta_db.parent.mkdir(parents=True, exist_ok=True)
+
+        self.con = sqlite3.connect(self.ruta_db)
+        self.con.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT);
+            CREATE TABLE IF NOT EXISTS celdas_pendientes (
+                fila INTEGER NOT NULL,
+                columna TEXT NOT NULL,
+                PRIMARY KEY (fila, columna)
+            );
+            CREATE TABLE IF NOT EXISTS huecos (
+                clave_pedido TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS archivados (
+                clave_pedido TEXT NOT NULL,
+                mes TEXT NOT NULL,
+                PRIMARY KEY (clave_pedido, mes)
+            );
+            CREATE TABLE IF NOT EXISTS diario_lotes (
+                lote INTEGER PRIMARY KEY,
+                fuentes TEXT NOT NULL,
+                filas INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS huellas_pedido (
+                clave_pedido TEXT PRIMARY KEY,
+                huella TEXT NOT NULL
+            );
+        """)
+        self.encabezados = self._leer_meta("encabezados") or []
+
+        # Almacenes creados antes de la tabla huecos: se arma una vez
+        if self.encabezados and self._leer_meta("huecos") is None:
+            with self.con:
+                self._reconstruir_huecos()
+
+    # -------------------------
+    # Meta / huella
+    # -------------------------
+    def _leer_meta(self, clave):
+        r = self.con.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return json.loads(r[0]) if r else None
+
+    def _guardar_meta(self, clave, valor):
+        self.con.execute(
+            "INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)", (clave, json.dumps(valor))
+        )
+
+    def vigente(self) -> bool:
+        return bool(self.encabezados) and huella_vigente(self.ruta_ans, self._leer_meta("huella"))
+
+    def registrar_huella(self):
+        """
+        Llamar después de guardar el libro con la herramienta.
+        """
+        with self.con:
+            self._guardar_meta("huella", huella_archivo(self.ruta_ans))
+
+    def requiere_regenerar(self) -> bool:
+        """
+        True si las filas del almacén se renumeraron (p. ej. al archivar) y el
+        .xlsm se debe reescribir completo en la próxima exportación.
+        """
+        return bool(self._leer_meta("regenerar"))
+
+    def corrida_archivo(self) -> str:
+        """
+        Sello de la corrida de archivo en curso (identidad de las filas en el
+        Parquet junto con su fila). Se reusa hasta que archivar_filas termina:
+        si se cortó tras escribir el Parquet, la siguiente reconoce lo ya escrito.
+        """
+        corrida = self._leer_meta("archivo_en_curso")
+        if corrida is None:
+            corrida = datetime.now().isoformat(timespec="microseconds")
+            with self.con:
+                self._guardar_meta("archivo_en_curso", corrida)
+        return corrida
+
+    # -------------------------
+    # Importación desde el .xlsm
+    # -------------------------
+    def _crear_tabla(self, encabezados):
+        columnas = ", ".join(_col(c) for c in encabezados)
+        self.con.execute("DROP TABLE IF EXISTS registros")
+        self.con.execute(f"""
+            CREATE TABLE registros (
+                fila INTEGER PRIMARY KEY,
+                clave_pedido TEXT NOT NULL,
+                pendiente INTEGER NOT NULL DEFAULT 0,
+                {columnas}
+            )
+        """)
+        self.con.execute("CREATE INDEX ix_registros_pedido ON registros (clave_pedido)")
+        for c in COLUMNAS_INDEXADAS:
+            if c in encabezados:
+                self.con.execute(f"CREATE INDEX ix_registros_{c.lower()} ON registros ({_col(c)})")
+
+    def importar_desde_hoja(self, ws):
+        """
+        Reemplaza el almacén con el contenido de la hoja (un solo recorrido; sirve
+        un ws normal o read_only). Las filas pendientes de exportar se conservan y
+        se reubican al final; las celdas pendientes se descartan (manda el Excel)
+        junto con la huella de sus pedidos en huellas_pedido.
+        """
+        encabezados = [_texto(c).upper() for c in next(ws.iter_rows(min_row=1, max_row=1, values_only=True))]
+        if "PEDIDO" not in encabezados:
+            raise ValueError("❌ AGPE_ANS no tiene columna PEDIDO en encabezados.")
+
+        posiciones = [(i, h) for i, h in enumerate(encabezados) if h != ""]
+        columnas = [h for _, h in posiciones]
+        idx_pedido = encabezados.index("PEDIDO")
+
+        pendientes = self.pendientes() if self.encabezados else pd.DataFrame()
+        descartadas = self._total_celdas_pendientes()
+
+        def _filas():
+            for fila, valores in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+                datos = [_a_sql(valores[i]) if i < len(valores) else None for i, _ in posiciones]
+                if all(v is None for v in datos):
+                    continue
+                pedido = _clave(valores[idx_pedido]) if idx_pedido < len(valores) else ""
+                yield (fila, pedido, 0, *datos)
+
+        marcadores = ", ".join("?" * (3 + len(columnas)))
+        with self.con:
+            self.con.execute("BEGIN")  # el DROP/CREATE también entra en la transacción
+            if descartadas:
+                # Sin sus celdas pendientes, la huella de esos pedidos ya no describe
+                # el almacén: el próximo modo actualizar los vuelve a comparar
+                self.con.execute(
+                    "DELETE FROM huellas_pedido WHERE clave_pedido IN (SELECT DISTINCT r.clave_pedido "
+                    "FROM celdas_pendientes c JOIN registros r ON r.fila = c.fila)"
+                )
+            self._crear_tabla(columnas)
+            self.con.execute("DELETE FROM celdas_pendientes")
+            self.con.executemany(f"INSERT INTO registros VALUES ({marcadores})", _filas())
+            self._guardar_meta("encabezados", columnas)
+            self._guardar_meta("regenerar", False)
+            self._guardar_meta("archivo_en_curso", None)  # las filas ya no son las mismas
+            self.encabezados = columnas
+            self._reconstruir_huecos()
+
+        if descartadas:
+            print(f"⚠️ AGPE_ANS cambió en Excel: {descartadas} celdas pendientes se descartan")
+        if not pendientes.empty:
+            self.insertar(pendientes.reindex(columns=columnas))
+            print(f"🗂️ {len(pendientes)} filas pendientes reubicadas al final")
+
+        print(f"🗂️ Almacén AGPE_ANS importado desde Excel: {self.total_filas()} filas")
+
+    def sincronizar(self, ws=None) -> bool:
+        """
+        Deja el almacén al día con el .xlsm. Si el libro no cambió, no se abre.
+        Si cambió fuera de la herramienta, se re-importa desde `ws` (si ya está
+        cargado) o leyendo el libro en modo read_only. Devuelve True si re-importó.
+        """
+        # Exportación cortada justo después de reemplazar el .xlsm: ya está escrita
+        if huella_vigente(self.ruta_ans, self._leer_meta("huella_exportando")):
+            self.confirmar_exportacion()
+
+        if self.vigente():
+            return False
+
+        if ws is not None:
+            self.importar_desde_hoja(ws)
+        else:
+            wb = load_workbook(self.ruta_ans, read_only=True, keep_vba=True)
+            try:
+                self.importar_desde_hoja(wb.active)
+            finally:
+                wb.close()
+        self.registrar_huella()
+        return True
+
+    # -------------------------
+    # Consultas
+    # -------------------------
+    def total_filas(self) -> int:
+        return self.con.execute("SELECT COUNT(*) FROM registros").fetchone()[0]
+
+    def total_pedidos(self) -> int:
+        """
+        Pedidos distintos entre las filas activas y el archivo.
+        """
+        return self.con.execute(
+            "SELECT COUNT(*) FROM (SELECT clave_pedido FROM registros WHERE clave_pedido != '' "
+            "UNION SELECT clave_pedido FROM archivados)"
+        ).fetchone()[0]
+
+    def tiene_fila(self, fila) -> bool:
+        return self.con.execute("SELECT 1 FROM registros WHERE fila = ?", (fila,)).fetchone() is not None
+
+    def contiene(self, pedido) -> bool:
+        """
+        True si el pedido tiene filas activas o archivadas.
+        """
+        clave = _clave(pedido)
+        r = self.con.execute(
+            "SELECT 1 FROM registros WHERE clave_pedido = ? "
+            "UNION ALL SELECT 1 FROM archivados WHERE clave_pedido = ? LIMIT 1",
+            (clave, clave),
+        )
+        return r.fetchone() is not None
+
+    def meses_archivados(self, pedidos=None) -> dict:
+        """
+        PEDIDO -> [meses AAAA-MM] del archivo donde tiene filas (todos si pedidos=None).
+        """
+        if pedidos is None:
+            consulta = self.con.execute("SELECT clave_pedido, mes FROM archivados ORDER BY mes")
+        else:
+            claves = list({_clave(p) for p in pedidos if _clave(p)})
+            consulta = (
+                fila
+                for i in range(0, len(claves), _LOTE_SQL)
+                for fila in self.con.execute(
+                    "SELECT clave_pedido, mes FROM archivados "
+                    f"WHERE clave_pedido IN ({', '.join('?' * len(claves[i:i + _LOTE_SQL]))}) ORDER BY mes",
+                    claves[i:i + _LOTE_SQL],
+                )
+            )
+        resultado = {}
+        for pedido, mes in consulta:
+            resultado.setdefault(pedido, []).append(mes)
+        return resultado
+
+    def filas_de(self, pedidos) -> dict:
+        """
+        PEDIDO -> [filas] para un lote de pedidos (solo los que existen).
+        """
+        resultado = {}
+        for pedido, fila in self._por_pedido(pedidos, "fila"):
+            resultado.setdefault(pedido, []).append(fila)
+        return resultado
+
+    def _por_pedido(self, pedidos, columnas):
+        pedidos = list({_clave(p) for p in pedidos if _clave(p)})
+        for i in range(0, len(pedidos), _LOTE_SQL):
+            lote = pedidos[i:i + _LOTE_SQL]
+            marcadores = ", ".join("?" * len(lote))
+            yield from self.con.execute(
+                f"SELECT clave_pedido, {columnas} FROM registros "
+                f"WHERE clave_pedido IN ({marcadores}) ORDER BY fila",
+                lote,
+            )
+
+    def filas_abiertas(self, pedidos, columnas) -> pd.DataFrame:
+        """
+        Última fila abierta (sin FECHA_CIERRE_FENIX) de cada pedido, con
+        clave_pedido y `columnas` (índice = fila; columnas=[] solo dice cuáles la tienen).
+        """
+        columnas = [c for c in columnas if c in self.encabezados]
+        seleccion = ", ".join(["fila", "clave_pedido", *(_col(c) for c in columnas)])
+        abierta = '"FECHA_CIERRE_FENIX" IS NULL' if "FECHA_CIERRE_FENIX" in self.encabezados else "1"
+        claves = list({_clave(p) for p in pedidos if _clave(p)})
+
+        filas = []
+        for i in range(0, len(claves), _LOTE_SQL):
+            lote = claves[i:i + _LOTE_SQL]
+            filas += self.con.execute(
+                f"SELECT {seleccion} FROM registros "
+                f"WHERE fila IN (SELECT MAX(fila) FROM registros WHERE clave_pedido IN "
+                f"({', '.join('?' * len(lote))}) AND {abierta} GROUP BY clave_pedido)",
+                lote,
+            ).fetchall()
+        df = pd.DataFrame(filas, columns=["fila", "clave_pedido", *columnas], dtype=object)
+        return df.set_index("fila")
+
+    def huellas_de(self, pedidos) -> dict:
+        """
+        PEDIDO -> huella del último contenido de fuente aplicado (los que tengan).
+        """
+        claves = list({_clave(p) for p in pedidos if _clave(p)})
+        huellas = {}
+        for i in range(0, len(claves), _LOTE_SQL):
+            lote = claves[i:i + _LOTE_SQL]
+            huellas.update(self.con.execute(
+                f"SELECT clave_pedido, huella FROM huellas_pedido "
+                f"WHERE clave_pedido IN ({', '.join('?' * len(lote))})",
+                lote,
+            ))
+        return huellas
+
+    def guardar_huellas(self, huellas: dict):
+        with self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO huellas_pedido (clave_pedido, huella) VALUES (?, ?)",
+                [(_clave(p), h) for p, h in huellas.items() if _clave(p)],
+            )
+
+    def consultar(self, columnas=None, donde=None, pedidos=None, **filtros) -> pd.DataFrame:
+        """
+        Filas de AGPE_ANS como DataFrame (índice = fila de la hoja).
+        filtros: COLUMNA=valor o COLUMNA=[valores] (p. ej. ESTADO_ANS="VENCIDO").
+        pedidos: solo las filas de esos PEDIDO (comparados como clave).
+        donde: condición SQL adicional (uso interno, p. ej. '"FECHA_CIERRE_FENIX" IS NULL').
+        """
+        columnas = columnas or self.encabezados
+        condiciones, parametros = [], []
+        if donde:
+            condiciones.append(f"({donde})")
+        if pedidos is not None:
+            claves = list({_clave(p) for p in pedidos if _clave(p)})
+            condiciones.append(f"clave_pedido IN ({', '.join('?' * len(claves))})")
+            parametros.extend(claves)
+        for c, v in filtros.items():
+            if c not in self.encabezados:
+                raise ValueError(f"❌ AGPE_ANS no tiene la columna {c}")
+            if isinstance(v, (list, tuple, set)):
+                v = list(v)
+                condiciones.append(f"{_col(c)} IN ({', '.join('?' * len(v))})")
+                parametros.extend(v)
+            else:
+                condiciones.append(f"{_col(c)} = ?")
+                parametros.append(v)
+
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        cursor = self.con.execute(
+            f"SELECT fila, {', '.join(_col(c) for c in columnas)} FROM registros {where} ORDER BY fila",
+            parametros,
+        )
+        df = pd.DataFrame(cursor.fetchall(), columns=["fila", *columnas], dtype=object)
+        return df.set_index("fila")
+
+    def pendientes(self) -> pd.DataFrame:
+        cursor = self.con.execute(
+            f"SELECT {', '.join(_col(c) for c in self.encabezados)} FROM registros "
+            "WHERE pendiente = 1 ORDER BY fila"
+        )
+        return pd.DataFrame(cursor.fetchall(), columns=self.encabezados, dtype=object)
+
+    def _total_celdas_pendientes(self) -> int:
+        return self.con.execute("SELECT COUNT(*) FROM celdas_pendientes").fetchone()[0]
+
+    def hay_pendientes(self) -> bool:
+        r = self.con.execute("SELECT 1 FROM registros WHERE pendiente = 1 LIMIT 1").fetchone()
+        return r is not None or self._total_celdas_pendientes() > 0
+
+    # -------------------------
+    # Escritura (transaccional)
+    # -------------------------
+    def _siguiente_fila(self) -> int:
+        r = self.con.execute("SELECT MAX(fila) FROM registros").fetchone()[0]
+        return max(r or 1, 1) + 1
+
+    def insertar(self, df: pd.DataFrame, fuentes=None):
+        """
+        Inserta las filas de `df` (columnas = encabezados de AGPE_ANS) al final,
+        en UNA transacción. Quedan pendientes de exportar. Devuelve (desde, hasta).
+        fuentes: {ruta: huella_archivo} del lote de origen; quedan en diario_lotes
+        (misma transacción) hasta terminar_lote().
+        """
+        columnas = [c for c in df.columns if c in self.encabezados]
+        inicio = self._siguiente_fila()
+        idx_pedido = columnas.index("PEDIDO")
+
+        filas = (
+            (inicio + i, _clave(valores[idx_pedido]), 1, *[_a_sql(v) for v in valores])
+            for i, valores in enumerate(df[columnas].itertuples(index=False, name=None))
+        )
+        nombres = ", ".join(["fila", "clave_pedido", "pendiente", *[_col(c) for c in columnas]])
+        marcadores = ", ".join("?" * (3 + len(columnas)))
+        with self.con:
+            self.con.executemany(f"INSERT INTO registros ({nombres}) VALUES ({marcadores})", filas)
+            self._revisar_huecos(df["PEDIDO"])
+            if fuentes is not None:
+                self.con.execute(
+                    "INSERT INTO diario_lotes (fuentes, filas) VALUES (?, ?)",
+                    (json.dumps({str(Path(r).resolve()): h for r, h in fuentes.items()}), len(df)),
+                )
+        return inicio, inicio + len(df) - 1
+
+    def lotes_sin_terminar(self) -> dict:
+        """
+        lote -> {ruta: huella} de sus fuentes, para los lotes insertados cuyas
+        fuentes aún no se limpiaron (corrida anterior cortada). Las entradas de
+        diarios anteriores (solo rutas) quedan con huella None.
+        """
+        lotes = {}
+        for lote, fuentes in self.con.execute("SELECT lote, fuentes FROM diario_lotes ORDER BY lote"):
+            fuentes = json.loads(fuentes)
+            lotes[lote] = fuentes if isinstance(fuentes, dict) else dict.fromkeys(fuentes)
+        return lotes
+
+    def terminar_lote(self, lote):
+        with self.con:
+            self.con.execute("DELETE FROM diario_lotes WHERE lote = ?", (lote,))
+
+    def actualizar_celdas(self, cambios):
+        """
+        cambios: iterable de (fila, columna, valor). Quedan pendientes de exportar.
+        """
+        cambios = [(f, c, _a_sql(v)) for f, c, v in cambios]
+        with self.con:
+            for columna in {c for _, c, _ in cambios}:
+                self.con.executemany(
+                    f"UPDATE registros SET {_col(columna)} = ? WHERE fila = ?",
+                    [(v, f) for f, c, v in cambios if c == columna],
+                )
+            self.con.executemany(
+                "INSERT OR IGNORE INTO celdas_pendientes (fila, columna) VALUES (?, ?)",
+                [(f, c) for f, c, _ in cambios],
+            )
+            filas = [f for f, c, _ in cambios if c in COLUMNAS_ENRIQUECIDAS]
+            if filas:
+                self._revisar_huecos(self._pedidos_de_filas(filas))
+        return len(cambios)
+
+    def rellenar_vacios(self, columna, valores: dict) -> int:
+        """
+        Llena `columna` SOLO donde está vacía, con valores por PEDIDO ({pedido: valor}).
+        """
+        if columna not in self.encabezados:
+            return 0
+        valores = {_clave(p): v for p, v in valores.items() if _texto(v) != ""}
+        cambios = [
+            (fila, columna, valores[pedido])
+            for pedido, fila, actual in self._por_pedido(valores.keys(), f"fila, {_col(columna)}")
+            if _texto(actual) == ""
+        ]
+        return self.actualizar_celdas(cambios)
+
+    def desplazar_filas(self, desde, delta):
+        """
+        Corre las filas >= desde en `delta` (p. ej. tras borrar una fila en la hoja).
+        """
+        with self.con:
+            for tabla in ("registros", "celdas_pendientes"):
+                # En dos pasos (negativo y de vuelta) para no chocar con la clave primaria
+                self.con.execute(f"UPDATE {tabla} SET fila = -(fila + ?) WHERE fila >= ?", (delta, desde))
+                self.con.execute(f"UPDATE {tabla} SET fila = -fila WHERE fila < 0")
+            self._guardar_meta("archivo_en_curso", None)
+
+    def archivar_filas(self, filas_por_mes) -> int:
+        """
+        Saca del almacén las filas ya escritas en el archivo ({mes: [filas]}),
+        registra sus pedidos en `archivados` y deja las filas restantes
+        contiguas desde la 2 (UNA transacción). El .xlsm queda marcado para
+        regenerarse. Devuelve cuántas filas salieron.
+        """
+        todas = [f for filas in filas_por_mes.values() for f in filas]
+        if not todas:
+            return 0
+
+        sacadas = 0
+        with self.con:
+            pedidos = self._pedidos_de_filas(todas)
+            for mes, filas in filas_por_mes.items():
+                filas = list(filas)
+                for i in range(0, len(filas), _LOTE_SQL):
+                    lote = filas[i:i + _LOTE_SQL]
+                    marcadores = ", ".join("?" * len(lote))
+                    self.con.execute(
+                        "INSERT OR IGNORE INTO archivados (clave_pedido, mes) SELECT DISTINCT clave_pedido, ? "
+                        f"FROM registros WHERE fila IN ({marcadores}) AND clave_pedido != ''",
+                        [mes, *lote],
+                    )
+                    self.con.execute(f"DELETE FROM celdas_pendientes WHERE fila IN ({marcadores})", lote)
+                    sacadas += self.con.execute(f"DELETE FROM registros WHERE fila IN ({marcadores})", lote).rowcount
+            self._revisar_huecos(pedidos)
+            self._renumerar()
+            self._guardar_meta("regenerar", True)
+            self._guardar_meta("archivo_en_curso", None)
+        return sacadas
+
+    def _renumerar(self):
+        """
+        Deja las filas contiguas desde la 2 conservando el orden. Las fórmulas
+        (modo fórmulas) apuntan a su propia fila: se corrigen al nuevo número.
+        Va dentro de la transacción de quien llama.
+        """
+        movidas = [
+            (vieja, nueva)
+            for vieja, nueva in self.con.execute(
+                "SELECT fila, ROW_NUMBER() OVER (ORDER BY fila) + 1 FROM registros"
+            )
+            if vieja != nueva
+        ]
+        if not movidas:
+            return
+
+        self.con.execute("CREATE TEMP TABLE IF NOT EXISTS renumeracion (vieja INTEGER PRIMARY KEY, nueva INTEGER)")
+        self.con.execute("DELETE FROM renumeracion")
+        self.con.executemany("INSERT INTO renumeracion VALUES (?, ?)", movidas)
+        for tabla in ("registros", "celdas_pendientes"):
+            # En dos pasos (negativo y de vuelta) para no chocar con la clave primaria
+            self.con.execute(
+                f"UPDATE {tabla} SET fila = -(SELECT nueva FROM renumeracion WHERE vieja = {tabla}.fila) "
+                "WHERE fila IN (SELECT vieja FROM renumeracion)"
+            )
+            self.con.execute(f"UPDATE {tabla} SET fila = -fila WHERE fila < 0")
+
+        for columna in self.encabezados:
+            corregidas = [
+                (re.sub(rf"(?<=[A-Z]){vieja}(?!\d)", str(fila), formula), fila)
+                for fila, vieja, formula in self.con.execute(
+                    f"SELECT r.fila, m.vieja, r.{_col(columna)} FROM registros r "
+                    f"JOIN renumeracion m ON m.nueva = r.fila WHERE r.{_col(columna)} LIKE '=%'"
+                )
+            ]
+            if corregidas:
+                self.con.executemany(f"UPDATE registros SET {_col(columna)} = ? WHERE fila = ?", corregidas)
+
+    # -------------------------
+    # Huecos de BDPCP (pedidos con PROMOTOR/CELULAR/POTENCIA_AC_KW vacíos)
+    # -------------------------
+    def _condicion_hueco(self):
+        columnas = [c for c in COLUMNAS_ENRIQUECIDAS if c in self.encabezados]
+        return " OR ".join(f"{_col(c)} IS NULL" for c in columnas)
+
+    def _reconstruir_huecos(self):
+        """
+        Rearma `huecos` desde cero (tras re-importar: todo vuelve a versión 0).
+        Va dentro de la transacción de quien llama.
+        """
+        self.con.execute("DELETE FROM huecos")
+        condicion = self._condicion_hueco()
+        if condicion:
+            self.con.execute(
+                "INSERT INTO huecos (clave_pedido) SELECT DISTINCT clave_pedido FROM registros "
+                f"WHERE clave_pedido != '' AND ({condicion})"
+            )
+        self._guardar_meta("huecos", True)
+
+    def _revisar_huecos(self, pedidos):
+        """
+        Re-evalúa solo estos pedidos: salen de `huecos` si quedaron completos,
+        entran (versión 0) si ahora tienen vacíos. Los que siguen conservan su versión.
+        """
+        condicion = self._condicion_hueco()
+        if not condicion:
+            return
+        pedidos = list({_clave(p) for p in pedidos if _clave(p)})
+        for i in range(0, len(pedidos), _LOTE_SQL):
+            lote = pedidos[i:i + _LOTE_SQL]
+            marcadores = ", ".join("?" * len(lote))
+            self.con.execute(
+                f"DELETE FROM huecos WHERE clave_pedido IN ({marcadores}) AND NOT EXISTS ("
+                f"SELECT 1 FROM registros r WHERE r.clave_pedido = huecos.clave_pedido AND ({condicion}))",
+                lote,
+            )
+            self.con.execute(
+                "INSERT OR IGNORE INTO huecos (clave_pedido) SELECT DISTINCT clave_pedido FROM registros "
+                f"WHERE clave_pedido IN ({marcadores}) AND ({condicion})",
+                lote,
+            )
+
+    def _pedidos_de_filas(self, filas):
+        filas = list(set(filas))
+        pedidos = set()
+        for i in range(0, len(filas), _LOTE_SQL):
+            lote = filas[i:i + _LOTE_SQL]
+            marcadores = ", ".join("?" * len(lote))
+            pedidos.update(
+                r[0] for r in self.con.execute(
+                    f"SELECT clave_pedido FROM registros WHERE fila IN ({marcadores})", lote
+                )
+            )
+        return pedidos
+
+    def pedidos_con_huecos(self, antes_de_version) -> dict:
+        """
+        PEDIDO -> versión de BDPCP revisada, solo los incompletos que no se han
+        revisado contra `antes_de_version` (o una posterior).
+        """
+        return dict(self.con.execute(
+            "SELECT clave_pedido, version FROM huecos WHERE version < ?", (antes_de_version,)
+        ))
+
+    def marcar_revisados(self, pedidos, version):
+        """
+        Registra que estos pedidos (los que sigan incompletos) ya se cruzaron con `version`.
+        """
+        with self.con:
+            self.con.executemany(
+                "UPDATE huecos SET version = ? WHERE clave_pedido = ?",
+                [(version, _clave(p)) for p in pedidos],
+            )
+
+    def total_huecos(self) -> int:
+        return self.con.execute("SELECT COUNT(*) FROM huecos").fetchone()[0]
+
+    # -------------------------
+    # Exportación al .xlsm
+    # -------------------------
+    def por_exportar(self, columnas=None):
+        """
+        Lo pendiente de escribir en el .xlsm, con valores listos para Excel:
+        (filas, celdas) con filas = [(fila, {columna: valor})] (filas nuevas) y
+        celdas = [(fila, columna, valor)] (celdas modificadas de filas existentes).
+        """
+        columnas = [c for c in (columnas or self.encabezados) if c in self.encabezados]
+        seleccion = ", ".join(_col(c) for c in columnas)
+
+        filas = [
+            (fila, {c: _a_excel(c, v) for c, v in zip(columnas, valores)})
+            for fila, *valores in self.con.execute(
+                f"SELECT fila, {seleccion} FROM registros WHERE pendiente = 1 ORDER BY fila"
+            )
+        ]
+
+        celdas = []
+        for columna in columnas:
+            celdas.extend(
+                (fila, columna, _a_excel(columna, v))
+                for fila, v in self.con.execute(
+                    f"SELECT r.fila, r.{_col(columna)} FROM celdas_pendientes p "
+                    "JOIN registros r ON r.fila = p.fila WHERE p.columna = ? AND r.pendiente = 0",
+                    (columna,),
+                )
+            )
+        return filas, celdas
+
+    def volcar_en_hoja(self, ws, regenerar=False):
+        """
+        Escribe en `ws` lo pendiente (filas nuevas + celdas modificadas) o, con
+        regenerar=True, todas las filas del almacén. Devuelve (filas, celdas) escritas.
+        """
+        posiciones = ColumnasHoja(ws).indices
+        columnas = [c for c in self.encabezados if c in posiciones]
+
+        if regenerar:
+            if ws.max_row > 1:
+                ws.delete_rows(2, ws.max_row - 1)
+            cursor = self.con.execute(
+                f"SELECT fila, {', '.join(_col(c) for c in columnas)} FROM registros ORDER BY fila"
+            )
+            filas = ((fila, dict(zip(columnas, valores))) for fila, *valores in cursor)
+            celdas = []
+        else:
+            filas, celdas = self.por_exportar(columnas)
+
+        escritas = 0
+        for fila, valores in filas:
+            for c, v in valores.items():
+                ws.cell(row=fila, column=posiciones[c]).value = _a_excel(c, v) if regenerar else v
+            escritas += 1
+        for fila, columna, v in celdas:
+            ws.cell(row=fila, column=posiciones[columna]).value = v
+
+        return escritas, len(celdas)
+
+    def exportacion_lista(self, ruta_tmp):
+        """
+        Llamar con el .xlsm nuevo ya escrito en `ruta_tmp`, antes de que reemplace
+        al libro: si se corta después del reemplazo, sincronizar() la confirma.
+        """
+        with self.con:
+            self._guardar_meta("huella_exportando", huella_archivo(ruta_tmp))
+
+    def confirmar_exportacion(self):
+        """
+        Llamar después de guardar el .xlsm con lo volcado: limpia pendientes y
+        registra la huella del libro.
+        """
+        huella = self._leer_meta("huella_exportando")
+        if not huella_vigente(self.ruta_ans, huella):
+            huella = huella_archivo(self.ruta_ans)
+        with self.con:
+            self.con.execute("UPDATE registros SET pendiente = 0 WHERE pendiente = 1")
+            self.con.execute("DELETE FROM celdas_pendientes")
+            self._guardar_meta("huella", huella)
+            self._guardar_meta("huella_exportando", None)
+            self._guardar_meta("regenerar", False)
+
+    def cerrar(self):
+        self.con.close()
+
+
+def leer_agpe_ans(ruta_ans: Path) -> pd.DataFrame:
+    """
+    AGPE_ANS como DataFrame de texto (nulos -> ""), leído del almacén.
+    Solo abre el .xlsm si cambió fuera de la herramienta.
+    """
+    almacen = AlmacenANS(ruta_ans)
+    try:
+        almacen.sincronizar()
+        df = almacen.consultar()
+    finally:
+        almacen.cerrar()
+    return df.map(lambda v: "" if v is None else str(v)).reset_index(drop=True)
@@ -5,145 +5,59 @@ import pandas as pd
 import numpy as np
 
 from openpyxl import load_workbook
-from openpyxl.worksheet.table import Table, TableStyleInfo
-from openpyxl.worksheet.datavalidation import DataValidation
+from openpyxl.utils import get_column_letter
 from datetime import datetime, date
-from pandas.tseries.offsets import CustomBusinessDay
+
+from src.calendario_habil import sumar_dias_habiles
+from src.export.almacen_ans import AlmacenANS
+from src.export.archivo_ans import DIAS_ARCHIVO_DEFAULT, archivar_cerrados
+from src.export.columnas_hoja import ColumnasHoja
+from src.export.formulas_ans import COLUMNAS_FORMULAS, asegurar_hoja_festivos, es_formula, formulas_ans
+from src.export.mantenimiento_excel import asegurar_tabla, asegurar_validacion_lista
+from src.export.parche_xlsx import LibroNoParcheable, leer_inicio_hoja, parchear_hoja, reemplazo_atomico, truncar_a_encabezados
+from src.export.servicio_bdpcp import COLUMNAS_BDPCP, ServicioBDPCP
+from src.export.staging_agpe_clean import leer_agpe_clean, vaciar_staging
+from src.huella_archivo import huella_archivo, huella_vigente
+from src.transform.esquema import aplicar_esquema
+from src.transform.normalizador_texto import normalizar_texto
+from src.transform.reglas_ans import clasificar_ans, estados_por_dias
 
 
 # ============================================================
 # PASO 0) UTILIDADES SEGURAS (NO CRÍTICAS)
 # ============================================================
 
-def _norm_headers(cols):
-    return (
-        pd.Series(cols)
-        .astype(str)
-        .str.strip()
-        .str.upper()
-        .str.replace(" ", "_", regex=False)
-        .str.replace("Á", "A")
-        .str.replace("É", "E")
-        .str.replace("Í", "I")
-        .str.replace("Ó", "O")
-        .str.replace("Ú", "U")
-        .tolist()
-    )
-
 def _safe_str(s):
     if s is None or (isinstance(s, float) and np.isnan(s)):
         return ""
     return str(s).strip()
 
-def _dias_ans_por_detalle(detalle):
-    d = _safe_str(detalle).upper().strip()
-
-    # 12 días hábiles: "1ER/1RA/2DA/3ER/3RA/4TA/5TA VISITA" (aunque NO diga DOCUMENTOS)
-    if "VISITA" in d and any(x in d for x in ("1ER", "1RA", "2DA", "3ER", "3RA", "4TA", "5TA")):
-        return 12
-
-    # 12 días hábiles: "X VISITA Y DOCUMENTOS" o similares
-    if "VISITA" in d and ("DOC" in d or "DOCUMENT" in d):
-        return 12
-
-    # 5 días hábiles
-    if d == "DOCUMENTOS" or d.startswith("DOCUMENT"):
-        return 5
-
-    # 9 días hábiles
-    if d in ("DIRECTA", "SEMIDIRECTA", "INDIRECTA"):
-        return 9
-
-    return None
-
-
-def _dias_ans_por_tipo_visita(tipo_visita):
-    tv = str(tipo_visita).upper().strip()
-    
-    if tv in ("C08", "C09"):
-        return 9 
-    return None
-
-def _estado_por_dias_restantes(dias):
-    if dias is None:
-        return ""
-    if dias < 0:
-        return "VENCIDO"
-    if dias == 0:
-        return "ALERTA 0 DIAS"
-    if dias <= 2:
-        return "ALERTA"
-    return "A TIEMPO"
-
-
-def _find_col_letter_by_header(ws, header_name_upper):
-    header_name_upper = str(header_name_upper).strip().upper()
-    for cell in ws[1]:
-        if str(cell.value).strip().upper() == header_name_upper:
-            return cell.column_letter
-    return None
-
-def _find_col_index_by_header(ws, header_name_upper):
-    header_name_upper = str(header_name_upper).strip().upper()
-    for cell in ws[1]:
-        if str(cell.value).strip().upper() == header_name_upper:
-            return cell.col_idx
-    return None
-
 def _update_or_create_table(ws, table_name="tbl_AGPE_ANS"):
-    # Actualiza el rango de la tabla sin destruir formatos
-    max_row = ws.max_row
-    max_col = ws.max_column
-    last_col_letter = ws.cell(row=1, column=max_col).column_letter
-    ref = f"A1:{last_col_letter}{max_row}"
-
-    if table_name in ws.tables:
-        ws.tables[table_name].ref = ref
-    else:
-        t = Table(displayName=table_name, ref=ref)
-        t.tableStyleInfo = TableStyleInfo(
-            name="TableStyleMedium9",
-            showFirstColumn=False,
-            showLastColumn=False,
-            showRowStripes=True,
-            showColumnStripes=False,
-        )
-        ws.add_table(t)
+    # Actualiza el rango de la tabla sin destruir formatos (una sola tabla por nombre)
+    asegurar_tabla(ws, table_name)
 
 def _ensure_obs_validation(ws, max_row, formula_range="=validador!$A$1:$A$9"):
     """
-    Aplica validación de lista a OBSERVACION para todo el rango actual.
+    Aplica validación de lista a OBSERVACION para todo el rango actual
+    (reemplaza la anterior en vez de agregar otra en cada corrida).
     """
-    col_obs = _find_col_letter_by_header(ws, "OBSERVACION")
+    col_obs = ColumnasHoja(ws).letra("OBSERVACION")
     if not col_obs:
         return
 
-    dv = DataValidation(
-        type="list",
-        formula1=formula_range,
-        allow_blank=True,
-        showDropDown=False
-    )
-    ws.add_data_validation(dv)
-    dv.add(f"{col_obs}2:{col_obs}{max_row}")
+    asegurar_validacion_lista(ws, col_obs, formula_range, hasta=max_row)
 
 def _limpiar_excel_dejar_encabezados_xlsx(ruta_xlsx):
     """
-    Deja un .xlsx en blanco conservando encabezados.
+    Deja un .xlsx en blanco conservando encabezados, tabla, validaciones y hoja LISTAS.
     """
-    df_vacio = pd.read_excel(ruta_xlsx, nrows=0)
-    df_vacio.to_excel(ruta_xlsx, index=False)
+    truncar_a_encabezados(ruta_xlsx)
 
 def _limpiar_excel_dejar_encabezados_xlsm(ruta_xlsm):
     """
     Borra filas (2..fin) en la hoja activa de un .xlsm conservando macros.
     """
-    wb = load_workbook(ruta_xlsm, keep_vba=True)
-    ws = wb.active
-    if ws.max_row > 1:
-        ws.delete_rows(2, ws.max_row - 1)
-    wb.save(ruta_xlsm)
-    wb.close()
+    truncar_a_encabezados(ruta_xlsm)
 
 
 # ============================================================
@@ -178,413 +92,659 @@ COLUMNAS_MIN_CONTROLADAS = [
 
 
 # ============================================================
-# PASO 2) APPEND PRINCIPAL
+# PASO 1.1) ORIGEN DE CADA COLUMNA EN LAS FILAS NUEVAS
+# ------------------------------------------------------------
+# columna AGPE_ANS -> (columna en la fuente, MAYÚSCULAS). Lo que no está aquí queda "".
 # ============================================================
 
-def append_agpe_ans():
-    print("➡️ Iniciando APPEND seguro a AGPE_ANS (sin calendario)")
+CAMPOS_DESDE_CLEAN = {
+    "PEDIDO": ("PEDIDO", True),
+    "DIRECCION": ("DIRECCION", False),
+    "MUNICIPIO": ("MUNICIPIO", False),
+    "CLIENTE": ("CLIENTE", True),
+    "SUBZONA": ("SUBZONA", True),
+    "TIPO_VISITA": ("TIPO_VISITA", False),
+    "DETALLE_VISITA": ("DETALLE_VISITA", True),
+    "COORDENADAX": ("COORDENADAX", False),
+    "COORDENADAY": ("COORDENADAY", False),
+    "TIPO_MEDIDOR": ("TIPO_MEDIDOR", False),
+    "URBANO_RURAL": ("URBANO_RURAL", True),
+    "FECHA_CAMBIO_ESTADO": ("FECHA_CAMBIO_ESTADO", False),
+}
+
+CAMPOS_DESDE_VISITAS = {
+    "PEDIDO": ("PEDIDO", True),
+    "DIRECCION": ("DIRECCION", False),
+    "MUNICIPIO": ("MUNICIPIO", False),
+    "CLIENTE": ("CLIENTE", True),
+    "SUBZONA": ("SUBZONA", True),
+    "PROMOTOR": ("PROMOTOR", False),
+    "CELULAR": ("CELULAR", False),
+    "POTENCIA_AC_KW": ("POTENCIA_AC_KW", False),
+    "DETALLE_VISITA": ("DETALLE_VISITA", True),
+    "COORDENADAX": ("COORDENADAX", False),
+    "COORDENADAY": ("COORDENADAY", False),
+    "URBANO_RURAL": ("URBANO_RURAL", True),
+    "TIPO_VISITA": ("TIPO_VISITA", True),
+    "OBSERVACION": ("OBSERVACION", True),
+    "FECHA_CAMBIO_ESTADO": ("FECHA_CAMBIO_ESTADO", False),
+}
 
-    base_dir = Path(__file__).resolve().parents[2]
-    ruta_clean = base_dir / "data_clean" / "AGPE_CLEAN.xlsx"
-    ruta_visitas = base_dir / "data_clean" / "PLANTILLA_PRIMER VISITAS.xlsm"
-    ruta_ans = base_dir / "data_clean" / "AGPE_ANS.xlsm"
-    ruta_bdpcp = base_dir / "data_clean" / "BDPCP.xlsx"
 
-    if not ruta_ans.exists():
-        raise FileNotFoundError("❌ No existe AGPE_ANS.xlsm")
-    if not ruta_clean.exists():
-        raise FileNotFoundError("❌ No existe AGPE_CLEAN.xlsx")
-    if not ruta_visitas.exists():
-        raise FileNotFoundError("❌ No existe PLANTILLA_PRIMER VISITAS.xlsm")
+# ============================================================
+# PASO 1.2) MODO ACTUALIZAR (pedidos que ya están en AGPE_ANS)
+# ------------------------------------------------------------
+# Columnas que una foto nueva de las fuentes puede refrescar. Las del
+# usuario nunca se tocan; el ANS se recalcula si cambia alguna de sus entradas.
+# ============================================================
 
-    # ============================================================
-    # PASO 3) ABRIR AGPE_ANS + ELIMINAR FILA 2 SI ESTÁ VACÍA
-    # ============================================================
+COLUMNAS_USUARIO = ["OBSERVACION", "REVISOR"]
 
-    wb_ans = load_workbook(ruta_ans, keep_vba=True, data_only=False)
-    ws_ans = wb_ans.active
+COLUMNAS_REFRESCABLES = [
+    c for c in dict.fromkeys([*CAMPOS_DESDE_CLEAN, *CAMPOS_DESDE_VISITAS])
+    if c != "PEDIDO" and c not in COLUMNAS_USUARIO
+]
 
-    def _eliminar_fila2_si_vacia(ws):
-        """
-        Elimina la fila 2 SOLO si está completamente vacía (todas las celdas vacías/None).
-        Esto evita que quede esa “fila azul” vacía debajo del encabezado.
-        """
-        if ws.max_row < 2:
-            return
+ENTRADAS_ANS = ["DETALLE_VISITA", "TIPO_VISITA", "FECHA_CAMBIO_ESTADO"]
+SALIDAS_ANS = ["FECHA_LIMITE_ANS", "DIAS_RESTANTES", "ESTADO_ANS"]
 
-        hay_algo = False
-        for c in range(1, ws.max_column + 1):
-            v = ws.cell(row=2, column=c).value
-            if _safe_str(v) != "":
-                hay_algo = True
-                break
+def _texto_columna(df, col, mayusculas=False):
+    """
+    Versión columnar de _safe_str: nulos -> "", strip y (opcional) MAYÚSCULAS.
+    """
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return normalizar_texto(df[col], mayusculas=mayusculas)
 
-        if not hay_algo:
-            ws.delete_rows(2, 1)
 
-    # ✅ Quitar la fila 2 “vacía azul” si existe
-    _eliminar_fila2_si_vacia(ws_ans)
+def _filas_desde(df, campos, headers_ans):
+    filas = pd.DataFrame(
+        {destino: _texto_columna(df, origen, mayus) for destino, (origen, mayus) in campos.items()},
+        index=df.index,
+    )
+    filas = filas[filas["PEDIDO"] != ""]
+    return filas.reindex(columns=headers_ans, fill_value="")
+
+
+def _construir_filas_nuevas(df_clean_datos, df_vis_datos, headers_ans):
+    """
+    Filas nuevas alineadas a headers_ans (AGPE_CLEAN primero, luego PRIMER VISITAS),
+    construidas por columnas: sin iterrows ni un dict por fila.
+    """
+    filas_clean = _filas_desde(df_clean_datos, CAMPOS_DESDE_CLEAN, headers_ans)
+    filas_vis = _filas_desde(df_vis_datos, CAMPOS_DESDE_VISITAS, headers_ans)
+
+    return pd.concat([filas_clean, filas_vis], ignore_index=True)
 
-    col_pedido_idx = _find_col_index_by_header(ws_ans, "PEDIDO")
-    if not col_pedido_idx:
-        wb_ans.close()
-        raise ValueError("❌ AGPE_ANS no tiene columna PEDIDO en encabezados.")
 
-    pedidos_historicos = set()
-    for r in range(2, ws_ans.max_row + 1):
-        v = ws_ans.cell(row=r, column=col_pedido_idx).value
-        v = _safe_str(v).upper()
-        if v != "":
-            pedidos_historicos.add(v)
+def _cruzar_bdpcp(df_nuevas, df_bdpcp_map):
+    """
+    Llena PROMOTOR/CELULAR/POTENCIA_AC_KW vacíos de las filas nuevas desde BDPCP.
+    """
+    if df_bdpcp_map.empty:
+        return df_nuevas
+
+    for col in COLUMNAS_BDPCP:
+        if col not in df_nuevas.columns:
+            continue
+        desde_bd = df_nuevas["PEDIDO"].map(df_bdpcp_map[col])
+        vacio = df_nuevas[col].str.strip() == ""
+        df_nuevas[col] = df_nuevas[col].mask(vacio & desde_bd.notna(), desde_bd)
+    return df_nuevas
+
+
+def _calcular_ans_nuevas(df_nuevas, hoy=None):
+    """
+    Reglas ANS (config/reglas_ans.yaml) sobre las filas nuevas, antes de insertarlas
+    en el almacén: TIPO_VISITA forzado (1RA VISITA => C07) y FECHA_LIMITE_ANS /
+    DIAS_RESTANTES / ESTADO_ANS. Las reglas se evalúan una vez por par
+    (DETALLE_VISITA, TIPO_VISITA) distinto.
+    """
+    faltan = [
+        c for c in ("FECHA_CAMBIO_ESTADO", "DETALLE_VISITA", "FECHA_LIMITE_ANS", "DIAS_RESTANTES", "ESTADO_ANS")
+        if c not in df_nuevas.columns
+    ]
+    if faltan:
+        raise ValueError("❌ Faltan columnas clave para cálculo ANS (U, V, W).")
+
+    hoy = pd.Timestamp(hoy or date.today())
+
+    tipos = df_nuevas["TIPO_VISITA"] if "TIPO_VISITA" in df_nuevas.columns else pd.Series("", index=df_nuevas.index)
+    clasificacion = clasificar_ans(df_nuevas["DETALLE_VISITA"], tipos)
+
+    # 🔧 Regla: si DETALLE_VISITA es 1RA VISITA => TIPO_VISITA = C07
+    if "TIPO_VISITA" in df_nuevas.columns:
+        df_nuevas["TIPO_VISITA"] = clasificacion["TIPO_VISITA"]
+
+    fecha_cambio = pd.to_datetime(df_nuevas["FECHA_CAMBIO_ESTADO"], errors="coerce", format="mixed")
+
+    # 🔒 NO TOCAR SI YA EXISTE VALOR (protección absoluta)
+    calcular = (
+        (df_nuevas["FECHA_LIMITE_ANS"].map(_safe_str) == "")
+        & fecha_cambio.notna()
+        & clasificacion["DIAS_ANS"].notna()
+    )
+    if not calcular.any():
+        return df_nuevas
+
+    # Días hábiles de Colombia (sin fines de semana ni festivos)
+    fecha_limite = sumar_dias_habiles(fecha_cambio[calcular], clasificacion.loc[calcular, "DIAS_ANS"])
+    dias_restantes = (fecha_limite.dt.normalize() - hoy.normalize()).dt.days
+
+    for col in ("FECHA_LIMITE_ANS", "DIAS_RESTANTES", "ESTADO_ANS"):
+        df_nuevas[col] = df_nuevas[col].astype(object)
+    df_nuevas.loc[calcular, "FECHA_LIMITE_ANS"] = pd.Series(
+        fecha_limite.dt.to_pydatetime(), index=fecha_limite.index, dtype=object
+    )
+    df_nuevas.loc[calcular, "DIAS_RESTANTES"] = dias_restantes.astype(int).astype(object)
+    df_nuevas.loc[calcular, "ESTADO_ANS"] = estados_por_dias(dias_restantes)
+    return df_nuevas
+
 
-    print(f"📌 PEDIDOS Históricos en AGPE_ANS: {len(pedidos_historicos)}")
+def _mismo_valor(columna, guardado, nuevo):
+    """
+    True si el valor guardado y el de la fuente son el mismo dato aunque
+    vengan en otro formato (300 / "300", fecha ISO / texto de fecha, mayúsculas).
+    """
+    a, b = _safe_str(guardado), _safe_str(nuevo)
+    if a.upper() == b.upper():
+        return True
+    if columna.startswith("FECHA"):
+        fechas = pd.to_datetime(pd.Series([a, b]), errors="coerce", format="mixed")
+        return fechas.notna().all() and fechas[0] == fechas[1]
+    try:
+        return float(a) == float(b)
+    except ValueError:
+        return False
+
+
+def _refrescar_existentes(almacen, df_nuevas, hoy=None):
+    """
+    Modo actualizar: separa de `df_nuevas` los pedidos que tienen fila abierta
+    en AGPE_ANS.
+    - Pedido con fila abierta: se toma su última foto del lote; si tiene la
+      misma huella de fuente que la última vez se descarta sin compararla, si
+      no se cambian solo las celdas que difieren (valores no vacíos, nunca
+      COLUMNAS_USUARIO); el ANS se recalcula si cambió DETALLE_VISITA /
+      TIPO_VISITA / FECHA_CAMBIO_ESTADO.
+    - El resto (pedidos nuevos, cerrados o archivados) sigue tal cual como
+      filas nuevas, igual que sin actualizar.
+    Devuelve (filas nuevas, cambios [(fila, columna, valor)], huellas {PEDIDO: huella}).
+    """
+    columnas = [c for c in COLUMNAS_REFRESCABLES if c in df_nuevas.columns]
+
+    abiertos = set(almacen.filas_abiertas(df_nuevas["PEDIDO"], [])["clave_pedido"])
+    nuevas = df_nuevas[~df_nuevas["PEDIDO"].isin(abiertos)]
+
+    # Una foto por pedido (la última que trae el lote); la de un pedido que entra
+    # como fila nueva queda como su huella inicial
+    fotos = df_nuevas.drop_duplicates("PEDIDO", keep="last")
+    huellas = pd.util.hash_pandas_object(fotos[["PEDIDO", *columnas]], index=False).map("{:016x}".format)
+    huellas = dict(zip(fotos["PEDIDO"], huellas))
+
+    df = fotos[fotos["PEDIDO"].isin(abiertos)]
+    sin_cambios = df["PEDIDO"].map(almacen.huellas_de(df["PEDIDO"])).eq(df["PEDIDO"].map(huellas))
+    existentes = df[~sin_cambios].copy()
+    iguales = set(df.loc[sin_cambios, "PEDIDO"])
+    huellas = {p: h for p, h in huellas.items() if p not in iguales}
+
+    guardadas = almacen.filas_abiertas(existentes["PEDIDO"], [*columnas, *SALIDAS_ANS])
+    guardadas = guardadas.reset_index().set_index("clave_pedido").to_dict("index")
+
+    # TIPO_VISITA forzado por las reglas, igual que en las filas nuevas
+    if "TIPO_VISITA" in existentes.columns and "DETALLE_VISITA" in existentes.columns:
+        existentes["TIPO_VISITA"] = clasificar_ans(existentes["DETALLE_VISITA"], existentes["TIPO_VISITA"])["TIPO_VISITA"]
+
+    cambios, recalcular = [], {}
+    for pedido, nueva in zip(existentes["PEDIDO"], existentes[columnas].to_dict("records")):
+        guardada = guardadas[pedido]
+        distintas = {
+            c: v for c, v in nueva.items()
+            if _safe_str(v) != "" and not _mismo_valor(c, guardada[c], v)
+        }
+        cambios += [(guardada["fila"], c, v) for c, v in distintas.items()]
+        if any(c in distintas for c in ENTRADAS_ANS):
+            recalcular[guardada["fila"]] = {**guardada, **distintas}
+
+    # ANS solo de las filas cuyas entradas cambiaron
+    if recalcular and all(c in df_nuevas.columns for c in [*ENTRADAS_ANS, *SALIDAS_ANS]):
+        # Índice 0..n como las filas nuevas (así las arma _calcular_ans_nuevas)
+        df_ans = pd.DataFrame(list(recalcular.values()))[[*ENTRADAS_ANS, *SALIDAS_ANS]]
+        df_ans = df_ans.astype(object).where(df_ans.notna(), "").assign(FECHA_LIMITE_ANS="")
+        df_ans = _calcular_ans_nuevas(df_ans, hoy).set_axis(list(recalcular))
+        calculadas = df_ans[df_ans["FECHA_LIMITE_ANS"].map(_safe_str) != ""]
+        for fila, ans in calculadas.to_dict("index").items():
+            for c in SALIDAS_ANS:
+                guardado = recalcular[fila][c]
+                # En modo fórmulas DIAS_RESTANTES / ESTADO_ANS los recalcula Excel
+                if c != "FECHA_LIMITE_ANS" and es_formula(guardado):
+                    continue
+                if not _mismo_valor(c, guardado, ans[c]):
+                    cambios.append((fila, c, ans[c]))
+
+    return nuevas, cambios, huellas
+
+
+def _eliminar_fila2_si_vacia(ws, almacen):
+    """
+    Elimina la fila 2 SOLO si está completamente vacía (todas las celdas vacías/None)
+    y el almacén no tiene nada que escribir ahí.
+    Esto evita que quede esa “fila azul” vacía debajo del encabezado.
+    """
+    if ws.max_row <= 2 or almacen.tiene_fila(2):
+        return False
+
+    if not ColumnasHoja(ws).fila_vacia(2):
+        return False
 
-    # Encabezados reales de AGPE_ANS (para respetar orden)
-    headers_ans = []
-    for c in range(1, ws_ans.max_column + 1):
-        v = ws_ans.cell(row=1, column=c).value
-        headers_ans.append(str(v).strip().upper() if v is not None else "")
-    headers_ans = [h for h in headers_ans if h != ""]
+    ws.delete_rows(2, 1)
+    almacen.desplazar_filas(desde=3, delta=-1)
+    return True
 
-    if "PEDIDO" not in headers_ans:
+
+# ============================================================
+# PASO 2) EXPORTAR ALMACÉN -> AGPE_ANS.xlsm
+# ============================================================
+
+def _pasar_a_formulas(almacen, ws, regenerar):
+    """
+    Modo fórmulas: las filas a exportar (las pendientes, o todas con regenerar)
+    pasan FECHA_LIMITE_ANS / DIAS_RESTANTES / ESTADO_ANS a fórmulas en el almacén.
+    """
+    posiciones = ColumnasHoja(ws).indices
+    faltan = [c for c in COLUMNAS_FORMULAS if c not in posiciones]
+    if faltan:
+        raise ValueError(f"❌ Faltan columnas para el modo fórmulas: {faltan}")
+
+    df = almacen.consultar(COLUMNAS_FORMULAS, donde=None if regenerar else "pendiente = 1")
+    return almacen.actualizar_celdas(formulas_ans(df, posiciones))
+
+
+def _exportar_xml(almacen, ruta_ans):
+    """
+    Exporta lo pendiente parcheando el XML de la hoja (sin cargar el libro en
+    openpyxl): el costo depende de las filas nuevas, no del histórico.
+    Lanza LibroNoParcheable si hace falta el camino openpyxl.
+    """
+    inicio, dimension = leer_inicio_hoja(ruta_ans, filas=2)
+
+    posiciones = {}
+    for col, v in sorted(inicio.get(1, {}).items()):
+        posiciones.setdefault(_safe_str(v).upper(), col)
+
+    # La fila 2 “vacía azul” se elimina con openpyxl (desplaza toda la hoja)
+    fila2 = inicio.get(2, {}).values()
+    if dimension and dimension[1] > 2 and not almacen.tiene_fila(2) and all(_safe_str(v) == "" for v in fila2):
+        raise LibroNoParcheable("la fila 2 está vacía")
+
+    filas, celdas = almacen.por_exportar([c for c in almacen.encabezados if c in posiciones])
+
+    cambios = {fila: {posiciones[c]: v for c, v in valores.items()} for fila, valores in filas}
+    for fila, columna, v in celdas:
+        cambios.setdefault(fila, {})[posiciones[columna]] = v
+
+    letra_obs = get_column_letter(posiciones["OBSERVACION"]) if "OBSERVACION" in posiciones else None
+    parchear_hoja(
+        ruta_ans, cambios, tabla="tbl_AGPE_ANS", columna_validada=letra_obs,
+        antes_de_reemplazar=almacen.exportacion_lista,
+    )
+    return len(filas), len(celdas)
+
+
+def exportar_agpe_ans(almacen=None, regenerar=False, formulas=False, xml=True):
+    """
+    Escribe en AGPE_ANS.xlsm (macros conservadas con keep_vba) lo pendiente del
+    almacén: filas nuevas y celdas modificadas. regenerar=True reescribe todas
+    las filas desde el almacén.
+    formulas=True deja fórmulas en las filas abiertas que se escriben (Excel
+    recalcula DIAS_RESTANTES / ESTADO_ANS al abrir) y la hoja oculta FESTIVOS_ANS.
+    xml=True (por defecto) parchea el XML de la hoja sin cargar el libro cuando
+    se puede (ver parche_xlsx); regenerar/formulas siempre usan openpyxl.
+    Si el almacén renumeró filas (archivo de cerrados) se regenera siempre.
+    El libro se escribe en un temporal y lo reemplaza de forma atómica.
+    """
+    base_dir = Path(__file__).resolve().parents[2]
+    ruta_ans = base_dir / "data_clean" / "AGPE_ANS.xlsm"
+
+    if not ruta_ans.exists():
+        raise FileNotFoundError("❌ No existe AGPE_ANS.xlsm")
+
+    propio = almacen is None
+    if propio:
+        almacen = AlmacenANS(ruta_ans)
+        almacen.sincronizar()
+
+    try:
+        regenerar = regenerar or almacen.requiere_regenerar()
+        if not regenerar and not almacen.hay_pendientes():
+            print("ℹ️ AGPE_ANS.xlsm ya está al día con el almacén.")
+            return 0
+
+        if xml and not regenerar and not formulas:
+            try:
+                escritas, celdas = _exportar_xml(almacen, ruta_ans)
+            except LibroNoParcheable as e:
+                print(f"ℹ️ Parche XML no aplicable ({e}); se exporta con openpyxl.")
+            else:
+                almacen.confirmar_exportacion()
+                print(f"📤 AGPE_ANS.xlsm parcheado: {escritas} filas y {celdas} celdas escritas")
+                return escritas
+
+        wb_ans = load_workbook(ruta_ans, keep_vba=True, data_only=False)
+        ws_ans = wb_ans.active
+
+        # ✅ Quitar la fila 2 “vacía azul” si existe
+        _eliminar_fila2_si_vacia(ws_ans, almacen)
+
+        if formulas:
+            _pasar_a_formulas(almacen, ws_ans, regenerar)
+            asegurar_hoja_festivos(wb_ans)
+
+        escritas, celdas = almacen.volcar_en_hoja(ws_ans, regenerar=regenerar)
+
+        # Tabla + validación (sin tocar formato condicional)
+        _update_or_create_table(ws_ans, table_name="tbl_AGPE_ANS")
+        _ensure_obs_validation(ws_ans, max_row=ws_ans.max_row, formula_range="=validador!$A$1:$A$9")
+
+        with reemplazo_atomico(ruta_ans, almacen.exportacion_lista) as tmp:
+            wb_ans.save(tmp)
         wb_ans.close()
-        raise ValueError("❌ Encabezados inválidos en AGPE_ANS: falta PEDIDO.")
 
+        almacen.confirmar_exportacion()
+        print(f"📤 AGPE_ANS.xlsm exportado: {escritas} filas y {celdas} celdas escritas")
+        return escritas
+    finally:
+        if propio:
+            almacen.cerrar()
+
+
+# ============================================================
+# PASO 3) APPEND PRINCIPAL (POR LOTES, CON DIARIO)
+# ------------------------------------------------------------
+# Cada lote (AGPE_CLEAN + PRIMER VISITAS) se inserta en el almacén en UNA
+# transacción junto con su entrada en diario_lotes. Todos los lotes se
+# exportan con una sola escritura de AGPE_ANS.xlsm (temporal + fsync +
+# rename) y recién después se vacían sus fuentes. Si la corrida se corta,
+# la siguiente retoma: los lotes del diario no se vuelven a leer ni a
+# insertar, solo se exporta lo pendiente y se terminan de limpiar. Una
+# fuente se vacía solo si su huella sigue siendo la del diario (o ya está
+# vacía): lo que se le agregó después de leerla no se borra.
+# ============================================================
+
+def _filas_de_lote(ruta_clean, ruta_visitas, headers_ans, servicio, almacen=None):
+    """
+    Filas nuevas de un lote, con BDPCP cruzado y ANS calculado.
+    Con `almacen` (modo actualizar) los pedidos que ya están se refrescan en
+    vez de agregarse (ver _refrescar_existentes).
+    Devuelve (filas nuevas, cambios de celda, huellas por pedido).
+    Lanza RuntimeError si el lote no trae nada que agregar.
+    """
     # ============================================================
     # PASO 4) LEER AGPE_CLEAN (NUEVOS) Y NORMALIZAR
     # ============================================================
 
-    df_clean = pd.read_excel(ruta_clean, dtype=str)
-    df_clean.columns = _norm_headers(df_clean.columns)
-
-    mapeo_clean = {
-        "NOMBRE_CLIENTE": "CLIENTE",
-        "FECHA_INICIO_ANS": "FECHA_CAMBIO_ESTADO",
-        "TIPO_DIRECCIÓN": "URBANO_RURAL",
-        "URBANO/RURAL": "URBANO_RURAL",
-        "TIPO_DIRECCION": "URBANO_RURAL",
-        "TIPO_DE_MEDIDOR": "TIPO_MEDIDOR",
-        "MEDIDOR": "TIPO_MEDIDOR",
-        "TIPO_MEDIDOR_": "TIPO_MEDIDOR",
-    }
-    for k, v in list(mapeo_clean.items()):
-        if k in df_clean.columns:
-            df_clean = df_clean.rename(columns={k: v})
-
-    if "TIPO_MEDIDOR" not in df_clean.columns:
-        df_clean["TIPO_MEDIDOR"] = ""
-    if "URBANO_RURAL" not in df_clean.columns:
-        df_clean["URBANO_RURAL"] = ""
-    if "DETALLE_VISITA" not in df_clean.columns:
-        df_clean["DETALLE_VISITA"] = ""
-    if "ACTIVIDAD" not in df_clean.columns:
-        df_clean["ACTIVIDAD"] = ""
-
-    req_clean = ["PEDIDO", "DIRECCION", "MUNICIPIO", "CLIENTE", "SUBZONA", "COORDENADAX", "COORDENADAY", "FECHA_CAMBIO_ESTADO"]
-    faltantes_clean = [c for c in req_clean if c not in df_clean.columns]
-    if faltantes_clean:
-        wb_ans.close()
-        raise ValueError(f"❌ Columnas faltantes en AGPE_CLEAN: {faltantes_clean}")
-
-    df_clean["PEDIDO"] = df_clean["PEDIDO"].astype(str).str.strip().str.upper()
-    df_clean["DIRECCION"] = df_clean["DIRECCION"].astype(str).str.strip().str.lstrip("'")
-    df_clean["CLIENTE"] = df_clean["CLIENTE"].astype(str).str.strip().str.upper()
-    df_clean["SUBZONA"] = (
-        df_clean["SUBZONA"].astype(str).str.strip().str.upper()
-        .replace({
-            "METROPOLITANA SUR": "METROPOLITANA",
-            "METROPOLITANA-SUR": "METROPOLITANA",
-            "METROPOLITANA  SUR": "METROPOLITANA",
-        })
-    )
-    df_clean["DETALLE_VISITA"] = df_clean["DETALLE_VISITA"].astype(str).str.strip().str.upper()
-    df_clean["URBANO_RURAL"] = df_clean["URBANO_RURAL"].astype(str).str.strip().str.upper()
+    # Alias, mayúsculas y mapas de valores: config/esquema_agpe.yaml -> agpe_clean
+    df_clean = aplicar_esquema(leer_agpe_clean(ruta_clean), "agpe_clean", fuente="AGPE_CLEAN")
 
     # df_clean["TIPO_VISITA"] = df_clean["ACTIVIDAD"].apply(
     #     lambda x: "C09" if str(x).strip().upper() == "ACVIS" else "C07"
     # )
 
-    df_clean_datos = df_clean[df_clean["PEDIDO"].notna() & (df_clean["PEDIDO"].str.strip() != "")]
+    df_clean_datos = df_clean[df_clean["PEDIDO"] != ""]
 
     # ============================================================
     # PASO 5) LEER PRIMERAS VISITAS (NUEVOS) Y NORMALIZAR
     # ============================================================
 
     df_vis = pd.read_excel(ruta_visitas, sheet_name=0, dtype=str)
-    df_vis.columns = _norm_headers(df_vis.columns)
 
-    if "PEDIDO" not in df_vis.columns:
-        wb_ans.close()
-        raise ValueError("❌ PLANTILLA_PRIMER VISITAS no tiene columna PEDIDO.")
-
-    df_vis["PEDIDO"] = df_vis["PEDIDO"].astype(str).str.strip().str.upper()
-    df_vis_datos = df_vis[df_vis["PEDIDO"].notna() & (df_vis["PEDIDO"].str.strip() != "")]
-
-    if "SUBZONA" not in df_vis.columns:
-        df_vis["SUBZONA"] = ""
-    if "SUBZONA_ID" in df_vis.columns:
-        map_subzona = {
-            "ORI": "ORIENTE",
-            "MET": "METROPOLITANA",
-            "OCC": "OCCIDENTE",
-            "SUR": "SUROESTE",
-            "ND": "NORDESTE",
-        }
-        df_vis["SUBZONA"] = (
-            df_vis["SUBZONA_ID"].astype(str).str.strip().str.upper().map(map_subzona).fillna("")
-        )
+    # SUBZONA_ID -> SUBZONA y alias de POTENCIA: config/esquema_agpe.yaml -> primer_visitas
+    df_vis = aplicar_esquema(df_vis, "primer_visitas", fuente="PLANTILLA_PRIMER VISITAS")
+
+    df_vis_datos = df_vis[df_vis["PEDIDO"] != ""]
 
     # ============================================================
     # PASO 6) SALIDA TEMPRANA CONTROLADA
     # ============================================================
 
     if df_clean_datos.empty and df_vis_datos.empty:
-        wb_ans.close()
         raise RuntimeError("AGPE_CLEAN y PLANTILLA_PRIMER VISITAS no contienen datos para procesar.")
 
     # ============================================================
     # PASO 7) CONSTRUIR FILAS NUEVAS (SIN TOCAR W, SIN CALENDARIO)
     # ============================================================
 
-    def _blank_row_dict():
-        d = {h: "" for h in headers_ans}
-        for h in COLUMNAS_MIN_CONTROLADAS:
-            if h not in d:
-                d[h] = ""
-        return d
-
-    nuevas_filas = []
+    df_nuevas = _construir_filas_nuevas(df_clean_datos, df_vis_datos, headers_ans)
 
-    for _, row in df_clean_datos.iterrows():
-        pedido = _safe_str(row.get("PEDIDO", "")).upper()
-        if pedido == "":
-            continue
-
-        d = _blank_row_dict()
-        d["PEDIDO"] = pedido
-        d["DIRECCION"] = _safe_str(row.get("DIRECCION", ""))
-        d["MUNICIPIO"] = _safe_str(row.get("MUNICIPIO", ""))
-        d["CLIENTE"] = _safe_str(row.get("CLIENTE", "")).upper()
-        d["SUBZONA"] = _safe_str(row.get("SUBZONA", "")).upper()
-        d["TIPO_VISITA"] = _safe_str(row.get("TIPO_VISITA", ""))
-        d["DETALLE_VISITA"] = _safe_str(row.get("DETALLE_VISITA", "")).upper()
-        if "1RA VISITA" in d["DETALLE_VISITA"]:
-            d["TIPO_VISITA"] = "C07"
-        d["COORDENADAX"] = _safe_str(row.get("COORDENADAX", ""))
-        d["COORDENADAY"] = _safe_str(row.get("COORDENADAY", ""))
-        d["TIPO_MEDIDOR"] = _safe_str(row.get("TIPO_MEDIDOR", ""))
-        d["URBANO_RURAL"] = _safe_str(row.get("URBANO_RURAL", "")).upper()
-        d["FECHA_CAMBIO_ESTADO"] = _safe_str(row.get("FECHA_CAMBIO_ESTADO", ""))
-
-        nuevas_filas.append(d)
-        
-
-    for _, row in df_vis_datos.iterrows():
-        pedido = _safe_str(row.get("PEDIDO", "")).upper()
-        if pedido == "":
-            continue
-
-        d = _blank_row_dict()
-        d["PEDIDO"] = pedido
-        d["DIRECCION"] = _safe_str(row.get("DIRECCION", ""))
-        d["MUNICIPIO"] = _safe_str(row.get("MUNICIPIO", ""))
-        d["CLIENTE"] = _safe_str(row.get("CLIENTE", "")).upper()
-        d["SUBZONA"] = _safe_str(row.get("SUBZONA", "")).upper()
-
-        d["PROMOTOR"] = _safe_str(row.get("PROMOTOR", ""))
-        d["CELULAR"] = _safe_str(row.get("CELULAR", ""))
-        d["FECHA_ATENCION"] = ""
-        d["HORA_VISITA"] = ""
-        d["POTENCIA_AC_KW"] = _safe_str(row.get("POTENCIA_AC_KW", ""))
-
-        d["DETALLE_VISITA"] = _safe_str(row.get("DETALLE_VISITA", "")).upper()
-        d["COORDENADAX"] = _safe_str(row.get("COORDENADAX", ""))
-        d["COORDENADAY"] = _safe_str(row.get("COORDENADAY", ""))
-        d["URBANO_RURAL"] = _safe_str(row.get("URBANO_RURAL", "")).upper()
-        d["TIPO_VISITA"] = _safe_str(row.get("TIPO_VISITA", "")).upper()
-        d["OBSERVACION"] = _safe_str(row.get("OBSERVACION", "")).upper()
-        d["FECHA_CAMBIO_ESTADO"] = _safe_str(row.get("FECHA_CAMBIO_ESTADO", ""))
-
-        nuevas_filas.append(d)
-
-    if not nuevas_filas:
-        wb_ans.close()
+    if df_nuevas.empty:
         raise RuntimeError("No se encontraron pedidos nuevos para agregar (todo ya existe en AGPE_ANS).")
 
-    print(f"✅ Filas NUEVAS a agregar: {len(nuevas_filas)}")
-
     # ============================================================
-    # PASO 8) CARGAR BDPCP Y CONSTRUIR MAPA
+    # PASO 7.1) MODO ACTUALIZAR: REFRESCAR PEDIDOS QUE YA ESTÁN (solo lo que cambió)
     # ============================================================
 
-    bdpcp_map = {}
-    if ruta_bdpcp.exists():
-        df_bdpcp = pd.read_excel(ruta_bdpcp, dtype=str)
-        df_bdpcp.columns = _norm_headers(df_bdpcp.columns)
-
-        # 🔧 ALIAS SEGURO PARA POTENCIA (CORRECCIÓN MÍNIMA)
-        if "POTENCIA_AC_[KW]" in df_bdpcp.columns:
-            df_bdpcp = df_bdpcp.rename(columns={"POTENCIA_AC_[KW]": "POTENCIA_AC_KW"})
-
-        req_bd = ["PEDIDO", "PROMOTOR", "CELULAR", "POTENCIA_AC_KW"]
-        if all(c in df_bdpcp.columns for c in req_bd):
-            df_bdpcp["PEDIDO"] = df_bdpcp["PEDIDO"].astype(str).str.strip().str.upper()
-            for _, r in df_bdpcp.iterrows():
-                p = _safe_str(r.get("PEDIDO", "")).upper()
-                if p:
-                    bdpcp_map[p] = {
-                        "PROMOTOR": _safe_str(r.get("PROMOTOR", "")),
-                        "CELULAR": _safe_str(r.get("CELULAR", "")),
-                        "POTENCIA_AC_KW": _safe_str(r.get("POTENCIA_AC_KW", "")),
-                    }
-
-    # ===== DEBUG TEMPORAL (NO AFECTA LÓGICA) =====
-    print("DEBUG BDPCP keys:", list(bdpcp_map.keys())[:5])
-    print("DEBUG pedido ejemplo:", list(pedidos_historicos)[:5])
-
-    # ============================================================
-    # PASO 8.2) CRUZAR BDPCP TAMBIÉN EN FILAS EXISTENTES (solo llena vacíos)
-    # ============================================================
+    cambios, huellas = [], {}
+    if almacen is not None:
+        df_nuevas, cambios, huellas = _refrescar_existentes(almacen, df_nuevas)
+        print(
+            f"🔄 Pedidos existentes: {len({fila for fila, _, _ in cambios})} con cambios en la fuente, "
+            f"{len(cambios)} celdas a actualizar"
+        )
 
-    if bdpcp_map:
-        idx_prom = _find_col_index_by_header(ws_ans, "PROMOTOR")
-        idx_cel = _find_col_index_by_header(ws_ans, "CELULAR")
-        idx_pot = _find_col_index_by_header(ws_ans, "POTENCIA_AC_KW")
-
-        # Si alguna columna no existe, no rompemos: solo saltamos ese relleno.
-        for r in range(2, ws_ans.max_row + 1):
-            pedido = _safe_str(ws_ans.cell(row=r, column=col_pedido_idx).value).upper()
-            if not pedido or pedido not in bdpcp_map:
-                continue
-
-            if idx_prom:
-                v = _safe_str(ws_ans.cell(row=r, column=idx_prom).value)
-                if v == "":
-                    ws_ans.cell(row=r, column=idx_prom).value = bdpcp_map[pedido].get("PROMOTOR", "")
-
-            if idx_cel:
-                v = _safe_str(ws_ans.cell(row=r, column=idx_cel).value)
-                if v == "":
-                    ws_ans.cell(row=r, column=idx_cel).value = bdpcp_map[pedido].get("CELULAR", "")
-
-            if idx_pot:
-                v = _safe_str(ws_ans.cell(row=r, column=idx_pot).value)
-                if v == "":
-                    ws_ans.cell(row=r, column=idx_pot).value = bdpcp_map[pedido].get("POTENCIA_AC_KW", "")
-    # ============================================================
-    # PASO 8.1) CRUZAR BDPCP EN NUEVAS FILAS (solo llena vacíos)
-    # ============================================================
+    print(f"✅ Filas NUEVAS a agregar: {len(df_nuevas)}")
+    if df_nuevas.empty:
+        return df_nuevas, cambios, huellas
 
-    for d in nuevas_filas:
-        p = _safe_str(d.get("PEDIDO", "")).upper()
-        if p in bdpcp_map:
-            if _safe_str(d.get("PROMOTOR", "")) == "":
-                d["PROMOTOR"] = bdpcp_map[p].get("PROMOTOR", "")
-            if _safe_str(d.get("CELULAR", "")) == "":
-                d["CELULAR"] = bdpcp_map[p].get("CELULAR", "")
-            if _safe_str(d.get("POTENCIA_AC_KW", "")) == "":
-                d["POTENCIA_AC_KW"] = bdpcp_map[p].get("POTENCIA_AC_KW", "")
     # ============================================================
-    # PASO 9) APPEND REAL AL FINAL (SIN BORRAR HISTÓRICO)
+    # PASO 8.1) CRUZAR BDPCP EN NUEVAS FILAS (una consulta por lote, solo llena vacíos)
     # ============================================================
 
-    start_row = ws_ans.max_row + 1
+    df_bdpcp_nuevas = pd.DataFrame(columns=COLUMNAS_BDPCP)
+    if servicio is not None:
+        df_bdpcp_nuevas = servicio.buscar(df_nuevas["PEDIDO"])
 
-    for d in nuevas_filas:
-        row_values = [d.get(h, "") for h in headers_ans]
-        ws_ans.append(row_values)
-
-    end_row = ws_ans.max_row
-    print(f"📌 AGPE_ANS: filas agregadas desde {start_row} hasta {end_row}")
+    df_nuevas = _cruzar_bdpcp(df_nuevas, df_bdpcp_nuevas)
 
     # ============================================================
-    # PASO 9.1) CALCULAR ANS SOLO PARA FILAS NUEVAS
+    # PASO 9) CALCULAR ANS SOLO PARA FILAS NUEVAS
     # ============================================================
 
-    idx_fecha_cambio = _find_col_index_by_header(ws_ans, "FECHA_CAMBIO_ESTADO")
-    idx_detalle = _find_col_index_by_header(ws_ans, "DETALLE_VISITA")
-    idx_fecha_limite = _find_col_index_by_header(ws_ans, "FECHA_LIMITE_ANS")
-    idx_dias_rest = _find_col_index_by_header(ws_ans, "DIAS_RESTANTES")
-    idx_estado = _find_col_index_by_header(ws_ans, "ESTADO_ANS")
-    idx_tipo_visita = _find_col_index_by_header(ws_ans, "TIPO_VISITA")
-
-    if not all([idx_fecha_cambio, idx_detalle, idx_fecha_limite, idx_dias_rest, idx_estado]):
-        wb_ans.close()
-        raise ValueError("❌ Faltan columnas clave para cálculo ANS (U, V, W).")
-    
-    hoy = date.today()
-    bd = CustomBusinessDay()
-
-    for r in range(start_row, end_row + 1):
+    return _calcular_ans_nuevas(df_nuevas), cambios, huellas
 
-        detalle = ws_ans.cell(r, idx_detalle).value
 
-        # 🔧 Regla: si DETALLE_VISITA es 1RA VISITA => TIPO_VISITA = C07
-        detalle_norm = _safe_str(detalle).upper()
-        if "1RA VISITA" in detalle_norm:
-            tipo_visita = "C07"
-            if idx_tipo_visita:
-                ws_ans.cell(r, idx_tipo_visita).value = "C07"
+def _fuente_intacta(ruta, huella):
+    """
+    True si la fuente sigue como cuando se leyó el lote, o ya quedó vacía
+    (solo encabezados; p. ej. corte a mitad de la limpieza).
+    """
+    ruta = Path(ruta)
+    if not ruta.exists():
+        return False
+    return huella_vigente(ruta, huella) or 2 not in leer_inicio_hoja(ruta, filas=2)[0]
 
-        # 🔒 NO TOCAR SI YA EXISTE VALOR (protección absoluta)
-        if _safe_str(ws_ans.cell(r, idx_fecha_limite).value) != "":
-            continue
 
-        fecha_cambio_raw = ws_ans.cell(r, idx_fecha_cambio).value
-        detalle = ws_ans.cell(r, idx_detalle).value
+def _limpiar_fuentes(fuentes):
+    """
+    Vacía las fuentes de un lote ({ruta AGPE_CLEAN: huella, ruta PRIMER VISITAS: huella})
+    que siguen intactas (idempotente: las ya vacías no se reescriben).
+    Devuelve las que cambiaron después de leerse: esas no se tocan.
+    """
+    ruta_clean, ruta_visitas = (Path(r) for r in fuentes)
+    intactas = {Path(r) for r, huella in fuentes.items() if _fuente_intacta(r, huella)}
 
-        if not fecha_cambio_raw:
-            continue
+    if ruta_clean in intactas:
+        _limpiar_excel_dejar_encabezados_xlsx(ruta_clean)
+        vaciar_staging(ruta_clean)
+    if ruta_visitas in intactas:
+        _limpiar_excel_dejar_encabezados_xlsm(ruta_visitas)
+    return [r for r in (ruta_clean, ruta_visitas) if r not in intactas]
 
-        try:
-            fecha_cambio = pd.to_datetime(fecha_cambio_raw)
-        except Exception:
-            continue
 
-        # fallback solo si DETALLE no aplica
-        dias_ans = _dias_ans_por_detalle(detalle)
-        if dias_ans is None:
-            dias_ans = _dias_ans_por_tipo_visita(tipo_visita)
-        if dias_ans is None:
-            continue
+def append_agpe_ans(
+    exportar=True, formulas=False, archivar=False, dias_archivo=DIAS_ARCHIVO_DEFAULT, lotes=None,
+    actualizar=False,
+):
+    """
+    Agrega a AGPE_ANS las filas de AGPE_CLEAN y PLANTILLA PRIMER VISITAS.
+    Las filas se insertan en el almacén SQLite (AGPE_ANS.sqlite); con exportar=True
+    (por defecto) se escriben también en AGPE_ANS.xlsm. Con exportar=False quedan
+    pendientes hasta la próxima exportar_agpe_ans().
+    formulas=True exporta las filas nuevas en modo fórmulas (ver formulas_ans).
+    archivar=True (no es el default) mueve además al archivo los pedidos cerrados
+    de meses que terminaron hace más de `dias_archivo` días; por separado:
+    python -m src.export.archivo_ans.
+    lotes: [(ruta AGPE_CLEAN, ruta PRIMER VISITAS), ...] a agregar en una sola
+    exportación (por defecto, los de data_clean). Si una corrida anterior se
+    cortó, primero se terminan sus lotes (ver diario_lotes en AlmacenANS).
+    actualizar=True: los pedidos que ya tienen fila abierta se refrescan con la
+    foto nueva (solo celdas que cambiaron) en vez de agregarse otra vez.
+    """
+    print("➡️ Iniciando APPEND seguro a AGPE_ANS (sin calendario)")
 
-        # ✅ NUEVA LÓGICA (SOLO AQUÍ)
-        tipo_visita = ws_ans.cell(
-            r,
-            _find_col_index_by_header(ws_ans, "TIPO_VISITA")
-        ).value
+    base_dir = Path(__file__).resolve().parents[2]
+    ruta_clean = base_dir / "data_clean" / "AGPE_CLEAN.xlsx"
+    ruta_visitas = base_dir / "data_clean" / "PLANTILLA_PRIMER VISITAS.xlsm"
+    ruta_ans = base_dir / "data_clean" / "AGPE_ANS.xlsm"
+    ruta_bdpcp = base_dir / "data_clean" / "BDPCP.xlsx"
 
-        # ✅ PRIORIDAD CORRECTA: DETALLE manda
-        dias_ans = _dias_ans_por_detalle(detalle)
+    lotes = [(Path(c), Path(v)) for c, v in lotes] if lotes else [(ruta_clean, ruta_visitas)]
 
-        fecha_limite = fecha_cambio + CustomBusinessDay(n=dias_ans)
-        dias_restantes = (fecha_limite.date() - hoy).days
-        estado = _estado_por_dias_restantes(dias_restantes)
+    if not ruta_ans.exists():
+        raise FileNotFoundError("❌ No existe AGPE_ANS.xlsm")
 
-        ws_ans.cell(r, idx_fecha_limite).value = fecha_limite.to_pydatetime()
-        ws_ans.cell(r, idx_dias_rest).value = dias_restantes
-        ws_ans.cell(r, idx_estado).value = estado
+    # ============================================================
+    # PASO 3.1) ALMACÉN AGPE_ANS (re-importa solo si el .xlsm se editó en Excel)
+    # ============================================================
 
+    almacen = AlmacenANS(ruta_ans)
+    try:
+        almacen.sincronizar()
+        headers_ans = almacen.encabezados
 
+        if "PEDIDO" not in headers_ans:
+            raise ValueError("❌ Encabezados inválidos en AGPE_ANS: falta PEDIDO.")
 
-    # ============================================================
-    # PASO 10) MANTENER TABLA + VALIDACIÓN (SIN TOCAR FORMATO CONDICIONAL)
-    # ============================================================
+        print(f"📌 PEDIDOS Históricos en AGPE_ANS: {almacen.total_pedidos()}")
 
-    _update_or_create_table(ws_ans, table_name="tbl_AGPE_ANS")
-    _ensure_obs_validation(ws_ans, max_row=ws_ans.max_row, formula_range="=validador!$A$1:$A$9")
+        # ============================================================
+        # PASO 3.2) REANUDAR LOTES DE UNA CORRIDA CORTADA (no se vuelven a leer)
+        # ============================================================
 
-    wb_ans.save(ruta_ans)
-    wb_ans.close()
+        en_curso = almacen.lotes_sin_terminar()
+        ya_insertadas = {r for fuentes in en_curso.values() for r in fuentes}
+        for lote, fuentes in en_curso.items():
+            print(f"♻️ Reanudando lote {lote} ya insertado: {', '.join(Path(r).name for r in fuentes)}")
 
-    # ============================================================
-    # PASO 11) LIMPIAR FUENTES (SOLO SI TODO SALIÓ BIEN)
-    # ============================================================
+        lotes = [l for l in lotes if not any(str(r.resolve()) in ya_insertadas for r in l)]
+        for ruta_lote_clean, ruta_lote_visitas in lotes:
+            if not ruta_lote_clean.exists():
+                raise FileNotFoundError(f"❌ No existe {ruta_lote_clean.name}")
+            if not ruta_lote_visitas.exists():
+                raise FileNotFoundError(f"❌ No existe {ruta_lote_visitas.name}")
 
-    _limpiar_excel_dejar_encabezados_xlsx(ruta_clean)
-    _limpiar_excel_dejar_encabezados_xlsm(ruta_visitas)
+        # ============================================================
+        # PASO 8) BDPCP DESDE SU CACHÉ INDEXADA (relee el .xlsx solo si cambió)
+        # ============================================================
 
-    print("✅ APPEND finalizado. AGPE_ANS actualizado, BDPCP cruzado y fuentes limpiadas.")
+        servicio = ServicioBDPCP(ruta_bdpcp) if lotes and ruta_bdpcp.exists() else None
+        try:
+            if servicio is not None:
+                servicio.actualizar()
+                version_bdpcp = servicio.version
+
+                # ============================================================
+                # PASO 8.2) CRUZAR BDPCP TAMBIÉN EN FILAS EXISTENTES (solo llena vacíos)
+                # ============================================================
+
+                # Solo pedidos que siguen incompletos y cuyo dato en BDPCP cambió
+                # desde la última vez que se revisaron (no se recorre el histórico).
+                por_revisar = almacen.pedidos_con_huecos(version_bdpcp)
+                encontrados = servicio.buscar(por_revisar, con_version=True)
+                afectados = encontrados[encontrados["VERSION"] > encontrados.index.map(por_revisar)]
+
+                rellenas = sum(
+                    almacen.rellenar_vacios(col, afectados[col].to_dict()) for col in COLUMNAS_BDPCP
+                )
+                almacen.marcar_revisados(por_revisar, version_bdpcp)
+                print(
+                    f"📌 BDPCP v{version_bdpcp}: {len(por_revisar)} pedidos incompletos revisados, "
+                    f"{rellenas} celdas vacías llenadas en filas existentes"
+                )
+
+            # ============================================================
+            # PASO 9.1) INSERTAR CADA LOTE EN EL ALMACÉN (UNA transacción con su
+            # entrada en el diario, SIN BORRAR HISTÓRICO)
+            # ============================================================
+
+            sin_datos = None
+            for ruta_lote_clean, ruta_lote_visitas in lotes:
+                # Huella ANTES de leer: lo que llegue a la fuente después no se vacía
+                fuentes = {r: huella_archivo(r) for r in (ruta_lote_clean, ruta_lote_visitas)}
+                try:
+                    df_nuevas, cambios, huellas = _filas_de_lote(
+                        ruta_lote_clean, ruta_lote_visitas, headers_ans, servicio,
+                        almacen if actualizar else None,
+                    )
+                except RuntimeError as e:
+                    if len(lotes) == 1 and not en_curso:
+                        raise
+                    print(f"⚠️ Lote {ruta_lote_clean.name} / {ruta_lote_visitas.name} se omite: {e}")
+                    sin_datos = e
+                    continue
+
+                # Refrescos primero: son idempotentes si la corrida se corta antes del insert
+                if cambios:
+                    almacen.actualizar_celdas(cambios)
+                desde, hasta = almacen.insertar(df_nuevas, fuentes=fuentes)
+                if not df_nuevas.empty:
+                    print(f"📌 AGPE_ANS: filas agregadas desde {desde} hasta {hasta}")
+                almacen.guardar_huellas(huellas)
+        finally:
+            if servicio is not None:
+                servicio.cerrar()
+
+        en_curso = almacen.lotes_sin_terminar()
+        if not en_curso:
+            raise sin_datos or RuntimeError("No hay lotes con datos para agregar.")
+
+        # ============================================================
+        # PASO 9.2) ARCHIVAR CERRADOS VIEJOS (por mes completo: mueve filas una vez al mes)
+        # ============================================================
+
+        if archivar:
+            archivar_cerrados(almacen, dias_archivo)
+
+        # ============================================================
+        # PASO 10) EXPORTAR A AGPE_ANS.xlsm (UNA escritura para todos los lotes)
+        # ============================================================
+
+        if exportar:
+            exportar_agpe_ans(almacen, formulas=formulas)
+        else:
+            print("ℹ️ Filas guardadas en el almacén; AGPE_ANS.xlsm se actualiza al exportar.")
+
+        # ============================================================
+        # PASO 11) LIMPIAR FUENTES (SOLO SI TODO SALIÓ BIEN; cada lote sale del diario)
+        # ============================================================
+
+        sin_vaciar = []
+        for lote, fuentes in en_curso.items():
+            cambiadas = _limpiar_fuentes(fuentes)
+            sin_vaciar += cambiadas
+            if cambiadas:
+                print(
+                    f"⚠️ Lote {lote}: {', '.join(r.name for r in cambiadas)} cambió después de leerse "
+                    "y no se vació. Sus filas de este lote ya están en AGPE_ANS: revise la fuente "
+                    "antes del próximo append."
+                )
+            almacen.terminar_lote(lote)
+    finally:
+        almacen.cerrar()
+
+    if sin_vaciar:
+        print("✅ APPEND finalizado. AGPE_ANS actualizado y BDPCP cruzado; revise las fuentes que no se vaciaron.")
+    else:
+        print("✅ APPEND finalizado. AGPE_ANS actualizado, BDPCP cruzado y fuentes limpiadas.")
 
 
 # ============================================================
@@ -0,0 +1,214 @@
+from pathlib import Path
+from datetime import date
+import argparse
+import os
+import pandas as pd
+
+from src.export.almacen_ans import AlmacenANS
+
+
+# ============================================================
+# ARCHIVO DE PEDIDOS CERRADOS (ACTIVO / ARCHIVO)
+# ------------------------------------------------------------
+# Las filas cerradas (FECHA_CIERRE_FENIX con fecha) de meses que terminaron
+# hace más de `dias` salen del almacén y de AGPE_ANS.xlsm y pasan a un
+# Parquet por mes de cierre en data_clean/archivo_ans. Se archiva por mes
+# completo: cada mes se mueve una sola vez y el libro activo queda del
+# tamaño de lo abierto. El almacén recuerda los pedidos archivados
+# (contiene / total_pedidos) y consultar_historico busca en los dos lados.
+# Cada fila archivada lleva FECHA_ARCHIVO (corrida) y FILA_ANS (su fila en
+# el almacén): es su identidad en el Parquet; dos visitas iguales no se funden.
+# ============================================================
+
+DIAS_ARCHIVO_DEFAULT = 90
+COLUMNAS_IDENTIDAD = ["FECHA_ARCHIVO", "FILA_ANS"]
+
+
+def ruta_archivo_default(ruta_ans: Path) -> Path:
+    return Path(ruta_ans).parent / "archivo_ans"
+
+
+def _ruta_mes(carpeta, mes):
+    return Path(carpeta) / f"AGPE_ANS_{mes}.parquet"
+
+
+def _a_texto(df):
+    """
+    Todo como texto (nulos -> None), igual en cada mes para poder unirlos.
+    """
+    df = df.astype(object)
+    return df.where(df.notna(), None).map(lambda v: v if v is None else str(v))
+
+
+def cerrados_para_archivar(almacen, dias=DIAS_ARCHIVO_DEFAULT, hoy=None) -> pd.DataFrame:
+    """
+    Filas cerradas cuyo mes de cierre terminó hace más de `dias` (índice = fila),
+    con la columna MES (AAAA-MM). Los cierres que no son fecha ("sin medidor"...)
+    se quedan en el activo.
+    """
+    hoy = pd.Timestamp(hoy or date.today())
+    limite = (hoy - pd.Timedelta(days=dias)).to_period("M").start_time
+
+    df = almacen.consultar(donde='"FECHA_CIERRE_FENIX" IS NOT NULL')
+    cierre = pd.to_datetime(df["FECHA_CIERRE_FENIX"], errors="coerce", format="ISO8601")
+    viejas = (cierre < limite).to_numpy()
+    return df[viejas].assign(MES=cierre[viejas].dt.strftime("%Y-%m"))
+
+
+def _escribir_mes(carpeta, mes, df):
+    """
+    Agrega `df` al Parquet del mes y lo reemplaza de forma atómica. Se omiten
+    solo las filas cuya identidad (COLUMNAS_IDENTIDAD) ya está en el archivo.
+    """
+    ruta = _ruta_mes(carpeta, mes)
+    if ruta.exists():
+        previo = pd.read_parquet(ruta)
+        if set(COLUMNAS_IDENTIDAD) <= set(previo.columns):
+            ya_escritas = pd.MultiIndex.from_frame(previo[COLUMNAS_IDENTIDAD])
+            df = df[~pd.MultiIndex.from_frame(df[COLUMNAS_IDENTIDAD]).isin(ya_escritas)]
+        df = pd.concat([previo, df], ignore_index=True)
+
+    tmp = ruta.with_suffix(".tmp")
+    try:
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, ruta)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def archivar_cerrados(almacen, dias=DIAS_ARCHIVO_DEFAULT, hoy=None, carpeta=None) -> int:
+    """
+    Mueve al archivo las filas de cerrados_para_archivar. Primero se escriben
+    los Parquet y después salen las filas del almacén: si se corta en medio,
+    la próxima corrida (misma corrida_archivo) las reconoce y no las duplica.
+    El .xlsm queda marcado para regenerarse en la próxima exportar_agpe_ans().
+    Devuelve cuántas filas se archivaron.
+    """
+    if "FECHA_CIERRE_FENIX" not in almacen.encabezados:
+        raise ValueError("❌ AGPE_ANS no tiene columna FECHA_CIERRE_FENIX para archivar.")
+
+    carpeta = Path(carpeta) if carpeta else ruta_archivo_default(almacen.ruta_ans)
+    df = cerrados_para_archivar(almacen, dias, hoy)
+    if df.empty:
+        return 0
+
+    carpeta.mkdir(parents=True, exist_ok=True)
+    corrida = almacen.corrida_archivo()
+    filas_por_mes = {}
+    for mes, grupo in df.groupby("MES"):
+        grupo = grupo.drop(columns="MES").assign(FECHA_ARCHIVO=corrida, FILA_ANS=grupo.index)
+        _escribir_mes(carpeta, mes, _a_texto(grupo))
+        filas_por_mes[mes] = [int(f) for f in grupo.index]
+
+    archivadas = almacen.archivar_filas(filas_por_mes)
+    print(
+        f"🗂️ Archivo AGPE_ANS: {archivadas} filas cerradas movidas a {len(filas_por_mes)} "
+        f"mes(es) ({', '.join(filas_por_mes)})"
+    )
+    return archivadas
+
+
+def _leer_archivo(carpeta, meses, columnas, pedidos, filtros):
+    """
+    Filas del archivo (solo los meses dados, o todos con meses=None) filtradas
+    como en AlmacenANS.consultar.
+    """
+    if meses is None:
+        rutas = sorted(Path(carpeta).glob("AGPE_ANS_*.parquet"))
+    else:
+        rutas = [r for r in (_ruta_mes(carpeta, m) for m in sorted(meses)) if r.exists()]
+
+    partes = []
+    for ruta in rutas:
+        df = pd.read_parquet(ruta)
+        if pedidos is not None:
+            df = df[df["PEDIDO"].fillna("").str.strip().str.upper().isin(pedidos)]
+        for columna, valor in filtros.items():
+            valores = valor if isinstance(valor, (list, tuple, set)) else [valor]
+            df = df[df.reindex(columns=[columna])[columna].isin([str(v) for v in valores])]
+        partes.append(df.reindex(columns=columnas))
+
+    if not partes:
+        return pd.DataFrame(columns=columnas)
+    return pd.concat(partes, ignore_index=True)
+
+
+def consultar_historico(columnas=None, pedidos=None, ruta_ans=None, **filtros) -> pd.DataFrame:
+    """
+    Busca en el activo (almacén) y en el archivo a la vez. Devuelve un DataFrame
+    de texto (nulos -> "") con la columna ORIGEN = ACTIVO / ARCHIVO.
+    pedidos: solo esos PEDIDO (del archivo se leen solo los meses donde están).
+    filtros: COLUMNA=valor o COLUMNA=[valores], como en AlmacenANS.consultar.
+    """
+    base_dir = Path(__file__).resolve().parents[2]
+    ruta_ans = Path(ruta_ans) if ruta_ans else base_dir / "data_clean" / "AGPE_ANS.xlsm"
+
+    almacen = AlmacenANS(ruta_ans)
+    try:
+        almacen.sincronizar()
+        columnas = list(columnas or almacen.encabezados)
+        if pedidos is not None:
+            pedidos = {str(p).strip().upper() for p in pedidos if str(p).strip()}
+            meses = {m for lista in almacen.meses_archivados(pedidos).values() for m in lista}
+            if "PEDIDO" not in columnas:
+                columnas.append("PEDIDO")
+        else:
+            meses = None
+        activo = almacen.consultar(columnas, pedidos=pedidos, **filtros).reset_index(drop=True)
+    finally:
+        almacen.cerrar()
+
+    archivo = _leer_archivo(ruta_archivo_default(ruta_ans), meses, columnas, pedidos, filtros)
+
+    df = pd.concat(
+        [_a_texto(activo).assign(ORIGEN="ACTIVO"), archivo.assign(ORIGEN="ARCHIVO")],
+        ignore_index=True,
+    )
+    return df.fillna("")
+
+
+def archivar_agpe_ans(dias=DIAS_ARCHIVO_DEFAULT, hoy=None, exportar=True):
+    """
+    Archiva los cerrados viejos de AGPE_ANS y (exportar=True) regenera el .xlsm
+    para que quede solo con el activo. Devuelve cuántas filas se archivaron.
+    """
+    from src.export.append_agpe_ans import exportar_agpe_ans
+
+    base_dir = Path(__file__).resolve().parents[2]
+    ruta_ans = base_dir / "data_clean" / "AGPE_ANS.xlsm"
+
+    if not ruta_ans.exists():
+        raise FileNotFoundError("❌ No existe AGPE_ANS.xlsm")
+
+    almacen = AlmacenANS(ruta_ans)
+    try:
+        almacen.sincronizar()
+        archivadas = archivar_cerrados(almacen, dias, hoy)
+        if archivadas == 0:
+            print(f"ℹ️ No hay pedidos cerrados de meses terminados hace más de {dias} días.")
+        if exportar and almacen.requiere_regenerar():
+            exportar_agpe_ans(almacen)
+    finally:
+        almacen.cerrar()
+
+    return archivadas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Mueve los pedidos cerrados viejos de AGPE_ANS al archivo (Parquet por mes de cierre)."
+    )
+    parser.add_argument(
+        "--dias", type=int, default=DIAS_ARCHIVO_DEFAULT,
+        help=f"Archiva los meses de cierre que terminaron hace más de N días (por defecto {DIAS_ARCHIVO_DEFAULT})",
+    )
+    parser.add_argument("--hoy", help="Fecha de referencia AAAA-MM-DD (por defecto, hoy)")
+    parser.add_argument("--sin-exportar", action="store_true", help="Solo actualiza el almacén, no el .xlsm")
+    args = parser.parse_args()
+
+    archivar_agpe_ans(
+        dias=args.dias,
+        hoy=date.fromisoformat(args.hoy) if args.hoy else None,
+        exportar=not args.sin_exportar,
+    )
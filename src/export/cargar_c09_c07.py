@@ -1,5 +1,6 @@
 from pathlib import Path
-from openpyxl import load_workbook
+
+from src.export.parche_xlsx import truncar_a_encabezados
 
 
 def limpiar_plantilla_c09_c07():
@@ -15,22 +16,14 @@ def limpiar_plantilla_c09_c07():
     if not ruta_plantilla.exists():
         raise FileNotFoundError("No existe PLANTILLA C09_C07.xlsx en entrada_diaria")
 
-    print("🧹 Abriendo plantilla C09_C07 (modo seguro)...")
-
-    wb = load_workbook(ruta_plantilla)
-    ws = wb.active
+    print("🧹 Limpiando plantilla C09_C07 (solo la hoja, a nivel XML)...")
 
-    fila_inicio_datos = 2
-    total_filas = ws.max_row
+    # Reescribe solo la hoja activa: encabezados, validaciones y formatos intactos
+    filas_eliminadas = truncar_a_encabezados(ruta_plantilla)
 
-    if total_filas < fila_inicio_datos:
+    if filas_eliminadas == 0:
         print("ℹ️ La plantilla ya está vacía.")
     else:
-        filas_a_eliminar = total_filas - fila_inicio_datos + 1
-        print(f"🧽 Eliminando {filas_a_eliminar} filas de datos...")
-        ws.delete_rows(fila_inicio_datos, filas_a_eliminar)
-
-    wb.save(ruta_plantilla)
-    wb.close()
+        print(f"🧽 Eliminadas {filas_eliminadas} filas de datos.")
 
-    print("✅ Plantilla C09_C07 limpia correctamente (sin afectar validaciones).")
\ No newline at end of file
+    print("✅ Plantilla C09_C07 limpia correctamente (sin afectar validaciones).")
@@ -0,0 +1,130 @@
+from copy import copy
+from openpyxl.utils import get_column_letter
+
+
+# ============================================================
+# ACCESO POR NOMBRE DE COLUMNA A UNA HOJA openpyxl
+# ------------------------------------------------------------
+# Lee la fila de encabezados UNA vez y guarda nombre -> índice / letra.
+# Los nombres se comparan con strip + MAYÚSCULAS ("Tipo Visita" == "TIPO VISITA").
+# Lecturas y escrituras de columna completa sobre un rango de filas.
+# ============================================================
+
+
+def _nombre(v):
+    return "" if v is None else str(v).strip().upper()
+
+
+class ColumnasHoja:
+    """
+    Índice de encabezados de `ws` (fila `fila_encabezado`) con acceso por columna.
+    """
+
+    def __init__(self, ws, fila_encabezado=1):
+        self.ws = ws
+        self.fila_encabezado = fila_encabezado
+        self.primera_fila = fila_encabezado + 1
+        self.indices = {}
+        for celda in ws[fila_encabezado]:
+            nombre = _nombre(celda.value)
+            if nombre and nombre not in self.indices:
+                self.indices[nombre] = celda.column
+        self.letras = {n: get_column_letter(i) for n, i in self.indices.items()}
+
+    def __contains__(self, nombre):
+        return _nombre(nombre) in self.indices
+
+    def indice(self, nombre):
+        return self.indices.get(_nombre(nombre))
+
+    def letra(self, nombre):
+        return self.letras.get(_nombre(nombre))
+
+    @property
+    def ultima_columna(self):
+        return max(self.indices.values(), default=0)
+
+    @property
+    def ultima_letra(self):
+        return get_column_letter(max(self.ws.max_column, 1))
+
+    def agregar_columna(self, nombre, estilo_de=None, ancho=None):
+        """
+        Agrega el encabezado `nombre` al final (copiando el estilo de la columna
+        `estilo_de`, por defecto la anterior) y devuelve su índice.
+        """
+        if nombre in self:
+            return self.indice(nombre)
+
+        columna = self.ws.max_column + 1
+        celda = self.ws.cell(row=self.fila_encabezado, column=columna, value=nombre)
+
+        ref_col = self.indice(estilo_de) if estilo_de else columna - 1
+        if ref_col:
+            ref = self.ws.cell(row=self.fila_encabezado, column=ref_col)
+            celda.font = copy(ref.font)
+            celda.fill = copy(ref.fill)
+            celda.border = copy(ref.border)
+            celda.alignment = copy(ref.alignment)
+            celda.number_format = ref.number_format
+            celda.protection = copy(ref.protection)
+
+        if ancho is not None:
+            self.ws.column_dimensions[celda.column_letter].width = ancho
+
+        self.indices[_nombre(nombre)] = columna
+        self.letras[_nombre(nombre)] = celda.column_letter
+        return columna
+
+    # -------------------------
+    # Columnas completas
+    # -------------------------
+    def _rango(self, desde, hasta):
+        return desde or self.primera_fila, hasta or self.ws.max_row
+
+    def celdas(self, nombre, desde=None, hasta=None):
+        """
+        Celdas de la columna `nombre` entre las filas desde..hasta (por defecto, todos los datos).
+        """
+        idx = self.indice(nombre)
+        if idx is None:
+            return []
+        desde, hasta = self._rango(desde, hasta)
+        if hasta < desde:
+            return []
+        return [f[0] for f in self.ws.iter_rows(min_row=desde, max_row=hasta, min_col=idx, max_col=idx)]
+
+    def leer(self, nombre, desde=None, hasta=None):
+        """
+        Valores de la columna `nombre` (lista, una entrada por fila).
+        """
+        idx = self.indice(nombre)
+        if idx is None:
+            raise KeyError(f"❌ La hoja no tiene la columna {nombre}")
+        desde, hasta = self._rango(desde, hasta)
+        if hasta < desde:
+            return []
+        return [
+            f[0] for f in self.ws.iter_rows(
+                min_row=desde, max_row=hasta, min_col=idx, max_col=idx, values_only=True
+            )
+        ]
+
+    def escribir(self, nombre, valores, desde=None):
+        """
+        Escribe `valores` hacia abajo en la columna `nombre` desde la fila `desde`.
+        """
+        idx = self.indice(nombre)
+        if idx is None:
+            raise KeyError(f"❌ La hoja no tiene la columna {nombre}")
+        fila = desde or self.primera_fila
+        for i, v in enumerate(valores):
+            self.ws.cell(row=fila + i, column=idx).value = v
+        return len(valores)
+
+    def fila_vacia(self, fila) -> bool:
+        """
+        True si todas las celdas de la fila están vacías (None o solo espacios).
+        """
+        valores = next(self.ws.iter_rows(min_row=fila, max_row=fila, values_only=True), ())
+        return all(v is None or str(v).strip() == "" for v in valores)
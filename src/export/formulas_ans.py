@@ -0,0 +1,108 @@
+from datetime import date, datetime
+import pandas as pd
+from openpyxl.utils import get_column_letter
+from openpyxl.workbook.defined_name import DefinedName
+
+from src.calendario_habil import festivos_colombia
+from src.transform.reglas_ans import clasificar_ans, umbrales_estado
+
+
+# ============================================================
+# MODO FÓRMULAS DE AGPE_ANS
+# ------------------------------------------------------------
+# En vez de valores fijos, las filas abiertas llevan fórmulas y Excel
+# recalcula DIAS_RESTANTES / ESTADO_ANS cada vez que se abre el libro:
+#   FECHA_LIMITE_ANS = WORKDAY(fecha cambio, días ANS, FESTIVOS_ANS) + hora
+#   DIAS_RESTANTES   = días calendario hasta FECHA_LIMITE_ANS (desde HOY())
+#   ESTADO_ANS       = IF anidados con los umbrales de config/reglas_ans.yaml
+# FESTIVOS_ANS es una hoja oculta con los festivos de Colombia (mismo
+# calendario que usa Python).
+# ============================================================
+
+NOMBRE_FESTIVOS = "FESTIVOS_ANS"
+
+# Años de festivos en la hoja oculta, relativos al año actual
+ANIOS_FESTIVOS = (-3, 6)
+
+COLUMNAS_FORMULAS = [
+    "FECHA_CIERRE_FENIX",
+    "FECHA_CAMBIO_ESTADO",
+    "DETALLE_VISITA",
+    "TIPO_VISITA",
+    "FECHA_LIMITE_ANS",
+    "DIAS_RESTANTES",
+    "ESTADO_ANS",
+]
+
+
+def es_formula(v) -> bool:
+    return isinstance(v, str) and v.startswith("=")
+
+
+def asegurar_hoja_festivos(wb):
+    """
+    (Re)crea la hoja oculta FESTIVOS_ANS y el nombre definido que usan las fórmulas.
+    """
+    anio = date.today().year
+    festivos = sorted(festivos_colombia(anio + ANIOS_FESTIVOS[0], anio + ANIOS_FESTIVOS[1]))
+
+    if NOMBRE_FESTIVOS in wb.sheetnames:
+        del wb[NOMBRE_FESTIVOS]
+    ws = wb.create_sheet(NOMBRE_FESTIVOS)
+    ws.sheet_state = "hidden"
+    for i, d in enumerate(festivos, start=1):
+        celda = ws.cell(row=i, column=1, value=datetime(d.year, d.month, d.day))
+        celda.number_format = "dd/mm/yyyy"
+
+    ref = f"'{NOMBRE_FESTIVOS}'!$A$1:$A${len(festivos)}"
+    if NOMBRE_FESTIVOS in wb.defined_names:
+        del wb.defined_names[NOMBRE_FESTIVOS]
+    wb.defined_names[NOMBRE_FESTIVOS] = DefinedName(NOMBRE_FESTIVOS, attr_text=ref)
+
+
+def _formula_estado(celda_dias):
+    """
+    ESTADO_ANS como IF anidados (compatibles con cualquier Excel) a partir de los umbrales.
+    """
+    umbrales, sin_dias = umbrales_estado()
+    formula = f'"{sin_dias}"'
+    for hasta, estado in reversed(umbrales):
+        if hasta is None:
+            formula = f'"{estado}"'
+        else:
+            formula = f'IF({celda_dias}<={hasta},"{estado}",{formula})'
+    return f'=IF({celda_dias}="","{sin_dias}",{formula})'
+
+
+def formulas_ans(df, posiciones):
+    """
+    df: filas del almacén (índice = fila, columnas COLUMNAS_FORMULAS).
+    posiciones: encabezado -> número de columna en la hoja.
+    Devuelve cambios (fila, columna, valor) que pasan a fórmulas las filas
+    abiertas con FECHA_LIMITE_ANS. Si FECHA_CAMBIO_ESTADO se puede leer como
+    fecha, se guarda como fecha y FECHA_LIMITE_ANS también pasa a fórmula.
+    """
+    letra = {c: get_column_letter(posiciones[c]) for c in COLUMNAS_FORMULAS}
+
+    cierre = df["FECHA_CIERRE_FENIX"].fillna("").astype(str).str.strip()
+    limite = df["FECHA_LIMITE_ANS"]
+    abiertas = df[(cierre == "") & limite.notna() & ~limite.map(es_formula)]
+    if abiertas.empty:
+        return []
+
+    dias_ans = clasificar_ans(abiertas["DETALLE_VISITA"], abiertas["TIPO_VISITA"])["DIAS_ANS"]
+    fecha_cambio = pd.to_datetime(abiertas["FECHA_CAMBIO_ESTADO"], errors="coerce", format="mixed")
+
+    cambios = []
+    for fila, fecha, n in zip(abiertas.index, fecha_cambio, dias_ans):
+        t, u, v = (f"{letra[c]}{fila}" for c in ("FECHA_CAMBIO_ESTADO", "FECHA_LIMITE_ANS", "DIAS_RESTANTES"))
+
+        if pd.notna(fecha) and pd.notna(n):
+            cambios.append((fila, "FECHA_CAMBIO_ESTADO", fecha.to_pydatetime()))
+            cambios.append(
+                (fila, "FECHA_LIMITE_ANS", f"=WORKDAY(INT({t}),{int(n)},{NOMBRE_FESTIVOS})+MOD({t},1)")
+            )
+
+        cambios.append((fila, "DIAS_RESTANTES", f'=IF({u}="","",INT({u})-TODAY())'))
+        cambios.append((fila, "ESTADO_ANS", _formula_estado(v)))
+    return cambios
@@ -0,0 +1,280 @@
+from pathlib import Path
+import argparse
+import zipfile
+from openpyxl import load_workbook
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.worksheet.cell_range import MultiCellRange
+from openpyxl.worksheet.datavalidation import DataValidation
+from openpyxl.worksheet.table import Table, TableStyleInfo
+
+from src.export.almacen_ans import AlmacenANS
+from src.export.columnas_hoja import ColumnasHoja
+from src.export.parche_xlsx import reemplazo_atomico
+from src.export.staging_agpe_clean import registrar_vista_excel, vista_sin_editar
+
+
+# ============================================================
+# MANTENIMIENTO IDEMPOTENTE DE VALIDACIONES Y TABLAS
+# ------------------------------------------------------------
+# Cada corrida deja UNA validación por columna y UNA tabla por nombre:
+# las existentes se reemplazan en vez de acumularse (el XML de
+# validaciones crecía en cada append y hacía lentos Excel y openpyxl).
+# `compactar` limpia una vez los libros que ya quedaron inflados.
+# ============================================================
+
+ESTILO_TABLA = "TableStyleMedium9"
+
+# Atributos que definen "la misma" validación (para fusionar duplicadas)
+_ATRIBUTOS_VALIDACION = (
+    "type", "operator", "formula1", "formula2", "allow_blank", "showDropDown",
+    "showErrorMessage", "showInputMessage", "errorStyle", "promptTitle", "prompt",
+    "errorTitle", "error",
+)
+
+
+def _quitar_columna(ws, columna):
+    """
+    Saca la columna `columna` (índice) de todas las validaciones; las que
+    quedan sin rango se eliminan.
+    """
+    for dv in list(ws.data_validations.dataValidation):
+        restantes = [r for r in dv.sqref.ranges if not (r.min_col == r.max_col == columna)]
+        if len(restantes) == len(dv.sqref.ranges):
+            continue
+        if restantes:
+            dv.sqref = MultiCellRange([r.coord for r in restantes])
+        else:
+            ws.data_validations.dataValidation.remove(dv)
+
+
+def asegurar_validacion_lista(ws, letra, formula1, desde=2, hasta=None, **textos):
+    """
+    Deja UNA validación de lista en la columna `letra` (filas desde..hasta,
+    por defecto hasta la última fila). Reemplaza las que ya tuviera esa columna.
+    textos: promptTitle / prompt / errorTitle / error.
+    """
+    hasta = hasta or max(ws.max_row, desde)
+    _quitar_columna(ws, column_index_from_string(letra))
+
+    dv = DataValidation(type="list", formula1=formula1, allow_blank=True, showDropDown=False, **textos)
+    ws.add_data_validation(dv)
+    dv.add(f"{letra}{desde}:{letra}{hasta}")
+    return dv
+
+
+def asegurar_tabla(ws, nombre, ref=None):
+    """
+    Deja UNA tabla `nombre` con rango `ref` (por defecto, A1 hasta la última
+    celda usada). Si ya existe solo se actualiza el rango (sin perder formato).
+    """
+    ref = ref or f"A1:{ColumnasHoja(ws).ultima_letra}{ws.max_row}"
+    if nombre in ws.tables:
+        ws.tables[nombre].ref = ref
+        if ws.tables[nombre].autoFilter is not None:
+            ws.tables[nombre].autoFilter.ref = ref
+        return ws.tables[nombre]
+
+    tabla = Table(displayName=nombre, ref=ref)
+    tabla.tableStyleInfo = TableStyleInfo(
+        name=ESTILO_TABLA,
+        showFirstColumn=False,
+        showLastColumn=False,
+        showRowStripes=True,
+        showColumnStripes=False,
+    )
+    ws.add_table(tabla)
+    return tabla
+
+
+def _unir_rangos(rangos):
+    """
+    Une rangos solapados o contiguos que cubren las mismas columnas
+    (B2:B500 + B2:B501 + B502:B600 -> B2:B600).
+    """
+    por_columnas = {}
+    for r in rangos:
+        por_columnas.setdefault((r.min_col, r.max_col), []).append((r.min_row, r.max_row))
+
+    unidos = []
+    for (c1, c2), filas in por_columnas.items():
+        filas.sort()
+        ini, fin = filas[0]
+        for a, b in filas[1:]:
+            if a <= fin + 1:
+                fin = max(fin, b)
+            else:
+                unidos.append((c1, ini, c2, fin))
+                ini, fin = a, b
+        unidos.append((c1, ini, c2, fin))
+
+    return MultiCellRange([
+        f"{get_column_letter(c1)}{f1}:{get_column_letter(c2)}{f2}" for c1, f1, c2, f2 in unidos
+    ])
+
+
+def compactar_validaciones(ws):
+    """
+    Fusiona validaciones con la misma definición en una sola (rangos unidos)
+    y quita las vacías. Devuelve (antes, después).
+    """
+    validaciones = list(ws.data_validations.dataValidation)
+    fusionadas = {}
+    for dv in validaciones:
+        if not dv.sqref.ranges:
+            continue
+        clave = tuple(getattr(dv, a) for a in _ATRIBUTOS_VALIDACION)
+        if clave in fusionadas:
+            fusionadas[clave].sqref = MultiCellRange(
+                list(fusionadas[clave].sqref.ranges) + list(dv.sqref.ranges)
+            )
+        else:
+            fusionadas[clave] = dv
+
+    for dv in fusionadas.values():
+        dv.sqref = _unir_rangos(dv.sqref.ranges)
+    ws.data_validations.dataValidation = list(fusionadas.values())
+    return len(validaciones), len(fusionadas)
+
+
+def _hay_que_compactar(wb, validaciones):
+    """
+    True si alguna hoja tiene validaciones vacías, repetidas o con rangos
+    solapados, o si alguna columna de `validaciones` (hoja activa) tiene más de una.
+    """
+    for ws in wb.worksheets:
+        lista = ws.data_validations.dataValidation
+        claves = [tuple(getattr(dv, a) for a in _ATRIBUTOS_VALIDACION) for dv in lista]
+        if len(set(claves)) < len(claves):
+            return True
+        for dv in lista:
+            rangos = list(dv.sqref.ranges)
+            if not rangos or len(_unir_rangos(rangos).ranges) < len(rangos):
+                return True
+
+    columnas = ColumnasHoja(wb.active)
+    for encabezado, _ in validaciones:
+        letra = columnas.letra(encabezado)
+        if not letra:
+            continue
+        idx = column_index_from_string(letra)
+        en_columna = [
+            dv for dv in wb.active.data_validations.dataValidation
+            if any(r.min_col <= idx <= r.max_col for r in dv.sqref.ranges)
+        ]
+        if len(en_columna) > 1:
+            return True
+    return False
+
+
+def _tiene_validaciones_x14(ruta):
+    """
+    True si alguna hoja trae validaciones x14 (extLst): openpyxl no las conserva al guardar.
+    """
+    with zipfile.ZipFile(ruta) as zf:
+        for nombre in zf.namelist():
+            if nombre.startswith("xl/worksheets/") and nombre.endswith(".xml"):
+                if b"x14:dataValidation" in zf.read(nombre):
+                    return True
+    return False
+
+
+def compactar_libro(ruta, validaciones=()):
+    """
+    Limpia un libro ya inflado: fusiona validaciones duplicadas en todas las
+    hojas y deja una sola por columna para `validaciones` ([(encabezado, fórmula)],
+    en la hoja activa). Devuelve (bytes antes, bytes después, validaciones antes, después),
+    o None si no había nada que compactar (el libro no se toca).
+    """
+    ruta = Path(ruta)
+    if not ruta.exists():
+        raise FileNotFoundError(f"❌ No existe {ruta.name}")
+
+    bytes_antes = ruta.stat().st_size
+    wb = load_workbook(ruta, keep_vba=ruta.suffix.lower() == ".xlsm")
+    try:
+        if not _hay_que_compactar(wb, validaciones):
+            return None
+
+        if _tiene_validaciones_x14(ruta):
+            print(f"⚠️ {ruta.name} tiene validaciones x14 que openpyxl no conserva: se pierden al compactar")
+
+        antes = sum(len(ws.data_validations.dataValidation) for ws in wb.worksheets)
+
+        columnas = ColumnasHoja(wb.active)
+        for encabezado, formula in validaciones:
+            letra = columnas.letra(encabezado)
+            if letra:
+                asegurar_validacion_lista(wb.active, letra, formula)
+
+        despues = sum(compactar_validaciones(ws)[1] for ws in wb.worksheets)
+
+        with reemplazo_atomico(ruta) as tmp:
+            wb.save(tmp)
+    finally:
+        wb.close()
+
+    return bytes_antes, ruta.stat().st_size, antes, despues
+
+
+def compactar(rutas=None):
+    """
+    Compacta AGPE_ANS.xlsm y AGPE_CLEAN.xlsx (o las rutas dadas) e informa los
+    bytes ahorrados (negativo = el libro creció). Los libros sin nada que
+    compactar no se reescriben. Si el almacén / staging estaban al día con el
+    libro, se mantienen al día (la compactación no cambia datos).
+    """
+    base_dir = Path(__file__).resolve().parents[2]
+    ruta_ans = base_dir / "data_clean" / "AGPE_ANS.xlsm"
+    ruta_clean = base_dir / "data_clean" / "AGPE_CLEAN.xlsx"
+    rutas = [Path(r) for r in rutas] if rutas else [ruta_ans, ruta_clean]
+
+    total = 0
+    for ruta in rutas:
+        if not ruta.exists():
+            print(f"⚠️ No existe {ruta.name}, se omite")
+            continue
+
+        if ruta.resolve() == ruta_ans.resolve():
+            almacen = AlmacenANS(ruta)
+            try:
+                al_dia = almacen.vigente()
+                resultado = compactar_libro(ruta, [("OBSERVACION", "=validador!$A$1:$A$9")])
+                if al_dia:
+                    almacen.registrar_huella()
+            finally:
+                almacen.cerrar()
+        elif ruta.resolve() == ruta_clean.resolve():
+            al_dia = vista_sin_editar(ruta)
+            resultado = compactar_libro(ruta)
+            if al_dia:
+                registrar_vista_excel(ruta)
+        else:
+            resultado = compactar_libro(ruta)
+
+        if resultado is None:
+            print(f"ℹ️ {ruta.name}: sin validaciones duplicadas, no se modifica")
+            continue
+
+        antes, despues, dv_antes, dv_despues = resultado
+        total += antes - despues
+        print(
+            f"🧹 {ruta.name}: {antes:,} -> {despues:,} bytes ({_variacion(antes - despues)}), "
+            f"validaciones {dv_antes} -> {dv_despues}"
+        )
+
+    print(f"✅ Compactación terminada: {_variacion(total)}")
+    return total
+
+
+def _variacion(ahorro):
+    if ahorro < 0:
+        return f"creció {-ahorro:,} bytes"
+    return f"{ahorro:,} bytes ahorrados"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compacta libros inflados por validaciones duplicadas (AGPE_ANS / AGPE_CLEAN)."
+    )
+    parser.add_argument("rutas", nargs="*", help="Libros a compactar (por defecto AGPE_ANS.xlsm y AGPE_CLEAN.xlsx)")
+    compactar(parser.parse_args().rutas)
@@ -0,0 +1,736 @@
+from pathlib import Path
+from contextlib import contextmanager
+from datetime import date, datetime, time
+import os
+import posixpath
+import re
+import tempfile
+import zipfile
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.datetime import to_excel
+
+
+# ============================================================
+# PARCHE DE LIBROS .xlsx/.xlsm A NIVEL ZIP/XML
+# ------------------------------------------------------------
+# Sin cargar el libro en openpyxl: se recorre el XML de la hoja por
+# trozos, se insertan/reemplazan solo las <row> afectadas y se ajustan
+# la dimensión, el `ref` de la tabla y los sqref de validación. Las demás
+# partes (vbaProject.bin, estilos, otras hojas...) se copian sin cambios.
+# El libro nuevo se escribe en un temporal y se reemplaza de forma atómica.
+# ============================================================
+
+_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+_TAM_TROZO = 1 << 20
+
+_RE_FILA_R = re.compile(rb'<row\b[^>]*?\sr="(\d+)"')
+_RE_CELDA = re.compile(rb"<c\b[^>]*?(?:/>|>.*?</c>)", re.S)
+_RE_CELDA_R = re.compile(rb'\sr="([A-Z]+)(\d+)"')
+_RE_CELDA_S = re.compile(rb'\ss="(\d+)"')
+_RE_SPANS = re.compile(rb'\sspans="[^"]*"')
+_RE_DIMENSION = re.compile(rb'<dimension\s+ref="([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?"\s*/>')
+_RE_REF_TABLA = re.compile(rb'(<(?:table|autoFilter)\b[^>]*?\sref=")([A-Z]+\d+):([A-Z]+)(\d+)(")')
+_RE_COLS = re.compile(rb"<cols>.*?</cols>|<cols\s*/>", re.S)
+_RE_MODIFICADO = re.compile(rb"(<dcterms:modified\b[^>]*>)[^<]*(</dcterms:modified>)")
+
+# Formatos que openpyxl asigna a fechas/horas sin formato de fecha
+_FORMATOS_FECHA = {datetime: "yyyy-mm-dd h:mm:ss", date: "yyyy-mm-dd", time: "h:mm:ss"}
+
+
+class LibroNoParcheable(ValueError):
+    """
+    El libro no se puede parchear a nivel XML (se debe usar openpyxl).
+    """
+
+
+# ============================================================
+# PARTES DEL PAQUETE
+# ============================================================
+
+def _rels_de(parte):
+    carpeta, nombre = posixpath.split(parte)
+    return posixpath.join(carpeta, "_rels", nombre + ".rels")
+
+
+def _destinos(zf, parte):
+    """
+    Id de relación -> (tipo, parte destino) de `parte`.
+    """
+    ruta_rels = _rels_de(parte)
+    if ruta_rels not in zf.namelist():
+        return {}
+    carpeta = posixpath.dirname(parte)
+    destinos = {}
+    for rel in ET.fromstring(zf.read(ruta_rels)).iter(f"{_NS_PKG}Relationship"):
+        destino = rel.get("Target")
+        destino = destino.lstrip("/") if destino.startswith("/") else posixpath.normpath(posixpath.join(carpeta, destino))
+        destinos[rel.get("Id")] = (rel.get("Type", "").rsplit("/", 1)[-1], destino)
+    return destinos
+
+
+def parte_hoja_activa(zf):
+    """
+    Ruta dentro del zip de la hoja activa (la que openpyxl devuelve como wb.active).
+    """
+    libro = ET.fromstring(zf.read("xl/workbook.xml"))
+    vista = libro.find(f"{_NS}bookViews/{_NS}workbookView")
+    activa = int(vista.get("activeTab", 0)) if vista is not None else 0
+    hojas = libro.findall(f"{_NS}sheets/{_NS}sheet")
+    if not hojas:
+        raise LibroNoParcheable("❌ El libro no tiene hojas")
+    rid = hojas[min(activa, len(hojas) - 1)].get(f"{_NS_REL}id")
+    return _destinos(zf, "xl/workbook.xml")[rid][1]
+
+
+def _cadenas_compartidas(zf, indices):
+    """
+    Solo las cadenas compartidas pedidas (se deja de leer al tenerlas todas).
+    """
+    indices = set(indices)
+    if not indices or "xl/sharedStrings.xml" not in zf.namelist():
+        return {}
+    resultado = {}
+    with zf.open("xl/sharedStrings.xml") as f:
+        i = 0
+        for _, elem in ET.iterparse(f):
+            if elem.tag != f"{_NS}si":
+                continue
+            if i in indices:
+                resultado[i] = "".join(t.text or "" for t in elem.iter(f"{_NS}t"))
+                if len(resultado) == len(indices):
+                    break
+            elem.clear()
+            i += 1
+    return resultado
+
+
+# ============================================================
+# RECORRIDO DE LA HOJA POR TROZOS
+# ============================================================
+
+def _recorrer_hoja(flujo):
+    """
+    Genera ("cabeza", bytes) hasta <sheetData>, luego ("fila", r, bytes) por
+    cada <row> (o ("otro", bytes) para espacios) y al final ("cola", bytes).
+    """
+    buf, pos, fin = b"", 0, False
+
+    def _leer():
+        # Descarta lo ya procesado y agrega el siguiente trozo
+        nonlocal buf, pos, fin
+        trozo = flujo.read(_TAM_TROZO)
+        fin = not trozo
+        buf, pos = buf[pos:] + trozo, 0
+
+    while True:
+        i = buf.find(b"<sheetData")
+        j = buf.find(b">", i) if i >= 0 else -1
+        if j >= 0:
+            break
+        if fin:
+            raise LibroNoParcheable("❌ La hoja no tiene <sheetData>")
+        _leer()
+
+    if buf[j - 1:j + 1] == b"/>":
+        # <sheetData/>: hoja sin filas
+        yield "cabeza", buf[:i] + b"<sheetData>"
+        buf = b"</sheetData>" + buf[j + 1:]
+    else:
+        yield "cabeza", buf[:j + 1]
+        buf = buf[j + 1:]
+
+    while True:
+        if buf.startswith(b"</sheetData>", pos):
+            while not fin:
+                _leer()
+            yield "cola", buf[pos:]
+            return
+
+        if buf.startswith(b"<row", pos):
+            k = buf.find(b">", pos)
+            if k >= 0 and buf[k - 1:k] == b"/":
+                fin_fila = k + 1
+            else:
+                fin_fila = buf.find(b"</row>", pos)
+                fin_fila = fin_fila + len(b"</row>") if fin_fila >= 0 else -1
+            if fin_fila < 0:
+                if fin:
+                    raise LibroNoParcheable("❌ <row> sin cerrar en la hoja")
+                _leer()
+                continue
+            fila = buf[pos:fin_fila]
+            m = _RE_FILA_R.match(fila)
+            if not m:
+                raise LibroNoParcheable("❌ Hay filas sin atributo r en la hoja")
+            yield "fila", int(m.group(1)), fila
+            pos = fin_fila
+            continue
+
+        k = buf.find(b"<", pos)
+        if k > pos:
+            yield "otro", buf[pos:k]
+            pos = k
+            continue
+        if k == pos and len(buf) - pos >= len(b"</sheetData>"):
+            raise LibroNoParcheable(f"❌ Elemento inesperado en sheetData: {buf[pos:pos + 20]!r}")
+        if fin:
+            raise LibroNoParcheable("❌ La hoja termina sin </sheetData>")
+        _leer()
+
+
+def _valor_celda(celda, cadenas):
+    m = re.search(rb'\st="(\w+)"', celda.split(b">", 1)[0])
+    tipo = m.group(1) if m else b"n"
+    if tipo == b"inlineStr":
+        textos = re.findall(rb"<t\b[^>]*>(.*?)</t>", celda, re.S)
+        return ET.fromstring(b"<t>" + b"".join(textos) + b"</t>").text or ""
+    v = re.search(rb"<v>(.*?)</v>", celda, re.S)
+    if v is None:
+        return None
+    texto = ET.fromstring(b"<v>" + v.group(1) + b"</v>").text or ""
+    if tipo == b"s":
+        return cadenas.get(int(texto))
+    return texto
+
+
+def leer_inicio_hoja(ruta, filas=2):
+    """
+    (filas, dimension) de la hoja activa sin cargar el libro: filas es
+    {fila: {columna: valor}} para las primeras `filas` filas (texto tal cual,
+    cadenas compartidas resueltas) y dimension es (última columna, última fila).
+    """
+    with zipfile.ZipFile(ruta) as zf:
+        parte = parte_hoja_activa(zf)
+        crudas, dimension = {}, None
+        with zf.open(parte) as flujo:
+            for tipo, *datos in _recorrer_hoja(flujo):
+                if tipo == "cabeza":
+                    m = _RE_DIMENSION.search(datos[0])
+                    if m:
+                        dimension = (m.group(3) or m.group(1)).decode(), int(m.group(4) or m.group(2))
+                elif tipo == "fila":
+                    r, xml = datos
+                    if r > filas:
+                        break
+                    crudas[r] = _RE_CELDA.findall(xml)
+                elif tipo == "cola":
+                    break
+
+        indices = [
+            int(re.search(rb"<v>(\d+)</v>", c).group(1))
+            for celdas in crudas.values() for c in celdas
+            if b't="s"' in c.split(b">", 1)[0] and b"<v>" in c
+        ]
+        cadenas = _cadenas_compartidas(zf, indices)
+
+    resultado = {}
+    for r, celdas in crudas.items():
+        resultado[r] = {}
+        for c in celdas:
+            col = column_index_from_string(_RE_CELDA_R.search(c).group(1).decode())
+            resultado[r][col] = _valor_celda(c, cadenas)
+    return resultado, dimension
+
+
+# ============================================================
+# ESTILOS (solo para dar formato de fecha a celdas nuevas)
+# ============================================================
+
+class _Estilos:
+    """
+    cellXfs / numFmts de styles.xml; agrega un xf con formato de fecha si hace falta.
+    """
+
+    def __init__(self, xml: bytes):
+        self.xml = xml
+        self.cambiado = False
+        self.formatos = {
+            int(i): ET.fromstring(b"<x a=" + c + b"/>").get("a")
+            for i, c in re.findall(rb'<numFmt\s+numFmtId="(\d+)"\s+formatCode=("[^"]*")', xml)
+        }
+        m = re.search(rb"<cellXfs\b[^>]*>(.*?)</cellXfs>", xml, re.S)
+        if not m:
+            raise LibroNoParcheable("❌ styles.xml sin cellXfs")
+        self.xfs = re.findall(rb"<xf\b[^>]*?(?:/>|>.*?</xf>)", m.group(1), re.S)
+
+    def _codigo(self, num_fmt):
+        return self.formatos.get(num_fmt, BUILTIN_FORMATS.get(num_fmt, "General"))
+
+    def _num_fmt_de(self, s):
+        m = re.search(rb'numFmtId="(\d+)"', self.xfs[s]) if s < len(self.xfs) else None
+        return int(m.group(1)) if m else 0
+
+    def con_fecha(self, s, tipo):
+        """
+        Índice de estilo para una fecha/hora: `s` si ya tiene formato de fecha,
+        si no, una copia de `s` con el formato que usaría openpyxl.
+        """
+        if is_date_format(self._codigo(self._num_fmt_de(s))):
+            return s
+
+        codigo = _FORMATOS_FECHA[tipo]
+        num_fmt = next(
+            (i for i, c in {**BUILTIN_FORMATS, **self.formatos}.items() if c.replace("\\", "") == codigo), None
+        )
+        if num_fmt is None:
+            num_fmt = max([163, *self.formatos]) + 1
+            self.formatos[num_fmt] = codigo
+
+        base = self.xfs[s] if s < len(self.xfs) else b'<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        xf = re.sub(rb'numFmtId="\d+"', f'numFmtId="{num_fmt}"'.encode(), base, count=1)
+        if b"applyNumberFormat" not in xf:
+            xf = xf.replace(b"<xf ", b'<xf applyNumberFormat="1" ', 1)
+        if xf not in self.xfs:
+            self.xfs.append(xf)
+            self.cambiado = True
+        return self.xfs.index(xf)
+
+    def a_xml(self) -> bytes:
+        propios = "".join(
+            f'<numFmt numFmtId="{i}" formatCode="{escape(c, {chr(34): "&quot;"})}"/>'
+            for i, c in sorted(self.formatos.items())
+        ).encode()
+        bloque_fmt = f'<numFmts count="{len(self.formatos)}">'.encode() + propios + b"</numFmts>"
+        xml = self.xml
+        if re.search(rb"<numFmts\b", xml):
+            xml = re.sub(rb"<numFmts\b.*?</numFmts>", lambda _: bloque_fmt, xml, count=1, flags=re.S)
+        elif self.formatos:
+            xml = re.sub(rb"(<styleSheet\b[^>]*>)", lambda m: m.group(1) + bloque_fmt, xml, count=1)
+        bloque_xfs = f'<cellXfs count="{len(self.xfs)}">'.encode() + b"".join(self.xfs) + b"</cellXfs>"
+        return re.sub(rb"<cellXfs\b.*?</cellXfs>", lambda _: bloque_xfs, xml, count=1, flags=re.S)
+
+
+# ============================================================
+# CELDAS Y FILAS
+# ============================================================
+
+def _texto_xml(v):
+    return escape(ILLEGAL_CHARACTERS_RE.sub("", v))
+
+
+def _celda_xml(ref, valor, s, estilos):
+    """
+    XML de una celda (texto como inlineStr, "=..." como fórmula, fechas como serial).
+    """
+    atr_s = lambda s: f' s="{s}"' if s else ""  # noqa: E731
+
+    if valor is None or (isinstance(valor, float) and valor != valor):
+        return f'<c r="{ref}"{atr_s(s)}/>'
+    if isinstance(valor, bool):
+        return f'<c r="{ref}"{atr_s(s)} t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (datetime, date, time)):
+        tipo = datetime if isinstance(valor, datetime) else type(valor)
+        return f'<c r="{ref}"{atr_s(estilos.con_fecha(s or 0, tipo))}><v>{to_excel(valor)}</v></c>'
+    if isinstance(valor, (int, float)):
+        return f'<c r="{ref}"{atr_s(s)}><v>{valor!r}</v></c>'
+
+    valor = str(valor)
+    if valor.startswith("=") and len(valor) > 1:
+        return f'<c r="{ref}"{atr_s(s)}><f>{_texto_xml(valor[1:])}</f></c>'
+    espacio = ' xml:space="preserve"' if valor != valor.strip() else ""
+    return f'<c r="{ref}"{atr_s(s)} t="inlineStr"><is><t{espacio}>{_texto_xml(valor)}</t></is></c>'
+
+
+def _fila_xml(r, celdas, estilos, xml_actual=None):
+    """
+    <row> `r` con `celdas` ({columna: valor}) aplicadas. Si la fila ya existe
+    (`xml_actual`), se conservan sus atributos, sus otras celdas y los estilos.
+    Devuelve (xml, reemplazó_fórmula).
+    """
+    existentes, apertura = {}, f'<row r="{r}">'.encode()
+    if xml_actual is not None:
+        fin = xml_actual.find(b">")
+        apertura = _RE_SPANS.sub(b"", xml_actual[:fin + 1])
+        if apertura.endswith(b"/>"):
+            apertura = apertura[:-2] + b">"
+        for c in _RE_CELDA.findall(xml_actual):
+            existentes[column_index_from_string(_RE_CELDA_R.search(c).group(1).decode())] = c
+
+    con_formula = False
+    for col, valor in celdas.items():
+        actual = existentes.get(col)
+        s = 0
+        if actual is not None:
+            m = _RE_CELDA_S.search(actual.split(b">", 1)[0])
+            s = int(m.group(1)) if m else 0
+            con_formula |= b"<f" in actual
+        existentes[col] = _celda_xml(f"{get_column_letter(col)}{r}", valor, s, estilos).encode()
+
+    return apertura + b"".join(existentes[c] for c in sorted(existentes)) + b"</row>", con_formula
+
+
+def _extender_sqref(xml, letra, hasta):
+    """
+    En sqref="..." y <xm:sqref>: rangos {letra}2:{letra}N pasan a terminar en `hasta`.
+    """
+    patron = re.compile(rb"\b(" + letra.encode() + rb")2:(" + letra.encode() + rb")(\d+)\b")
+
+    def _ajustar(m):
+        return patron.sub(lambda r: b"%s2:%s%d" % (r.group(1), r.group(2), max(int(r.group(3)), hasta)), m.group(0))
+
+    return re.sub(rb'sqref="[^"]*"|<xm:sqref>[^<]*</xm:sqref>', _ajustar, xml)
+
+
+# ============================================================
+# PARCHE DE LA HOJA ACTIVA
+# ============================================================
+
+def _quitar_calc_chain(partes):
+    """
+    Si se reemplazó una celda con fórmula, calcChain.xml queda desfasado: se
+    quita (Excel lo vuelve a armar).
+    """
+    partes.pop("xl/calcChain.xml", None)
+    for nombre, quitar in (
+        ("xl/_rels/workbook.xml.rels", rb"<Relationship\b[^>]*calcChain[^>]*/>"),
+        ("[Content_Types].xml", rb"<Override\b[^>]*calcChain[^>]*/>"),
+    ):
+        if nombre in partes:
+            partes[nombre] = re.sub(quitar, b"", partes[nombre])
+
+
+def _ajustar_dimension(cabeza, max_col, max_fila):
+    def _nueva(m):
+        col = max(column_index_from_string((m.group(3) or m.group(1)).decode()), max_col)
+        fila = max(int(m.group(4) or m.group(2)), max_fila)
+        return b'<dimension ref="%s%s:%s%d"/>' % (m.group(1), m.group(2), get_column_letter(col).encode(), fila)
+
+    return _RE_DIMENSION.sub(_nueva, cabeza, count=1)
+
+
+@contextmanager
+def reemplazo_atomico(ruta, antes_de_reemplazar=None):
+    """
+    Entrega una ruta temporal junto a `ruta`; si el bloque termina sin error,
+    el temporal se sincroniza a disco y reemplaza `ruta` de forma atómica.
+    antes_de_reemplazar(tmp): se llama con el temporal ya en disco (p. ej. para
+    registrar su huella en un diario).
+    """
+    ruta = Path(ruta)
+    fd, tmp = tempfile.mkstemp(prefix=ruta.stem + "_", suffix=ruta.suffix + ".tmp", dir=ruta.parent)
+    os.close(fd)
+    try:
+        yield tmp
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        if antes_de_reemplazar is not None:
+            antes_de_reemplazar(tmp)
+        os.replace(tmp, ruta)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def parchear_hoja(ruta, cambios, tabla=None, columna_validada=None, antes_de_reemplazar=None):
+    """
+    Aplica `cambios` ({fila: {columna: valor}}) a la hoja activa de `ruta`
+    sin cargar el libro en openpyxl. Filas existentes se fusionan celda a
+    celda (conservando estilos), filas nuevas se insertan en orden.
+    tabla: nombre de la tabla cuyo `ref` se extiende hasta la última fila.
+    columna_validada: letra de columna cuyas validaciones {letra}2:{letra}N se extienden.
+    antes_de_reemplazar: ver reemplazo_atomico.
+    Devuelve la última fila de la hoja.
+    """
+    ruta = Path(ruta)
+    pendientes = dict(sorted(cambios.items()))
+    max_col = max((c for celdas in pendientes.values() for c in celdas), default=1)
+    max_fila = max(pendientes, default=1)
+
+    with zipfile.ZipFile(ruta) as zin:
+        parte = parte_hoja_activa(zin)
+        nombres = zin.namelist()
+        if "xl/styles.xml" not in nombres:
+            raise LibroNoParcheable("❌ El libro no tiene styles.xml")
+        estilos = _Estilos(zin.read("xl/styles.xml"))
+
+        partes_tabla = [destino for tipo, destino in _destinos(zin, parte).values() if tipo == "table"]
+        if tabla is not None:
+            partes_tabla = [
+                p for p in partes_tabla
+                if re.search(rb'\sdisplayName="' + re.escape(tabla.encode()) + rb'"', zin.read(p))
+            ]
+            if not partes_tabla:
+                raise LibroNoParcheable(f"❌ La hoja no tiene la tabla {tabla}")
+
+        with reemplazo_atomico(ruta, antes_de_reemplazar) as tmp:
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zout:
+                ultima_fila, con_formula = 0, False
+                partes = {}
+
+                for info in zin.infolist():
+                    if info.filename != parte:
+                        continue
+
+                    # Hoja: se reescribe por trozos (solo cambian las filas afectadas)
+                    destino = zipfile.ZipInfo(parte, date_time=info.date_time)
+                    destino.compress_type = zipfile.ZIP_DEFLATED
+                    with zin.open(info) as flujo, zout.open(destino, "w", force_zip64=True) as salida:
+                        # Se escribe por bloques (comprimir fila por fila es lento)
+                        bloque = bytearray()
+                        for tipo, *datos in _recorrer_hoja(flujo):
+                            if tipo == "cabeza":
+                                bloque += _ajustar_dimension(datos[0], max_col, max_fila)
+                            elif tipo == "otro":
+                                bloque += datos[0]
+                            elif tipo == "fila":
+                                r, xml = datos
+                                while pendientes and next(iter(pendientes)) < r:
+                                    nueva = next(iter(pendientes))
+                                    bloque += _fila_xml(nueva, pendientes.pop(nueva), estilos)[0]
+                                if r in pendientes:
+                                    xml, reemplazo = _fila_xml(r, pendientes.pop(r), estilos, xml)
+                                    con_formula |= reemplazo
+                                ultima_fila = max(ultima_fila, r)
+                                bloque += xml
+                            else:
+                                for nueva, celdas in pendientes.items():
+                                    bloque += _fila_xml(nueva, celdas, estilos)[0]
+                                    ultima_fila = max(ultima_fila, nueva)
+                                pendientes = {}
+                                cola = datos[0]
+                                if columna_validada:
+                                    cola = _extender_sqref(cola, columna_validada, ultima_fila)
+                                bloque += cola
+
+                            if len(bloque) >= _TAM_TROZO:
+                                salida.write(bloque)
+                                bloque.clear()
+                        salida.write(bloque)
+
+                # Partes pequeñas que pueden cambiar
+                for p in partes_tabla:
+                    partes[p] = _RE_REF_TABLA.sub(
+                        lambda m: m.group(1) + m.group(2) + b":" + m.group(3) + str(max(ultima_fila, 2)).encode() + m.group(5),
+                        zin.read(p),
+                    )
+                if estilos.cambiado:
+                    partes["xl/styles.xml"] = estilos.a_xml()
+                if con_formula and "xl/calcChain.xml" in nombres:
+                    for p in ("xl/calcChain.xml", "xl/_rels/workbook.xml.rels", "[Content_Types].xml"):
+                        partes[p] = zin.read(p)
+                    _quitar_calc_chain(partes)
+                    nombres = [n for n in nombres if n != "xl/calcChain.xml"]
+
+                # El resto se copia tal cual (mismo contenido, mismo orden)
+                for info in zin.infolist():
+                    if info.filename == parte or info.filename not in nombres:
+                        continue
+                    contenido = partes.get(info.filename)
+                    zout.writestr(info, contenido if contenido is not None else zin.read(info))
+
+    return ultima_fila
+
+
+# ============================================================
+# VACIAR UNA HOJA DEJANDO LOS ENCABEZADOS
+# ============================================================
+
+def _cola_hoja(flujo):
+    """
+    Lee la hoja buscando </sheetData> sin procesar fila por fila.
+    Devuelve (cantidad de <row>, bytes desde </sheetData> hasta el final).
+    """
+    filas, resto = 0, b""
+    while True:
+        trozo = flujo.read(_TAM_TROZO)
+        if not trozo:
+            raise LibroNoParcheable("❌ La hoja termina sin </sheetData>")
+        ventana = resto + trozo
+        i = ventana.find(b"</sheetData>")
+        # Desde len(resto) - 3 para no contar dos veces un "<row" del trozo anterior
+        filas += ventana.count(b"<row", max(len(resto) - 3, 0), i if i >= 0 else len(ventana))
+        if i >= 0:
+            return filas, ventana[i:] + flujo.read()
+        resto = ventana[-len(b"</sheetData>"):]
+
+
+def truncar_a_encabezados(ruta, filas_encabezado=1):
+    """
+    Deja en la hoja activa de `ruta` solo las `filas_encabezado` primeras filas.
+    Se reescribe únicamente el XML de la hoja (dimensión, filas y `ref` de sus
+    tablas / autofiltro); estilos, validaciones, VBA y demás hojas no cambian.
+    La hoja se descomprime una vez (el zip lo exige), sin procesar fila por fila.
+    Devuelve las filas eliminadas (0 si ya estaba vacía; el libro no se toca).
+    """
+    ruta = Path(ruta)
+
+    with zipfile.ZipFile(ruta) as zin:
+        parte = parte_hoja_activa(zin)
+
+        # 1) Cabeza y encabezados: solo se lee el inicio de la hoja
+        cabeza, encabezado, con_datos = b"", [], False
+        with zin.open(parte) as flujo:
+            for tipo, *datos in _recorrer_hoja(flujo):
+                if tipo == "cabeza":
+                    cabeza = datos[0]
+                elif tipo == "fila" and datos[0] <= filas_encabezado:
+                    encabezado.append(datos[1])
+                elif tipo in ("fila", "cola"):
+                    con_datos = tipo == "fila"
+                    break
+
+        if not con_datos:
+            return 0
+
+        # 2) Cola (validaciones, tabla, márgenes...) y conteo de filas
+        with zin.open(parte) as flujo:
+            total_filas, cola = _cola_hoja(flujo)
+
+        cabeza = _RE_DIMENSION.sub(
+            lambda m: b'<dimension ref="%s%s:%s%d"/>' % (
+                m.group(1), m.group(2), m.group(3) or m.group(1), filas_encabezado
+            ),
+            cabeza,
+            count=1,
+        )
+        # Una tabla necesita al menos una fila de datos (aunque esté vacía)
+        fila_tabla = str(max(filas_encabezado + 1, 2)).encode()
+        ajustar_ref = lambda xml: _RE_REF_TABLA.sub(  # noqa: E731
+            lambda m: m.group(1) + m.group(2) + b":" + m.group(3) + fila_tabla + m.group(5), xml
+        )
+
+        partes = {parte: cabeza + b"".join(encabezado) + ajustar_ref(cola)}
+        for tipo, destino in _destinos(zin, parte).values():
+            if tipo == "table":
+                partes[destino] = ajustar_ref(zin.read(destino))
+
+        # Las fórmulas de las filas borradas dejan calcChain desfasado
+        nombres = zin.namelist()
+        if "xl/calcChain.xml" in nombres:
+            for p in ("xl/calcChain.xml", "xl/_rels/workbook.xml.rels", "[Content_Types].xml"):
+                partes[p] = zin.read(p)
+            _quitar_calc_chain(partes)
+
+        with reemplazo_atomico(ruta) as tmp:
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zout:
+                for info in zin.infolist():
+                    if info.filename == "xl/calcChain.xml" and info.filename not in partes:
+                        continue
+                    contenido = partes.get(info.filename)
+                    zout.writestr(info, contenido if contenido is not None else zin.read(info))
+
+    return total_filas - len(encabezado)
+
+
+# ============================================================
+# LIBRO NUEVO A PARTIR DE UNA PLANTILLA
+# ============================================================
+
+def _cols_xml(anchos):
+    return "<cols>" + "".join(
+        f'<col width="{a}" customWidth="1" min="{i}" max="{i}"/>' for i, a in enumerate(anchos, start=1)
+    ) + "</cols>"
+
+
+def llenar_plantilla(plantilla, ruta, filas, n_filas, anchos=None, tabla=None):
+    """
+    Escribe `ruta` copiando el libro `plantilla` y volcando por streaming
+    `filas` (`n_filas` secuencias de valores, desde la fila 2) en su hoja activa.
+    La plantilla trae el encabezado en la fila 1 y una fila modelo en la fila 2:
+    cada celda de datos toma el estilo de la celda modelo de su columna (las
+    vacías con estilo también se escriben, como hace openpyxl).
+    anchos: ancho por columna (reemplaza <cols>). tabla: nombre de la tabla
+    cuyo `ref` se ajusta a las filas escritas. Devuelve la última fila.
+    """
+    ruta = Path(ruta)
+    ultima_fila = n_filas + 1
+
+    with zipfile.ZipFile(plantilla) as zin:
+        parte = parte_hoja_activa(zin)
+        estilos = _Estilos(zin.read("xl/styles.xml"))
+
+        partes_tabla = [destino for tipo, destino in _destinos(zin, parte).values() if tipo == "table"]
+        if tabla is not None:
+            partes_tabla = [
+                p for p in partes_tabla
+                if re.search(rb'\sdisplayName="' + re.escape(tabla.encode()) + rb'"', zin.read(p))
+            ]
+            if not partes_tabla:
+                raise LibroNoParcheable(f"❌ La plantilla no tiene la tabla {tabla}")
+
+        # Cabeza, encabezado, fila modelo y cola (la plantilla es pequeña)
+        cabeza, encabezado, modelo, cola = b"", b"", {}, b""
+        with zin.open(parte) as flujo:
+            for tipo, *datos in _recorrer_hoja(flujo):
+                if tipo == "cabeza":
+                    cabeza = datos[0]
+                elif tipo == "fila" and datos[0] == 1:
+                    encabezado = datos[1]
+                elif tipo == "fila" and datos[0] == 2:
+                    for c in _RE_CELDA.findall(datos[1]):
+                        m = _RE_CELDA_S.search(c.split(b">", 1)[0])
+                        col = column_index_from_string(_RE_CELDA_R.search(c).group(1).decode())
+                        modelo[col] = int(m.group(1)) if m else 0
+                elif tipo == "cola":
+                    cola = datos[0]
+
+        columnas = [column_index_from_string(_RE_CELDA_R.search(c).group(1).decode()) for c in _RE_CELDA.findall(encabezado)]
+        if not columnas:
+            raise LibroNoParcheable("❌ La plantilla no tiene encabezados en la fila 1")
+        letras = [get_column_letter(c) for c in range(1, max(columnas) + 1)]
+        modelo = [modelo.get(c, 0) for c in range(1, len(letras) + 1)]
+
+        cabeza = _RE_DIMENSION.sub(b'<dimension ref="A1:%s%d"/>' % (letras[-1].encode(), ultima_fila), cabeza, count=1)
+        if anchos is not None:
+            cols = _cols_xml(anchos).encode()
+            if _RE_COLS.search(cabeza):
+                cabeza = _RE_COLS.sub(lambda _: cols, cabeza, count=1)
+            else:
+                cabeza = cabeza.replace(b"<sheetData", cols + b"<sheetData", 1)
+
+        with reemplazo_atomico(ruta) as tmp:
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zout:
+                ahora = datetime.now()
+                destino = zipfile.ZipInfo(parte, date_time=ahora.timetuple()[:6])
+                destino.compress_type = zipfile.ZIP_DEFLATED
+                with zout.open(destino, "w", force_zip64=True) as salida:
+                    bloque = bytearray(cabeza + encabezado)
+                    escritas = 0
+                    for r, valores in enumerate(filas, start=2):
+                        bloque += f'<row r="{r}">'.encode()
+                        bloque += "".join(
+                            _celda_xml(f"{letra}{r}", v, s, estilos)
+                            for letra, s, v in zip(letras, modelo, valores)
+                            if v is not None or s
+                        ).encode()
+                        bloque += b"</row>"
+                        escritas += 1
+                        if len(bloque) >= _TAM_TROZO:
+                            salida.write(bloque)
+                            bloque.clear()
+                    salida.write(bloque + cola)
+
+                if escritas != n_filas:
+                    raise ValueError(f"❌ Se esperaban {n_filas} filas y llegaron {escritas}")
+
+                # Partes pequeñas que cambian; el resto se copia tal cual
+                partes = {}
+                for p in partes_tabla:
+                    partes[p] = _RE_REF_TABLA.sub(
+                        lambda m: m.group(1) + m.group(2) + b":" + m.group(3) + str(max(ultima_fila, 2)).encode() + m.group(5),
+                        zin.read(p),
+                    )
+                if estilos.cambiado:
+                    partes["xl/styles.xml"] = estilos.a_xml()
+                if "docProps/core.xml" in zin.namelist():
+                    partes["docProps/core.xml"] = _RE_MODIFICADO.sub(
+                        lambda m: m.group(1) + ahora.strftime("%Y-%m-%dT%H:%M:%SZ").encode() + m.group(2),
+                        zin.read("docProps/core.xml"),
+                    )
+
+                for info in zin.infolist():
+                    if info.filename == parte:
+                        continue
+                    contenido = partes.get(info.filename)
+                    zout.writestr(info, contenido if contenido is not None else zin.read(info))
+
+    return ultima_fila
@@ -1,63 +1,52 @@
 from pathlib import Path
+import hashlib
+import json
+import os
+import pandas as pd
 from openpyxl import load_workbook
 from openpyxl.worksheet.datavalidation import DataValidation
-from openpyxl.worksheet.table import Table, TableStyleInfo
-from copy import copy
 
+from src.export.columnas_hoja import ColumnasHoja
+from src.export.mantenimiento_excel import asegurar_tabla, asegurar_validacion_lista
+from src.export.parche_xlsx import llenar_plantilla
+from src.export.staging_agpe_clean import leer_agpe_clean, registrar_vista_excel, ruta_staging, vista_sin_editar
 
 
-def preparar_agpe_clean_excel():
-    print("🧩 Aplicando validaciones Excel en AGPE_CLEAN...")
-
-    base_dir = Path(__file__).resolve().parents[2]
-    clean_dir = base_dir / "data_clean"
-    ruta_excel = clean_dir / "AGPE_CLEAN.xlsx"
+# ============================================================
+# FORMATO DE AGPE_CLEAN
+# ------------------------------------------------------------
+# Camino rápido (AGPE_CLEAN sin editar y con staging): el formato se
+# aplica UNA vez a una plantilla (encabezado + fila modelo) que se guarda
+# en data_clean/cache, y los datos del staging se vuelcan en ella por
+# streaming, con anchos calculados sobre el DataFrame.
+# Si el usuario editó el libro, se formatea el libro con openpyxl.
+# ============================================================
 
-    if not ruta_excel.exists():
-        raise FileNotFoundError("❌ No existe AGPE_CLEAN.xlsx")
-
-    wb = load_workbook(ruta_excel)
-    ws = wb.active
+ANCHO_MAX = 45
+VERSION_PLANTILLA = 1  # subir si cambia el formato de _formatear_hoja
 
 
+def _formatear_hoja(wb, ws):
+    """
+    Aplica a la hoja de AGPE_CLEAN la columna Tipo Visita, la hoja LISTAS,
+    validaciones, protección por columna y la tabla (sin anchos de columna).
+    """
     # --------------------------------------------------
     # ✅ ASEGURAR COLUMNA "Tipo Visita" (SI NO EXISTE)
     # --------------------------------------------------
-   # ✅ ASEGURAR COLUMNA "Tipo Visita" (SI NO EXISTE)
-    encabezados = {cell.value: cell.column for cell in ws[1]}
-
-    if "Tipo Visita" not in encabezados:
-        nueva_col = ws.max_column + 1
-
-        celda_nueva = ws.cell(row=1, column=nueva_col)
-        celda_nueva.value = "Tipo Visita"
-
-        # ✅ Copiar estilo del encabezado anterior (para que quede igual: letra negra, fondo, bordes, etc.)
-        celda_ref = ws.cell(row=1, column=nueva_col - 1)
+    # Encabezados leídos UNA vez (nombre -> índice / letra)
+    columnas = ColumnasHoja(ws)
 
-        celda_nueva.font = copy(celda_ref.font)
-        celda_nueva.fill = copy(celda_ref.fill)
-        celda_nueva.border = copy(celda_ref.border)
-        celda_nueva.alignment = copy(celda_ref.alignment)
-        celda_nueva.number_format = celda_ref.number_format
-        celda_nueva.protection = copy(celda_ref.protection)
-
-        # ancho base opcional
-        ws.column_dimensions[celda_nueva.column_letter].width = 12
-
-        # refrescar encabezados para que el resto del script la detecte
-        encabezados = {cell.value: cell.column for cell in ws[1]}
+    # Copia el estilo del encabezado anterior (letra negra, fondo, bordes, etc.), ancho base 12
+    columnas.agregar_columna("Tipo Visita", ancho=12)
 
     # --------------------------------------------------
     # 1️⃣ Buscar columna DETALLE_VISITA
     # --------------------------------------------------
-    encabezados = {cell.value: cell.column for cell in ws[1]}
-
-    if "Detalle Visita" not in encabezados:
+    if "Detalle Visita" not in columnas:
         raise ValueError("❌ No se encontró la columna Detalle Visita")
 
-    col_detalle = encabezados["Detalle Visita"]
-    letra_col = ws.cell(row=1, column=col_detalle).column_letter
+    letra_col = columnas.letra("Detalle Visita")
 
     # --------------------------------------------------
     # 2️⃣ Crear hoja LISTAS (Opción B)
@@ -124,127 +113,46 @@ def preparar_agpe_clean_excel():
     # --------------------------------------------------
     # ✅ VALIDACIÓN: TIPO VISITA (C07, C08, C09)
     # --------------------------------------------------
-    encabezados = {cell.value: cell.column for cell in ws[1]}
-    if "Tipo Visita" in encabezados:
-        col_tv = encabezados["Tipo Visita"]
-        letra_tv = ws.cell(row=1, column=col_tv).column_letter
-
-        dv_tv = DataValidation(
-            type="list",
-            formula1="=LISTAS!$B$2:$B$4",
-            allow_blank=True,
-            showDropDown=False
+    if "Tipo Visita" in columnas:
+        letra_tv = columnas.letra("Tipo Visita")
+
+        # Reemplaza la validación anterior de la columna (no se acumulan)
+        asegurar_validacion_lista(
+            ws, letra_tv, "=LISTAS!$B$2:$B$4", hasta=1048576,
+            promptTitle="Tipo Visita",
+            prompt="Seleccione C07, C08 o C09",
+            errorTitle="Valor no permitido",
+            error="Debe seleccionar un valor válido (C07, C08, C09).",
         )
-        dv_tv.promptTitle = "Tipo Visita"
-        dv_tv.prompt = "Seleccione C07, C08 o C09"
-        dv_tv.errorTitle = "Valor no permitido"
-        dv_tv.error = "Debe seleccionar un valor válido (C07, C08, C09)."
-
-        ws.add_data_validation(dv_tv)
-        dv_tv.add(f"{letra_tv}2:{letra_tv}1048576")
 
 
     # --------------------------------------------------
-    # B3️⃣ Congelar encabezados + ajuste de ancho
+    # B3️⃣ Congelar encabezados (el ancho se calcula aparte)
     # --------------------------------------------------
     ws.freeze_panes = "A2"
 
-    ancho_max = 45
-    for col in ws.columns:
-        max_length = 0
-        col_letter = col[0].column_letter
-
-        for cell in col:
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
-
-        ws.column_dimensions[col_letter].width = min(max_length + 2, ancho_max)
-    
-    # --------------------------------------------------
-    # B4️⃣ Proteger columnas técnicas
-    # --------------------------------------------------
-    columnas_editables = [
-        "Detalle Visita",
-        "Tipo Medidor",
-        "Tipo Visita"
-
-    ]
-
-    encabezados = {cell.value: cell.column for cell in ws[1]}
-
-    # Bloquear todo
-    for row in ws.iter_rows():
-        for cell in row:
-            cell.protection = cell.protection.copy(locked=True)
-
-    # Desbloquear solo columnas permitidas
-    for col_nombre in columnas_editables:
-        if col_nombre in encabezados:
-            col_idx = encabezados[col_nombre]
-            for fila in range(2, ws.max_row + 1):
-                ws.cell(row=fila, column=col_idx).protection = ws.cell(
-                    row=fila, column=col_idx
-                ).protection.copy(locked=False)
-
-    # Permitir seleccionar solo celdas desbloqueadas
-    ws.protection.selectLockedCells = False
-    ws.protection.selectUnlockedCells = True
-
-    # Activar protección
-    # ws.protection.enable()
-
     # --------------------------------------------------
     # B5️⃣ Convertir AGPE_CLEAN en tabla estructurada
     # --------------------------------------------------
-    if ws.tables:
-        ws.tables.clear()
-
-    max_fila = ws.max_row
-    max_col = ws.max_column
-    letra_col_final = ws.cell(row=1, column=max_col).column_letter
-
-    rango_tabla = f"A1:{letra_col_final}{max_fila}"
-
-    tabla = Table(displayName="tbl_AGPE_CLEAN", ref=rango_tabla)
-
-    estilo = TableStyleInfo(
-        name="TableStyleMedium9",
-        showFirstColumn=False,
-        showLastColumn=False,
-        showRowStripes=True,
-        showColumnStripes=False
-    )
-
-    tabla.tableStyleInfo = estilo
-    ws.add_table(tabla)
+    asegurar_tabla(ws, "tbl_AGPE_CLEAN", f"A1:{columnas.ultima_letra}{ws.max_row}")
 
     # --------------------------------------------------
     # B7️⃣ Aplicar VALIDACIÓN DE DATOS (DESPUÉS de la tabla)
     # --------------------------------------------------
 
-    # from openpyxl.worksheet.datavalidation import DataValidation
-
-    validacion = DataValidation(
-        type="list",
-        formula1="=LISTAS!$A$2:$A$10",
-        allow_blank=True,
-        showDropDown=False
+    # Aplicar a toda la columna Detalle Visita (desde fila 2), reemplazando la anterior
+    asegurar_validacion_lista(
+        ws, letra_col, "=LISTAS!$A$2:$A$10", hasta=1048576,
+        promptTitle="Detalle Visita",
+        prompt="Seleccione un valor de la lista",
+        errorTitle="Valor no permitido",
+        error="Debe seleccionar un valor válido.",
     )
 
-    validacion.promptTitle = "Detalle Visita"
-    validacion.prompt = "Seleccione un valor de la lista"
-    validacion.errorTitle = "Valor no permitido"
-    validacion.error = "Debe seleccionar un valor válido."
-
-    ws.add_data_validation(validacion)
-
-    # Aplicar a toda la columna Detalle Visita (desde fila 2)
-    ultima_fila = ws.max_row
-    rango = f"{letra_col}2:{letra_col}1048576"
-    validacion.add(rango)
-
     # --------------------------------------------------
     # B6️⃣ Proteger columnas técnicas (DESPUÉS de la tabla)
+    # Una sola pasada: antes se bloqueaba todo dos veces (B4 y B6) y
+    # quedaba la lista de B6, sin Tipo Visita.
     # --------------------------------------------------
 
     columnas_editables = [
@@ -252,8 +160,6 @@ def preparar_agpe_clean_excel():
         "Tipo Medidor"
     ]
 
-    encabezados = {cell.value: cell.column for cell in ws[1]}
-
     # Bloquear todo
     for row in ws.iter_rows():
         for cell in row:
@@ -261,12 +167,8 @@ def preparar_agpe_clean_excel():
 
     # Desbloquear solo columnas editables
     for col_nombre in columnas_editables:
-        if col_nombre in encabezados:
-            col_idx = encabezados[col_nombre]
-            for fila in range(2, ws.max_row + 1):
-                ws.cell(row=fila, column=col_idx).protection = ws.cell(
-                    row=fila, column=col_idx
-                ).protection.copy(locked=False)
+        for celda in columnas.celdas(col_nombre):
+            celda.protection = celda.protection.copy(locked=False)
 
     # Configurar y activar protección correctamente
     ws.protection.selectLockedCells = False
@@ -278,10 +180,118 @@ def preparar_agpe_clean_excel():
     # --------------------------------------------------
     ws.protection.disable()
 
-    # --------------------------------------------------
-    # 4️⃣ Guardar
-    # --------------------------------------------------
-    wb.save(ruta_excel)
-    wb.close()
 
-    print("✅ Validación Detalle Visita aplicada correctamente")
\ No newline at end of file
+def _autoajustar_anchos(ws):
+    """
+    Ancho de cada columna según su texto más largo (máximo ANCHO_MAX).
+    """
+    for col in ws.columns:
+        max_length = 0
+        col_letter = col[0].column_letter
+
+        for cell in col:
+            if cell.value:
+                max_length = max(max_length, len(str(cell.value)))
+
+        ws.column_dimensions[col_letter].width = min(max_length + 2, ANCHO_MAX)
+
+
+def _anchos_df(df):
+    """
+    Mismos anchos que _autoajustar_anchos, calculados por columna sobre el DataFrame.
+    """
+    largos = df.apply(lambda s: s.dropna().astype(str).str.len().max())
+    return [
+        min(max(len(str(col)), 0 if pd.isna(largo) else int(largo)) + 2, ANCHO_MAX)
+        for col, largo in zip(df.columns, largos)
+    ]
+
+
+def _plantilla(columnas, cache_dir):
+    """
+    Plantilla de AGPE_CLEAN para `columnas` (encabezado + fila modelo ya
+    formateados). Se arma una vez por juego de columnas y se reutiliza.
+    """
+    clave = hashlib.sha1(json.dumps([VERSION_PLANTILLA, list(columnas)]).encode()).hexdigest()[:12]
+    ruta = cache_dir / f"AGPE_CLEAN_plantilla_{clave}.xlsx"
+    if ruta.exists():
+        return ruta
+
+    print("🧩 Armando plantilla de AGPE_CLEAN (una sola vez)...")
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = ruta.with_suffix(".tmp.xlsx")
+
+    try:
+        # Mismo punto de partida que el merge (pandas.to_excel) + fila modelo
+        pd.DataFrame(columns=list(columnas)).to_excel(tmp, index=False)
+        wb = load_workbook(tmp)
+        ws = wb.active
+        for i in range(1, len(columnas) + 1):
+            ws.cell(row=2, column=i, value="-")
+        _formatear_hoja(wb, ws)
+        wb.save(tmp)
+        wb.close()
+        os.replace(tmp, ruta)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return ruta
+
+
+def _generar_desde_staging(ruta_excel):
+    """
+    Reescribe AGPE_CLEAN.xlsx en una pasada: plantilla + filas del staging.
+    """
+    df = pd.read_parquet(ruta_staging(ruta_excel))
+    plantilla = _plantilla(df.columns, ruta_excel.parent / "cache")
+
+    # La plantilla agrega Tipo Visita al final si el staging no la trae
+    if "TIPO VISITA" not in {str(c).strip().upper() for c in df.columns}:
+        df["Tipo Visita"] = None
+    # "" se escribe como celda vacía (igual que openpyxl al guardar)
+    df = df.astype(object)
+    df = df.where(df.notna() & df.ne(""), None)
+
+    llenar_plantilla(
+        plantilla,
+        ruta_excel,
+        df.itertuples(index=False, name=None),
+        len(df),
+        anchos=_anchos_df(df),
+        tabla="tbl_AGPE_CLEAN",
+    )
+
+
+def preparar_agpe_clean_excel():
+    print("🧩 Aplicando validaciones Excel en AGPE_CLEAN...")
+
+    base_dir = Path(__file__).resolve().parents[2]
+    clean_dir = base_dir / "data_clean"
+    ruta_excel = clean_dir / "AGPE_CLEAN.xlsx"
+
+    if not ruta_excel.exists():
+        raise FileNotFoundError("❌ No existe AGPE_CLEAN.xlsx")
+
+    if ruta_staging(ruta_excel).exists() and vista_sin_editar(ruta_excel):
+        # Libro sin editar: se regenera desde el staging (una pasada)
+        _generar_desde_staging(ruta_excel)
+    else:
+        # Libro editado: sus cambios pasan primero al staging (si no, al
+        # registrar la vista preparada quedarían fuera del staging)
+        leer_agpe_clean(ruta_excel)
+
+        wb = load_workbook(ruta_excel)
+        ws = wb.active
+        _formatear_hoja(wb, ws)
+        _autoajustar_anchos(ws)
+
+        # --------------------------------------------------
+        # 4️⃣ Guardar
+        # --------------------------------------------------
+        wb.save(ruta_excel)
+        wb.close()
+
+    # La vista preparada es la referencia "sin editar" del staging
+    registrar_vista_excel(ruta_excel)
+
+    print("✅ Validación Detalle Visita aplicada correctamente")
@@ -0,0 +1,107 @@
+from pathlib import Path
+from datetime import date
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from src.export.almacen_ans import AlmacenANS
+from src.export.append_agpe_ans import exportar_agpe_ans
+from src.export.formulas_ans import es_formula
+from src.transform.reglas_ans import estados_por_dias
+
+
+# ============================================================
+# REFRESCO DIARIO DE ANS
+# ------------------------------------------------------------
+# DIAS_RESTANTES depende de la fecha de hoy, así que cada día queda viejo.
+# Este modo lo recalcula (junto con ESTADO_ANS) para TODAS las filas abiertas
+# (sin FECHA_CIERRE_FENIX) en una pasada vectorizada sobre el almacén y solo
+# escribe las celdas que cambiaron. Las filas cerradas no se tocan.
+# ============================================================
+
+COLUMNAS_REFRESCO = ["FECHA_CIERRE_FENIX", "FECHA_LIMITE_ANS", "DIAS_RESTANTES", "ESTADO_ANS"]
+
+
+def recalcular_ans(df, hoy=None):
+    """
+    df: columnas COLUMNAS_REFRESCO con índice = fila.
+    Devuelve (cambios, abiertas): cambios es la lista de (fila, columna, valor)
+    que difieren de lo guardado; abiertas, cuántas filas se evaluaron.
+    """
+    hoy = np.datetime64(hoy or date.today(), "D")
+
+    cierre = df["FECHA_CIERRE_FENIX"]
+    abierta = (cierre.isna() | (cierre.astype(str).str.strip() == "")).to_numpy()
+
+    # Celdas con fórmula (modo fórmulas): las recalcula Excel, no se tocan
+    con_formula = (df["DIAS_RESTANTES"].map(es_formula) | df["ESTADO_ANS"].map(es_formula)).to_numpy()
+
+    limite = pd.to_datetime(df["FECHA_LIMITE_ANS"], errors="coerce", format="ISO8601")
+    evaluar = abierta & limite.notna().to_numpy() & ~con_formula
+
+    filas = df.index.to_numpy()[evaluar]
+    dias = (limite.to_numpy()[evaluar].astype("datetime64[D]") - hoy).astype(np.int64)
+    estados = estados_por_dias(dias)
+
+    dias_actual = pd.to_numeric(df["DIAS_RESTANTES"], errors="coerce").to_numpy(dtype=float)[evaluar]
+    estado_actual = df["ESTADO_ANS"].fillna("").astype(str).to_numpy()[evaluar]
+
+    cambia_dias = dias_actual != dias  # NaN != n -> True
+    cambia_estado = estado_actual != estados
+
+    cambios = [(int(f), "DIAS_RESTANTES", int(d)) for f, d in zip(filas[cambia_dias], dias[cambia_dias])]
+    cambios += [(int(f), "ESTADO_ANS", e) for f, e in zip(filas[cambia_estado], estados[cambia_estado])]
+    return cambios, int(evaluar.sum())
+
+
+def refrescar_ans(hoy=None, exportar=True):
+    """
+    Recalcula DIAS_RESTANTES y ESTADO_ANS de las filas abiertas de AGPE_ANS.
+    DIAS_RESTANTES sigue siendo en días calendario hasta FECHA_LIMITE_ANS
+    (igual que en el append). Con exportar=True parchea AGPE_ANS.xlsm.
+    Devuelve la cantidad de celdas que cambiaron.
+    """
+    base_dir = Path(__file__).resolve().parents[2]
+    ruta_ans = base_dir / "data_clean" / "AGPE_ANS.xlsm"
+
+    if not ruta_ans.exists():
+        raise FileNotFoundError("❌ No existe AGPE_ANS.xlsm")
+
+    almacen = AlmacenANS(ruta_ans)
+    try:
+        almacen.sincronizar()
+
+        faltan = [c for c in COLUMNAS_REFRESCO if c not in almacen.encabezados]
+        if faltan:
+            raise ValueError(f"❌ Faltan columnas clave para refrescar ANS: {faltan}")
+
+        inicio = time.perf_counter()
+        df = almacen.consultar(COLUMNAS_REFRESCO, donde='"FECHA_LIMITE_ANS" IS NOT NULL')
+        cambios, abiertas = recalcular_ans(df, hoy)
+        almacen.actualizar_celdas(cambios)
+        print(
+            f"🔄 ANS refrescado: {abiertas} filas abiertas, {len(cambios)} celdas cambiaron "
+            f"en {time.perf_counter() - inicio:.2f} s"
+        )
+
+        if exportar and cambios:
+            exportar_agpe_ans(almacen)
+    finally:
+        almacen.cerrar()
+
+    return len(cambios)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Refresca DIAS_RESTANTES y ESTADO_ANS de las filas abiertas de AGPE_ANS."
+    )
+    parser.add_argument("--hoy", help="Fecha de referencia AAAA-MM-DD (por defecto, hoy)")
+    parser.add_argument("--sin-exportar", action="store_true", help="Solo actualiza el almacén, no el .xlsm")
+    args = parser.parse_args()
+
+    refrescar_ans(
+        hoy=date.fromisoformat(args.hoy) if args.hoy else None,
+        exportar=not args.sin_exportar,
+    )
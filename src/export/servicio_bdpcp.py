@@ -0,0 +1,156 @@
+from pathlib import Path
+import hashlib
+import json
+import sqlite3
+import pandas as pd
+
+from src.huella_archivo import huella_archivo, huella_vigente
+from src.transform.esquema import aplicar_esquema
+from src.transform.normalizador_texto import normalizar_texto
+
+
+# ============================================================
+# SERVICIO DE CONSULTA BDPCP
+# ------------------------------------------------------------
+# BDPCP.xlsx se convierte UNA vez a una tabla SQLite con clave PEDIDO
+# (data_clean/cache/BDPCP.sqlite) y solo se vuelve a leer cuando cambia su
+# huella (tamaño/mtime/hash). Cada recarga que cambia datos sube la versión;
+# cada pedido guarda la versión en la que cambió por última vez.
+# ============================================================
+
+COLUMNAS_BDPCP = ["PROMOTOR", "CELULAR", "POTENCIA_AC_KW"]
+
+# Límite de parámetros por consulta IN (...) de SQLite
+_LOTE_SQL = 900
+
+
+def ruta_cache_default(ruta_bdpcp: Path) -> Path:
+    ruta_bdpcp = Path(ruta_bdpcp)
+    return ruta_bdpcp.parent / "cache" / f"{ruta_bdpcp.stem}.sqlite"
+
+
+def mapa_bdpcp(df_bdpcp):
+    """
+    PEDIDO -> PROMOTOR/CELULAR/POTENCIA_AC_KW (si un pedido se repite, gana la última fila).
+    """
+    if not all(c in df_bdpcp.columns for c in ["PEDIDO"] + COLUMNAS_BDPCP):
+        return pd.DataFrame(columns=COLUMNAS_BDPCP)
+
+    mapa = pd.DataFrame(
+        {c: normalizar_texto(df_bdpcp[c], mayusculas=(c == "PEDIDO")) for c in ["PEDIDO"] + COLUMNAS_BDPCP}
+    )
+    mapa = mapa[mapa["PEDIDO"] != ""]
+    return mapa.drop_duplicates("PEDIDO", keep="last").set_index("PEDIDO")
+
+
+class ServicioBDPCP:
+    """
+    Consultas por lote a BDPCP sobre su caché indexada.
+    """
+
+    def __init__(self, ruta_bdpcp: Path, ruta_db: Path | None = None):
+        self.ruta_bdpcp = Path(ruta_bdpcp)
+        self.ruta_db = Path(ruta_db) if ruta_db else ruta_cache_default(self.ruta_bdpcp)
+        self.ruta_db.parent.mkdir(parents=True, exist_ok=True)
+
+        columnas = ", ".join(f"{c.lower()} TEXT" for c in COLUMNAS_BDPCP)
+        self.con = sqlite3.connect(self.ruta_db)
+        self.con.executescript(f"""
+            CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT);
+            CREATE TABLE IF NOT EXISTS bdpcp (
+                pedido TEXT PRIMARY KEY,
+                {columnas},
+                version INTEGER NOT NULL
+            );
+        """)
+
+    # -------------------------
+    # Meta
+    # -------------------------
+    def _leer_meta(self, clave, defecto=None):
+        r = self.con.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return json.loads(r[0]) if r else defecto
+
+    def _guardar_meta(self, clave, valor):
+        self.con.execute(
+            "INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)", (clave, json.dumps(valor))
+        )
+
+    @property
+    def version(self) -> int:
+        return self._leer_meta("version", 0)
+
+    @property
+    def disponible(self) -> bool:
+        return self.ruta_bdpcp.exists()
+
+    # -------------------------
+    # Recarga (solo si BDPCP.xlsx cambió)
+    # -------------------------
+    def actualizar(self) -> bool:
+        """
+        Relee BDPCP.xlsx si su huella cambió. Solo los pedidos nuevos o con
+        valores distintos pasan a la nueva versión. Devuelve True si hubo cambios.
+        """
+        if not self.disponible or huella_vigente(self.ruta_bdpcp, self._leer_meta("huella")):
+            return False
+
+        # Alias de POTENCIA_AC_[KW] y limpieza: config/esquema_agpe.yaml -> bdpcp
+        mapa = mapa_bdpcp(aplicar_esquema(pd.read_excel(self.ruta_bdpcp, dtype=str), "bdpcp"))
+
+        contenido = hashlib.sha256(
+            pd.util.hash_pandas_object(mapa.reset_index(), index=False).to_numpy().tobytes()
+        ).hexdigest()
+        if contenido == self._leer_meta("contenido"):
+            with self.con:
+                self._guardar_meta("huella", huella_archivo(self.ruta_bdpcp))
+            return False
+
+        actuales = {
+            p: tuple(v) for p, *v in self.con.execute(
+                f"SELECT pedido, {', '.join(c.lower() for c in COLUMNAS_BDPCP)} FROM bdpcp"
+            )
+        }
+        version = self.version + 1
+        filas = [
+            (pedido, *valores, version)
+            for pedido, *valores in mapa[COLUMNAS_BDPCP].itertuples(name=None)
+            if actuales.get(pedido) != tuple(valores)
+        ]
+        quitados = [(p,) for p in actuales.keys() - set(mapa.index)]
+
+        marcadores = ", ".join("?" * (2 + len(COLUMNAS_BDPCP)))
+        with self.con:
+            self.con.executemany(f"INSERT OR REPLACE INTO bdpcp VALUES ({marcadores})", filas)
+            self.con.executemany("DELETE FROM bdpcp WHERE pedido = ?", quitados)
+            self._guardar_meta("version", version)
+            self._guardar_meta("contenido", contenido)
+            self._guardar_meta("huella", huella_archivo(self.ruta_bdpcp))
+
+        print(f"📇 BDPCP v{version}: {len(filas)} pedidos nuevos/cambiados, {len(quitados)} retirados")
+        return True
+
+    # -------------------------
+    # Consultas
+    # -------------------------
+    def buscar(self, pedidos, con_version=False) -> pd.DataFrame:
+        """
+        PROMOTOR/CELULAR/POTENCIA_AC_KW para una columna de pedidos, en una llamada.
+        Devuelve un DataFrame con índice PEDIDO normalizado (solo los encontrados).
+        con_version=True agrega VERSION (versión en la que cambió cada pedido).
+        """
+        pedidos = list({str(p).strip().upper() for p in pedidos if p is not None and str(p).strip()})
+        nombres = ["PEDIDO"] + COLUMNAS_BDPCP + (["VERSION"] if con_version else [])
+        columnas = ", ".join(c.lower() for c in nombres[1:])
+
+        filas = []
+        for i in range(0, len(pedidos), _LOTE_SQL):
+            lote = pedidos[i:i + _LOTE_SQL]
+            marcadores = ", ".join("?" * len(lote))
+            filas.extend(self.con.execute(
+                f"SELECT pedido, {columnas} FROM bdpcp WHERE pedido IN ({marcadores})", lote
+            ))
+        return pd.DataFrame(filas, columns=nombres, dtype=object).set_index("PEDIDO")
+
+    def cerrar(self):
+        self.con.close()
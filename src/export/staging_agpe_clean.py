@@ -0,0 +1,153 @@
+from pathlib import Path
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.huella_archivo import huella_archivo, huella_vigente
+
+
+# ============================================================
+# STAGING COLUMNAR DE AGPE_CLEAN
+# ------------------------------------------------------------
+# AGPE_CLEAN.parquet es la copia de trabajo que escribe el merge y lee el append.
+# AGPE_CLEAN.xlsx queda solo como vista editable para el usuario: se guarda su
+# huella al generarla y, si cambió, sus datos se integran de vuelta al parquet.
+# ============================================================
+
+# Columnas de la vista que llena el usuario (Fénix no las trae): un merge nuevo
+# las conserva por Pedido si la vista se editó
+COLUMNAS_USUARIO_CLEAN = ["Detalle Visita", "Tipo Visita", "Tipo Medidor"]
+
+
+def ruta_staging(ruta_xlsx: Path) -> Path:
+    return Path(ruta_xlsx).with_suffix(".parquet")
+
+
+def _ruta_huella_vista(ruta_xlsx: Path) -> Path:
+    ruta_xlsx = Path(ruta_xlsx)
+    return ruta_xlsx.parent / "cache" / f"{ruta_xlsx.stem}_vista.json"
+
+
+def escribir_staging(df: pd.DataFrame, ruta_xlsx: Path):
+    """
+    Escribe el staging columnar (todas las columnas como texto). Se escribe en
+    un temporal que reemplaza al anterior: un corte no deja el staging a medias.
+    """
+    ruta = ruta_staging(ruta_xlsx)
+    tmp = ruta.with_suffix(".parquet.tmp")
+    try:
+        df.astype(object).where(df.notna(), None).to_parquet(tmp, index=False)
+        os.replace(tmp, ruta)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+class EscritorStaging:
+    """
+    Escritura incremental del staging por bloques (modo streaming del merge).
+    """
+
+    def __init__(self, ruta_xlsx: Path, columnas):
+        self.schema = pa.schema([(c, pa.string()) for c in columnas])
+        self.writer = pq.ParquetWriter(ruta_staging(ruta_xlsx), self.schema)
+
+    def escribir(self, df: pd.DataFrame):
+        df = df.astype(object).where(df.notna(), None)
+        self.writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def cerrar(self):
+        self.writer.close()
+
+
+def registrar_vista_excel(ruta_xlsx: Path):
+    """
+    Guarda la huella del AGPE_CLEAN.xlsx recién generado (vista sin editar).
+    Llamar SIEMPRE después de la última escritura de la herramienta sobre el .xlsx.
+    """
+    ruta_huella = _ruta_huella_vista(ruta_xlsx)
+    ruta_huella.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp = ruta_huella.with_suffix(".tmp")
+    tmp.write_text(json.dumps(huella_archivo(ruta_xlsx)), encoding="utf-8")
+    os.replace(tmp, ruta_huella)
+
+
+def vista_sin_editar(ruta_xlsx: Path) -> bool:
+    ruta_huella = _ruta_huella_vista(ruta_xlsx)
+    if not ruta_huella.exists():
+        return False
+    try:
+        huella = json.loads(ruta_huella.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    return huella_vigente(ruta_xlsx, huella)
+
+
+def ediciones_vista(ruta_xlsx: Path) -> pd.DataFrame:
+    """
+    Lo que el usuario llenó en COLUMNAS_USUARIO_CLEAN de un AGPE_CLEAN.xlsx
+    editado (índice = Pedido, "" = sin llenar). Vacío si la vista no existe o
+    sigue como la generó la herramienta.
+    """
+    ruta_xlsx = Path(ruta_xlsx)
+    if not ruta_xlsx.exists() or vista_sin_editar(ruta_xlsx):
+        return pd.DataFrame(columns=COLUMNAS_USUARIO_CLEAN)
+
+    df = pd.read_excel(ruta_xlsx, dtype=str)
+    columnas = [c for c in COLUMNAS_USUARIO_CLEAN if c in df.columns]
+    if "Pedido" not in df.columns or not columnas:
+        return pd.DataFrame(columns=COLUMNAS_USUARIO_CLEAN)
+
+    df = df[["Pedido", *columnas]].fillna("").map(str.strip)
+    df = df[(df["Pedido"] != "") & (df[columnas] != "").any(axis=1)]
+    return df.drop_duplicates("Pedido", keep="last").set_index("Pedido")
+
+
+def conservar_ediciones(df: pd.DataFrame, ediciones: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pasa a `df` (filas del merge) las celdas que el usuario llenó en la vista,
+    por Pedido. Una columna de `ediciones` que el merge no trae se agrega al final.
+    """
+    if ediciones.empty:
+        return df
+
+    df = df.copy()
+    pedidos = df["Pedido"].fillna("").astype(str).str.strip()
+    for col in ediciones.columns:
+        editado = pedidos.map(ediciones[col].replace("", None))
+        actual = df[col] if col in df.columns else pd.Series(None, index=df.index, dtype=object)
+        df[col] = editado.where(editado.notna(), actual)
+    return df
+
+
+def leer_agpe_clean(ruta_xlsx: Path) -> pd.DataFrame:
+    """
+    Lee AGPE_CLEAN para el append:
+    - Staging vigente y Excel sin editar -> parquet (sin parsear XML).
+    - Excel editado por el usuario (o sin staging) -> se lee el .xlsx y sus
+      cambios se integran al staging.
+    """
+    ruta_xlsx = Path(ruta_xlsx)
+    ruta_parquet = ruta_staging(ruta_xlsx)
+
+    if ruta_parquet.exists() and vista_sin_editar(ruta_xlsx):
+        print("📦 AGPE_CLEAN leído desde staging columnar")
+        return pd.read_parquet(ruta_parquet)
+
+    print("✏️ AGPE_CLEAN.xlsx modificado: se integran los cambios al staging")
+    df = pd.read_excel(ruta_xlsx, dtype=str)
+    escribir_staging(df, ruta_xlsx)
+    registrar_vista_excel(ruta_xlsx)
+    return df
+
+
+def vaciar_staging(ruta_xlsx: Path):
+    """
+    Deja el staging sin filas (mismas columnas que la vista) tras un append exitoso.
+    """
+    columnas = list(pd.read_excel(ruta_xlsx, nrows=0).columns)
+    escribir_staging(pd.DataFrame(columns=columnas), ruta_xlsx)
+    registrar_vista_excel(ruta_xlsx)
@@ -1,8 +1,272 @@
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import os
+import re
+import time
+import numpy as np
 import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
 
+from src.extract.manifiesto_ingesta import ManifiestoIngesta
+from src.export.staging_agpe_clean import EscritorStaging, conservar_ediciones, ediciones_vista, escribir_staging, registrar_vista_excel
+from src.transform.esquema import aplicar_esquema, clave_columna, columnas_esquema
+
+
+# Columnas DEFINIDAS del merge C09 + C07 (config/esquema_agpe.yaml -> pendientes)
+COLUMNAS_MERGE = columnas_esquema("pendientes")
+_CLAVES_MERGE = {clave_columna(c): c for c in COLUMNAS_MERGE}
+
+# Filas por bloque en modo streaming (la memoria pico depende de este valor)
+CHUNKSIZE_DEFAULT = 50_000
+
+# Procesos por defecto en modo paralelo (None = todos los núcleos)
+WORKERS_DEFAULT = None
+
+# pendientes_26012026_070624.csv -> 26/01/2026 07:06:24
+_PATRON_SNAPSHOT = re.compile(r"pendientes_(\d{8})_(\d{6})", re.IGNORECASE)
+
+
+def _columna_merge(nombre):
+    """
+    Devuelve el nombre canónico de COLUMNAS_MERGE para un encabezado del CSV, o None.
+    """
+    return _CLAVES_MERGE.get(clave_columna(nombre))
+
+
+def _normalizar_columnas(df):
+    """
+    Renombra a los nombres canónicos, agrega faltantes y deja el orden del merge.
+    """
+    return aplicar_esquema(df, "pendientes")
+
+
+def _leer_csv(archivo, chunksize=None):
+    """
+    Lee SOLO las columnas del merge (poda de columnas en el parser).
+    Con chunksize devuelve un iterador de bloques.
+    """
+    return pd.read_csv(
+        archivo,
+        dtype=str,
+        encoding="latin1",
+        usecols=lambda c: _columna_merge(c) is not None,
+        chunksize=chunksize,
+    )
+
+
+def _procesar_archivo(archivo):
+    """
+    Lee y normaliza un CSV. Se ejecuta en el proceso hijo en modo paralelo,
+    por eso vive a nivel de módulo (debe poder serializarse).
+    """
+    inicio = time.perf_counter()
+    df = _normalizar_columnas(_leer_csv(archivo))
+    return df, time.perf_counter() - inicio
+
+
+def _leer_archivos(archivos, paralelo=False, workers=WORKERS_DEFAULT):
+    """
+    Devuelve los DataFrames normalizados EN EL MISMO ORDEN de `archivos`
+    (salida determinística también en modo paralelo).
+    """
+    if paralelo:
+        n_workers = min(workers or os.cpu_count() or 1, len(archivos))
+        print(f"⚙️ Modo paralelo: {n_workers} procesos")
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            resultados = list(pool.map(_procesar_archivo, archivos))
+    else:
+        resultados = [_procesar_archivo(a) for a in archivos]
+
+    dfs = []
+    for archivo, (df, segundos) in zip(archivos, resultados):
+        print(f"➡️ Leído {archivo.name}: {len(df)} filas en {segundos:.2f} s")
+        dfs.append(df)
+    return dfs
+
+
+def _leer_archivos_incremental(archivos, cache_dir, paralelo=False, workers=WORKERS_DEFAULT):
+    """
+    Igual que _leer_archivos, pero reutiliza del manifiesto los archivos sin cambios
+    y solo lee los nuevos o modificados.
+    """
+    manifiesto = ManifiestoIngesta(cache_dir, firma=COLUMNAS_MERGE)
+
+    cacheados = {}
+    for archivo in archivos:
+        df = manifiesto.cargar_si_vigente(archivo)
+        if df is not None:
+            cacheados[archivo] = df
+
+    por_leer = [a for a in archivos if a not in cacheados]
+    print(f"🗂️ Manifiesto: {len(cacheados)} archivos en caché, {len(por_leer)} por leer")
+
+    leidos = {}
+    if por_leer:
+        for archivo, df in zip(por_leer, _leer_archivos(por_leer, paralelo=paralelo, workers=workers)):
+            manifiesto.registrar(archivo, df)
+            leidos[archivo] = df
+
+    manifiesto.podar(archivos)
+    manifiesto.guardar()
+
+    return [cacheados[a] if a in cacheados else leidos[a] for a in archivos]
+
+
+def _fecha_snapshot(archivo):
+    """
+    Fecha/hora del snapshot según el nombre del archivo (None si no cumple el patrón).
+    """
+    m = _PATRON_SNAPSHOT.search(Path(archivo).name)
+    if not m:
+        return None
+    try:
+        return datetime.strptime(m.group(1) + m.group(2), "%d%m%Y%H%M%S")
+    except ValueError:
+        return None
+
+
+def _ordenar_por_snapshot(archivos):
+    """
+    Del snapshot más antiguo al más reciente (los sin fecha van primero, por nombre).
+    """
+    return sorted(archivos, key=lambda a: (_fecha_snapshot(a) or datetime.min, a.name))
+
+
+def _mascara_ultimo_snapshot(pedidos, origen):
+    """
+    Máscara vectorizada "conservar" para una columna Pedido ya ordenada por snapshot:
+    se queda la ÚLTIMA aparición de cada Pedido (duplicated por hash, keep="last").
+    Los Pedido vacíos no se deduplican. `origen` es el índice de archivo de cada fila.
+    """
+    clave = pedidos.fillna("").str.strip()
+    duplicada = clave.duplicated(keep="last").to_numpy() & (clave != "").to_numpy()
+    return ~duplicada, np.asarray(origen)[duplicada]
+
+
+def _reportar_duplicados(archivos, origen_descartes):
+    descartes = np.bincount(origen_descartes, minlength=len(archivos))
+    for archivo, n in zip(archivos, descartes):
+        if n:
+            print(f"🧮 {archivo.name}: {n} pedidos descartados (hay versión más reciente)")
+    print(f"🧮 Duplicados descartados: {int(descartes.sum())}")
+
+
+def _deduplicar_pedidos(dfs, archivos):
+    """
+    Concatena los snapshots (en orden de fecha) dejando la fila más reciente por Pedido.
+    """
+    df_total = pd.concat(dfs, ignore_index=True)
+    origen = np.repeat(np.arange(len(dfs)), [len(df) for df in dfs])
+
+    conservar, origen_descartes = _mascara_ultimo_snapshot(df_total["Pedido"], origen)
+    _reportar_duplicados(archivos, origen_descartes)
+
+    return df_total[conservar].reset_index(drop=True)
+
+
+def _mascaras_streaming(archivos):
+    """
+    Primera pasada del modo streaming: lee SOLO la columna Pedido de cada archivo
+    y devuelve, por archivo, la máscara de filas a conservar.
+    """
+    pedidos = []
+    for archivo in archivos:
+        df = pd.read_csv(
+            archivo,
+            dtype=str,
+            encoding="latin1",
+            usecols=lambda c: _columna_merge(c) == "Pedido",
+        )
+        pedidos.append(df.iloc[:, 0] if df.shape[1] else pd.Series([""] * len(df), dtype=object))
+
+    largos = [len(p) for p in pedidos]
+    origen = np.repeat(np.arange(len(archivos)), largos)
+    conservar, origen_descartes = _mascara_ultimo_snapshot(
+        pd.concat(pedidos, ignore_index=True), origen
+    )
+    _reportar_duplicados(archivos, origen_descartes)
+
+    return np.split(conservar, np.cumsum(largos)[:-1])
+
+
+def _celdas_encabezado(ws, columnas):
+    # Mismo estilo de encabezado que usa pandas.to_excel
+    lado = Side(style="thin")
+    celdas = []
+    for col in columnas:
+        celda = WriteOnlyCell(ws, value=col)
+        celda.font = Font(bold=True)
+        celda.border = Border(left=lado, right=lado, top=lado, bottom=lado)
+        celda.alignment = Alignment(horizontal="center", vertical="top")
+        celdas.append(celda)
+    return celdas
+
+
+def _escribir_streaming(archivos, output_file, chunksize, deduplicar=True, ediciones=None):
+    """
+    Lee cada CSV por bloques y los va escribiendo en AGPE_CLEAN (openpyxl write-only)
+    y en su staging columnar, sin acumular el total en memoria.
+    Con deduplicar, una primera pasada solo sobre Pedido decide qué filas se conservan.
+    ediciones: celdas del usuario a conservar (ver ediciones_vista).
+    """
+    mascaras = _mascaras_streaming(archivos) if deduplicar else None
+    if ediciones is None:
+        ediciones = pd.DataFrame()
+    columnas = list(conservar_ediciones(pd.DataFrame(columns=COLUMNAS_MERGE), ediciones).columns)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append(_celdas_encabezado(ws, columnas))
+    staging = EscritorStaging(output_file, columnas)
+
+    total = 0
+    try:
+        for i, archivo in enumerate(archivos):
+            print(f"➡️ Leyendo {archivo.name} (streaming, bloques de {chunksize})")
+            inicio_bloque = 0
+            for chunk in _leer_csv(archivo, chunksize=chunksize):
+                if mascaras is not None:
+                    fin_bloque = inicio_bloque + len(chunk)
+                    chunk = chunk[mascaras[i][inicio_bloque:fin_bloque]]
+                    inicio_bloque = fin_bloque
+                chunk = conservar_ediciones(_normalizar_columnas(chunk), ediciones)
+                staging.escribir(chunk)
+                chunk = chunk.astype(object).where(chunk.notna(), None)
+                for fila in chunk.itertuples(index=False, name=None):
+                    ws.append(fila)
+                total += len(chunk)
+    finally:
+        staging.cerrar()
+
+    wb.save(output_file)
+    return total
+
+
+def consolidar_c09_c07(
+    streaming=False,
+    chunksize=CHUNKSIZE_DEFAULT,
+    paralelo=False,
+    workers=WORKERS_DEFAULT,
+    incremental=False,
+    deduplicar=True,
+):
+    """
+    Une los pendientes_*.csv de data_raw en data_clean/AGPE_CLEAN.xlsx.
+
+    streaming=True procesa cada archivo en bloques de `chunksize` filas y
+    escribe de forma incremental (memoria acotada por el bloque).
+    paralelo=True lee los archivos en un pool de `workers` procesos.
+    incremental=True solo lee los archivos nuevos o modificados desde la última
+    corrida (manifiesto + caché en data_clean/cache/ingesta).
+    deduplicar=True deja una sola fila por Pedido: la del snapshot más reciente
+    (fecha/hora del nombre pendientes_DDMMAAAA_HHMMSS.csv).
+    """
+    if streaming and (paralelo or incremental):
+        raise ValueError("❌ El modo streaming no se puede combinar con paralelo ni incremental.")
 
-def consolidar_c09_c07():
     print("📥 Consolidando C09 + C07...")
 
     base_dir = Path(__file__).resolve().parents[2]
@@ -10,49 +274,42 @@ def consolidar_c09_c07():
     clean_dir = base_dir / "data_clean"
     output_file = clean_dir / "AGPE_CLEAN.xlsx"
 
-    archivos = list(raw_dir.glob("pendientes_*.csv"))
+    archivos = _ordenar_por_snapshot(raw_dir.glob("pendientes_*.csv"))
 
     if not archivos:
         raise FileNotFoundError("❌ No se encontraron archivos pendientes_*.csv en data_raw")
 
-    dfs = []
-    for archivo in archivos:
-        print(f"➡️ Leyendo {archivo.name}")
-        df = pd.read_csv(archivo, dtype=str, encoding="latin1")
-        dfs.append(df)
+    clean_dir.mkdir(exist_ok=True)
 
-    df_total = pd.concat(dfs, ignore_index=True)
+    # La vista se reescribe: antes se rescata lo que el usuario llenó en ella
+    ediciones = ediciones_vista(output_file)
+    if not ediciones.empty:
+        print(f"✏️ AGPE_CLEAN.xlsx editado: se conservan las ediciones de {len(ediciones)} pedidos")
 
-    # Columnas DEFINIDAS del merge C09 + C07
-    columnas_merge = [
-        "Pedido",
-        "Tipo_Trabajo",
-        "Fecha_Concepto",
-        "Fecha_Inicio_ANS",
-        "ClienteID",
-        "Nombre_Cliente",
-        "Direccion",
-        "Municipio",
-        "Subzona",
-        "Coordenadax",
-        "Coordenaday",
-        "Actividad",
-        "Tipo_Dirección",
-        "Observación_Solicitud",
-        "Pedido_CRM",
-        "Detalle Visita",
-        "Tipo Medidor"
-    ]
-
-    # Normalizar estructura
-    for col in columnas_merge:
-        if col not in df_total.columns:
-            df_total[col] = ""
-
-    df_total = df_total[columnas_merge]
+    if streaming:
+        total = _escribir_streaming(archivos, output_file, chunksize, deduplicar=deduplicar, ediciones=ediciones)
+        registrar_vista_excel(output_file)
+        print(f"✅ AGPE_CLEAN generado correctamente")
+        print(f"📊 Registros totales: {total}")
+        return
 
-    clean_dir.mkdir(exist_ok=True)
+    inicio = time.perf_counter()
+    if incremental:
+        cache_dir = clean_dir / "cache" / "ingesta"
+        dfs = _leer_archivos_incremental(archivos, cache_dir, paralelo=paralelo, workers=workers)
+    else:
+        dfs = _leer_archivos(archivos, paralelo=paralelo, workers=workers)
+    print(f"⏱️ Lectura total: {time.perf_counter() - inicio:.2f} s")
+
+    if deduplicar:
+        df_total = _deduplicar_pedidos(dfs, archivos)
+    else:
+        df_total = pd.concat(dfs, ignore_index=True)
+    df_total = conservar_ediciones(df_total, ediciones)
+
+    escribir_staging(df_total, output_file)
     df_total.to_excel(output_file, index=False)
+    registrar_vista_excel(output_file)
 
     print(f"✅ AGPE_CLEAN generado correctamente")
-    print(f"📊 Registros totales: {len(df_total)}")
\ No newline at end of file
+    print(f"📊 Registros totales: {len(df_total)}")
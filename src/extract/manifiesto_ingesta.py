@@ -0,0 +1,86 @@
+from pathlib import Path
+import json
+import os
+import pandas as pd
+
+from src.huella_archivo import huella_archivo, huella_vigente
+
+
+class ManifiestoIngesta:
+    """
+    Manifiesto persistente de los pendientes_*.csv ya consolidados.
+
+    Por archivo guarda ruta, tamaño, mtime y hash, y las filas ya normalizadas
+    en un pickle del caché (nombrado por hash de contenido). Así una corrida
+    solo vuelve a leer los archivos nuevos o modificados.
+
+    `firma` describe cómo se normalizaron las filas (p. ej. las columnas del merge):
+    si cambia, todo el caché se descarta.
+    """
+
+    def __init__(self, cache_dir: Path, firma):
+        self.cache_dir = Path(cache_dir)
+        self.ruta_manifiesto = self.cache_dir / "manifest.json"
+        self.firma = list(firma)
+        self.entradas = {}
+
+        if self.ruta_manifiesto.exists():
+            try:
+                datos = json.loads(self.ruta_manifiesto.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                print("⚠️ Manifiesto de ingesta ilegible. Se reconstruye.")
+                datos = {}
+
+            if datos.get("firma") == self.firma:
+                self.entradas = datos.get("archivos", {})
+
+    def _ruta_cache(self, entrada):
+        return self.cache_dir / entrada["cache"]
+
+    def cargar_si_vigente(self, archivo: Path):
+        """
+        Devuelve el DataFrame cacheado si el archivo no cambió; None si hay que leerlo.
+        """
+        entrada = self.entradas.get(archivo.name)
+        if not entrada or not huella_vigente(archivo, entrada):
+            return None
+
+        ruta_cache = self._ruta_cache(entrada)
+        if not ruta_cache.exists():
+            return None
+
+        # El mtime pudo cambiar con el mismo contenido: se refresca para el camino rápido
+        entrada["mtime_ns"] = archivo.stat().st_mtime_ns
+        return pd.read_pickle(ruta_cache)
+
+    def registrar(self, archivo: Path, df: pd.DataFrame):
+        huella = huella_archivo(archivo)
+        entrada = {
+            "ruta": str(archivo),
+            **huella,
+            "cache": f"{huella['sha256']}.pkl",
+            "filas": len(df),
+        }
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        df.to_pickle(self._ruta_cache(entrada))
+        self.entradas[archivo.name] = entrada
+
+    def podar(self, archivos_actuales):
+        """
+        Quita del manifiesto (y del caché) los archivos que ya no están en data_raw.
+        """
+        vigentes = {a.name for a in archivos_actuales}
+        for nombre in list(self.entradas):
+            if nombre in vigentes:
+                continue
+            entrada = self.entradas.pop(nombre)
+            en_uso = any(e["cache"] == entrada["cache"] for e in self.entradas.values())
+            if not en_uso:
+                self._ruta_cache(entrada).unlink(missing_ok=True)
+
+    def guardar(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.ruta_manifiesto.with_suffix(".tmp")
+        datos = {"firma": self.firma, "archivos": self.entradas}
+        tmp.write_text(json.dumps(datos, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.ruta_manifiesto)
@@ -0,0 +1,297 @@
+from pathlib import Path
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+
+PATRON_PENDIENTES = "pendientes_*.csv"
+
+# Eventos inotify (linux/inotify.h)
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_EVENTO = struct.Struct("iIII")
+
+# Un solo merge / preparar a la vez: el vigilante y el panel escriben los
+# mismos AGPE_CLEAN.xlsx, staging y manifiesto
+CANDADO_CONSOLIDACION = threading.Lock()
+
+
+# ============================================================
+# FUENTES DE EVENTOS
+# ============================================================
+
+class _FuenteInotify:
+    """
+    Avisos del kernel (Linux) cuando un archivo se crea, se cierra tras escribir
+    o se mueve dentro de la carpeta.
+    """
+
+    def __init__(self, carpeta: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+
+        mascara = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(self.fd, str(carpeta).encode(), mascara) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch falló")
+
+    def esperar(self, timeout):
+        """
+        Devuelve los nombres de archivo con actividad (espera hasta `timeout` s).
+        """
+        listos, _, _ = select.select([self.fd], [], [], timeout)
+        if not listos:
+            return []
+
+        try:
+            datos = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        nombres = []
+        pos = 0
+        while pos + _EVENTO.size <= len(datos):
+            _, _, _, largo = _EVENTO.unpack_from(datos, pos)
+            pos += _EVENTO.size
+            nombre = datos[pos:pos + largo].rstrip(b"\0").decode(errors="replace")
+            pos += largo
+            if nombre:
+                nombres.append(nombre)
+        return nombres
+
+    def cerrar(self):
+        os.close(self.fd)
+
+
+class _FuenteSondeo:
+    """
+    Alternativa portable (Windows/macOS): revisa la carpeta cada `intervalo` s
+    y reporta los archivos nuevos o con tamaño/mtime distinto.
+    """
+
+    def __init__(self, carpeta: Path, intervalo=2.0):
+        self.carpeta = carpeta
+        self.intervalo = intervalo
+        self.vistos = self._firmas()
+
+    def _firmas(self):
+        firmas = {}
+        for ruta in self.carpeta.glob(PATRON_PENDIENTES):
+            try:
+                st = ruta.stat()
+            except FileNotFoundError:
+                continue
+            firmas[ruta.name] = (st.st_size, st.st_mtime_ns)
+        return firmas
+
+    def esperar(self, timeout):
+        time.sleep(min(timeout, self.intervalo))
+        actuales = self._firmas()
+        cambiados = [n for n, f in actuales.items() if self.vistos.get(n) != f]
+        self.vistos = actuales
+        return cambiados
+
+    def cerrar(self):
+        pass
+
+
+def _crear_fuente(carpeta: Path, intervalo_sondeo):
+    if sys.platform.startswith("linux"):
+        try:
+            return _FuenteInotify(carpeta)
+        except (OSError, AttributeError) as e:
+            print(f"⚠️ inotify no disponible ({e}). Se usa sondeo.")
+    return _FuenteSondeo(carpeta, intervalo=intervalo_sondeo)
+
+
+# ============================================================
+# VIGILANTE
+# ============================================================
+
+def _archivo_estable(ruta: Path, espera):
+    """
+    True si el archivo terminó de escribirse: tamaño y mtime no cambian
+    durante `espera` segundos y se puede abrir para lectura.
+    """
+    try:
+        st1 = ruta.stat()
+        time.sleep(espera)
+        st2 = ruta.stat()
+        if (st1.st_size, st1.st_mtime_ns) != (st2.st_size, st2.st_mtime_ns):
+            return False
+        with open(ruta, "rb"):
+            pass
+        return True
+    except OSError:
+        return False
+
+
+class LoteAplazado(Exception):
+    """
+    El lote no se puede procesar todavía; el vigilante lo reintenta sin perder sus archivos.
+    """
+
+
+def _abierto_en_excel(ruta: Path) -> bool:
+    """
+    True si hay archivo de bloqueo de Excel (~$...) o LibreOffice (.~lock...#) junto al libro.
+    """
+    ruta = Path(ruta)
+    candados = (f"~${ruta.name}", f"~${ruta.name[2:]}", f".~lock.{ruta.name}#")
+    return any((ruta.parent / nombre).exists() for nombre in candados)
+
+
+def revisar_vista_clean(ruta_clean: Path | None = None) -> bool:
+    """
+    Llamar antes de que un lote reescriba AGPE_CLEAN.xlsx.
+    - Abierto en Excel: LoteAplazado (lo que no se guardó se perdería).
+    - Editado y guardado: el merge conserva las ediciones (ver ediciones_vista).
+    Devuelve True si la vista tiene ediciones del usuario.
+    """
+    from src.export.staging_agpe_clean import vista_sin_editar
+
+    if ruta_clean is None:
+        ruta_clean = Path(__file__).resolve().parents[2] / "data_clean" / "AGPE_CLEAN.xlsx"
+    ruta_clean = Path(ruta_clean)
+    if not ruta_clean.exists():
+        return False
+
+    if _abierto_en_excel(ruta_clean):
+        raise LoteAplazado(f"{ruta_clean.name} está abierto en Excel: guárdelo y ciérrelo para consolidar el lote.")
+    return not vista_sin_editar(ruta_clean)
+
+
+def _procesar_lote_default(archivos):
+    from src.extract.consolidar_c09_c07 import consolidar_c09_c07
+    from src.export.preparar_agpe_clean_excel import preparar_agpe_clean_excel
+
+    revisar_vista_clean()
+    consolidar_c09_c07(incremental=True)
+    preparar_agpe_clean_excel()
+
+
+class VigilanteDataRaw:
+    """
+    Vigila data_raw y, cuando llegan pendientes_*.csv nuevos, corre la
+    consolidación incremental UNA vez por ráfaga de archivos.
+
+    - debounce: segundos sin eventos nuevos antes de procesar la ráfaga.
+    - estabilidad: segundos que el archivo debe quedar quieto (escritura terminada).
+    - al_procesar(archivos): callback por lote (por defecto merge incremental + preparar);
+      corre con CANDADO_CONSOLIDACION tomado.
+    - al_error(excepcion): callback si el lote falla (el vigilante sigue activo).
+      Un LoteAplazado se avisa una vez y el lote se reintenta en cada ventana.
+    """
+
+    def __init__(
+        self,
+        carpeta: Path | None = None,
+        al_procesar=None,
+        al_error=None,
+        debounce=5.0,
+        estabilidad=1.0,
+        intervalo_sondeo=2.0,
+    ):
+        if carpeta is None:
+            carpeta = Path(__file__).resolve().parents[2] / "data_raw"
+        self.carpeta = Path(carpeta)
+        self.al_procesar = al_procesar or _procesar_lote_default
+        self.al_error = al_error
+        self.debounce = debounce
+        self.estabilidad = estabilidad
+        self.intervalo_sondeo = intervalo_sondeo
+
+        self._detener = threading.Event()
+        self._hilo = None
+
+    @property
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self):
+        if self.activo:
+            return
+        if not self.carpeta.exists():
+            raise FileNotFoundError(f"❌ No existe la carpeta {self.carpeta}")
+
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="vigilante-data-raw", daemon=True)
+        self._hilo.start()
+        print(f"👁️ Vigilando {self.carpeta} ({PATRON_PENDIENTES})")
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=self.debounce + self.estabilidad + 5)
+        self._hilo = None
+        print("⏹️ Vigilancia de data_raw detenida")
+
+    def _bucle(self):
+        fuente = _crear_fuente(self.carpeta, self.intervalo_sondeo)
+        pendientes = {}
+        ultimo_evento = 0.0
+        aplazado = False
+
+        try:
+            while not self._detener.is_set():
+                for nombre in fuente.esperar(timeout=1.0):
+                    if fnmatch.fnmatch(nombre.lower(), PATRON_PENDIENTES):
+                        pendientes[nombre] = self.carpeta / nombre
+                        ultimo_evento = time.monotonic()
+
+                if not pendientes or time.monotonic() - ultimo_evento < self.debounce:
+                    continue
+
+                listos = [
+                    r for r in pendientes.values()
+                    if r.exists() and _archivo_estable(r, self.estabilidad)
+                ]
+                for r in list(pendientes.values()):
+                    if not r.exists():
+                        pendientes.pop(r.name)
+                if not listos or len(listos) < len(pendientes):
+                    # Aún hay archivos escribiéndose: se espera otra ventana completa
+                    ultimo_evento = time.monotonic()
+                    continue
+
+                pendientes.clear()
+                if not aplazado:
+                    print(f"📂 Lote detectado: {', '.join(r.name for r in listos)}")
+                try:
+                    with CANDADO_CONSOLIDACION:
+                        self.al_procesar(listos)
+                    aplazado = False
+                except LoteAplazado as e:
+                    # Los archivos vuelven a pendientes: se reintenta tras otra ventana
+                    pendientes.update((r.name, r) for r in listos)
+                    ultimo_evento = time.monotonic()
+                    if not aplazado:
+                        print(f"⏸️ Lote aplazado: {e}")
+                        if self.al_error:
+                            self.al_error(e)
+                    aplazado = True
+                except Exception as e:
+                    print(f"❌ Error procesando lote de data_raw: {e}")
+                    if self.al_error:
+                        self.al_error(e)
+        finally:
+            fuente.cerrar()
+
+
+if __name__ == "__main__":
+    vigilante = VigilanteDataRaw()
+    vigilante.iniciar()
+    try:
+        while vigilante.activo:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        vigilante.detener()
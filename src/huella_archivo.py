@@ -0,0 +1,48 @@
+# src/huella_archivo.py
+from pathlib import Path
+import hashlib
+
+
+def calcular_sha256(ruta: Path, bloque: int = 1 << 20) -> str:
+    """
+    Hash SHA-256 del contenido del archivo (lectura por bloques).
+    """
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for trozo in iter(lambda: f.read(bloque), b""):
+            h.update(trozo)
+    return h.hexdigest()
+
+
+def huella_archivo(ruta: Path) -> dict:
+    """
+    Huella de un archivo: tamaño, mtime (ns) y hash de contenido.
+    """
+    st = Path(ruta).stat()
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": calcular_sha256(ruta),
+    }
+
+
+def huella_vigente(ruta: Path, huella: dict | None) -> bool:
+    """
+    True si el archivo no cambió respecto a `huella`.
+    - Camino rápido: mismo tamaño y mtime -> no se lee el archivo.
+    - Si solo cambió el mtime (copia, touch), se confirma con el hash.
+    """
+    if not huella:
+        return False
+
+    ruta = Path(ruta)
+    if not ruta.exists():
+        return False
+
+    st = ruta.stat()
+    if st.st_size != huella.get("size"):
+        return False
+    if st.st_mtime_ns == huella.get("mtime_ns"):
+        return True
+
+    return calcular_sha256(ruta) == huella.get("sha256")
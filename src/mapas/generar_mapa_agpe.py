@@ -16,9 +16,10 @@ def generar_mapa_leaflet_agpe():
     ruta_html = ruta_output / "mapa_visitas_leaflet.html"
 
     # --------------------------------------------------
-    # LEER EXCEL
+    # LEER AGPE_ANS (almacén SQLite; el .xlsm solo si se editó en Excel)
     # --------------------------------------------------
-    df = pd.read_excel(ruta_excel, dtype=str).fillna("")
+    from src.export.almacen_ans import leer_agpe_ans
+    df = leer_agpe_ans(ruta_excel)
 
     # --------------------------------------------------
     # NORMALIZAR COORDENADAS (coma -> punto)
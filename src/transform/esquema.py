@@ -0,0 +1,130 @@
+# src/transform/esquema.py
+from functools import lru_cache
+import pandas as pd
+import yaml
+
+from src.base_path import get_resource_path
+from src.transform.normalizador_texto import normalizar_encabezados, normalizar_texto
+
+
+RUTA_ESQUEMA = "config/esquema_agpe.yaml"
+
+
+# ============================================================
+# ENCABEZADOS
+# ============================================================
+
+def clave_columna(nombre):
+    """
+    Clave de comparación de encabezados: solo letras/dígitos ASCII en mayúscula.
+    Tolera encabezados latin1 mal decodificados:
+    "Tipo_Dirección", "Tipo_Direcci�n" y "Tipo_DirecciÃ³n" -> "TIPODIRECCIN".
+    """
+    return "".join(ch for ch in str(nombre).upper() if ch.isascii() and ch.isalnum())
+
+
+# ============================================================
+# REGISTRO
+# ============================================================
+
+@lru_cache(maxsize=None)
+def _cargar_registro():
+    ruta = get_resource_path(RUTA_ESQUEMA)
+    with open(ruta, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def obtener_esquema(nombre):
+    esquemas = _cargar_registro()["esquemas"]
+    if nombre not in esquemas:
+        raise KeyError(f"❌ Esquema no definido en {RUTA_ESQUEMA}: {nombre}")
+    return esquemas[nombre]
+
+
+def columnas_esquema(nombre):
+    return list(obtener_esquema(nombre)["columnas"])
+
+
+# ============================================================
+# APLICACIÓN
+# ============================================================
+
+def _texto(serie, opciones):
+    ops = opciones.get("texto") or []
+    prefijo = opciones.get("quitar_prefijo")
+    if not ops and not prefijo:
+        return serie
+
+    return normalizar_texto(
+        serie,
+        strip="strip" in ops,
+        mayusculas="mayusculas" in ops,
+        reparar="reparar" in ops,
+        sin_tildes="sin_tildes" in ops,
+        quitar_prefijo=prefijo,
+    )
+
+
+def _renombrar(df, esquema):
+    canonicas = list(esquema["columnas"])
+
+    if esquema.get("encabezados") == "clave":
+        por_clave = {clave_columna(c): c for c in canonicas}
+        nuevos = [por_clave.get(clave_columna(c), c) for c in df.columns]
+    else:
+        alias = {k: v for k, v in (esquema.get("alias") or {}).items()}
+        nuevos = [alias.get(c, c) for c in normalizar_encabezados(df.columns)]
+
+    df = df.set_axis(nuevos, axis=1)
+    # Si dos encabezados caen en el mismo nombre canónico, manda el primero
+    return df.loc[:, ~df.columns.duplicated()].copy()
+
+
+def aplicar_esquema(df, nombre, fuente=None):
+    """
+    Aplica el esquema `nombre` a un DataFrame recién leído:
+    encabezados -> alias -> columnas faltantes -> texto/valores, una pasada por columna.
+    Lanza ValueError si faltan columnas requeridas.
+    """
+    esquema = obtener_esquema(nombre)
+    df = _renombrar(df, esquema)
+
+    faltantes = []
+    for col, opciones in esquema["columnas"].items():
+        opciones = opciones or {}
+        desde = opciones.get("desde")
+
+        if desde and desde["columna"] in df.columns:
+            mapa = desde.get("valores") or {}
+            df[col] = _texto(df[desde["columna"]], opciones).map(mapa).fillna("")
+            continue
+
+        if col not in df.columns:
+            if "defecto" in opciones:
+                df[col] = opciones["defecto"]
+            elif opciones.get("requerida"):
+                faltantes.append(col)
+            continue
+
+        s = _texto(df[col], opciones)
+        if opciones.get("valores"):
+            s = s.replace(opciones["valores"])
+        df[col] = s
+
+    if faltantes:
+        raise ValueError(f"❌ Columnas faltantes en {fuente or nombre}: {faltantes}")
+
+    if esquema.get("recortar"):
+        df = df[list(esquema["columnas"])]
+
+    return df
+
+
+def alinear_encabezados(df, columnas_destino):
+    """
+    Renombra las columnas de `df` a las de `columnas_destino` cuando coinciden
+    por clave (mismo criterio tolerante a tildes/latin1 que el merge).
+    """
+    por_clave = {clave_columna(c): c for c in columnas_destino}
+    df = df.rename(columns=lambda c: por_clave.get(clave_columna(c), c))
+    return df.loc[:, ~df.columns.duplicated()]
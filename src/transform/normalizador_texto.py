@@ -0,0 +1,112 @@
+# src/transform/normalizador_texto.py
+import unicodedata
+import numpy as np
+import pandas as pd
+
+
+# ============================================================
+# TABLAS PRECOMPILADAS
+# ============================================================
+
+# Tildes/diéresis/eñe más comunes -> ASCII (camino rápido, sin NFKD)
+_TABLA_SIN_TILDES = str.maketrans(
+    "ÁÉÍÓÚÀÈÌÒÙÄËÏÖÜÂÊÎÔÛÃÕÑÇáéíóúàèìòùäëïöüâêîôûãõñç",
+    "AEIOUAEIOUAEIOUAEIOUAONCaeiouaeiouaeiouaeiouaonc",
+)
+
+# Marcas típicas de UTF-8 leído como latin1/cp1252 ("DirecciÃ³n", "Â°")
+_MARCAS_MOJIBAKE = ("Ã", "Â", "â€")
+
+
+# ============================================================
+# FUNCIONES ESCALARES (se aplican una vez por valor único)
+# ============================================================
+
+def reparar_mojibake(texto: str) -> str:
+    """
+    "DirecciÃ³n" -> "Dirección". Si no parece mojibake o no se puede reparar,
+    devuelve el texto igual.
+    """
+    if not any(m in texto for m in _MARCAS_MOJIBAKE):
+        return texto
+    for codec in ("cp1252", "latin1"):
+        try:
+            return texto.encode(codec).decode("utf-8")
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            continue
+    return texto
+
+
+def quitar_tildes(texto: str) -> str:
+    """
+    Quita tildes, diéresis y eñe: tabla precompilada y, solo si queda algo
+    fuera de ASCII, pliegue NFKD.
+    """
+    texto = texto.translate(_TABLA_SIN_TILDES)
+    if texto.isascii():
+        return texto
+    return "".join(
+        ch for ch in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(ch)
+    )
+
+
+def _normalizar_valor(texto, strip, mayusculas, reparar, sin_tildes, quitar_prefijo, espacios_a):
+    if reparar:
+        texto = reparar_mojibake(texto)
+    if strip:
+        texto = texto.strip()
+    if mayusculas:
+        texto = texto.upper()
+    if sin_tildes:
+        texto = quitar_tildes(texto)
+    if quitar_prefijo:
+        texto = texto.lstrip(quitar_prefijo)
+    if espacios_a is not None:
+        texto = texto.replace(" ", espacios_a)
+    return texto
+
+
+# ============================================================
+# API VECTORIZADA
+# ============================================================
+
+def normalizar_texto(
+    serie,
+    strip=True,
+    mayusculas=False,
+    reparar=False,
+    sin_tildes=False,
+    quitar_prefijo=None,
+    espacios_a=None,
+):
+    """
+    Normaliza una columna de texto en UNA llamada: los nulos quedan "" y cada
+    valor único se procesa una sola vez (factorize + take), así el costo depende
+    de la cantidad de valores distintos y no del largo de la columna.
+    """
+    serie = pd.Series(serie) if not isinstance(serie, pd.Series) else serie
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+
+    normalizados = [
+        _normalizar_valor(str(u), strip, mayusculas, reparar, sin_tildes, quitar_prefijo, espacios_a)
+        for u in unicos
+    ]
+    # Centinela para nulos (código -1 -> última posición)
+    normalizados.append("")
+
+    valores = np.asarray(normalizados, dtype=object)[codigos]
+    return pd.Series(valores, index=serie.index, name=serie.name, dtype=object)
+
+
+def normalizar_encabezados(cols):
+    """
+    Encabezados canónicos: repara mojibake, MAYÚSCULAS, espacios -> "_",
+    sin tildes (incluye Ñ/Ü).
+    """
+    return normalizar_texto(
+        pd.Series(list(cols), dtype=object),
+        mayusculas=True,
+        reparar=True,
+        sin_tildes=True,
+        espacios_a="_",
+    ).tolist()
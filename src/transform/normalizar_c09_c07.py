@@ -1,6 +1,8 @@
 from pathlib import Path
 import pandas as pd
 
+from src.transform.esquema import alinear_encabezados
+
 
 def leer_encabezados_plantilla(ruta_plantilla: Path) -> list:
     """
@@ -35,6 +37,9 @@ def normalizar_base_para_plantilla():
     print(f"\n📊 Columnas base CSV ({len(df_base.columns)}):")
     print(list(df_base.columns))
 
+    # Alinear encabezados equivalentes (tildes / latin1) a los de la plantilla
+    df_base = alinear_encabezados(df_base, columnas_plantilla)
+
     # Agregar columnas faltantes en la base
     for col in columnas_plantilla:
         if col not in df_base.columns:
@@ -0,0 +1,139 @@
+# src/transform/reglas_ans.py
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import yaml
+
+from src.base_path import get_resource_path
+from src.transform.normalizador_texto import normalizar_texto
+
+
+RUTA_REGLAS = "config/reglas_ans.yaml"
+
+
+# ============================================================
+# CARGA Y COMPILACIÓN
+# ============================================================
+
+@lru_cache(maxsize=None)
+def _cargar_reglas():
+    ruta = get_resource_path(RUTA_REGLAS)
+    with open(ruta, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def version_reglas():
+    return _cargar_reglas()["version"]
+
+
+def _lista(valores):
+    return tuple(str(v).strip().upper() for v in (valores or []))
+
+
+def _compilar_detalle(cond):
+    """
+    Condiciones de `detalle` -> función detalle -> bool (todas deben cumplirse).
+    """
+    cond = cond or {}
+    igual = _lista(cond.get("igual"))
+    empieza = _lista(cond.get("empieza"))
+    contiene = _lista(cond.get("contiene"))
+    alguna = _lista(cond.get("contiene_alguna"))
+
+    def _cumple(d):
+        return (
+            (not igual or d in igual)
+            and (not empieza or d.startswith(empieza))
+            and all(x in d for x in contiene)
+            and (not alguna or any(x in d for x in alguna))
+        )
+
+    return _cumple
+
+
+@lru_cache(maxsize=None)
+def _reglas_compiladas():
+    reglas = _cargar_reglas()
+    forzados = [
+        (_compilar_detalle(r.get("detalle")), str(r["tipo_visita"]).strip().upper())
+        for r in reglas.get("tipo_visita_por_detalle") or []
+    ]
+    dias = [
+        (_compilar_detalle(r.get("detalle")), _lista(r.get("tipo_visita")), int(r["dias"]))
+        for r in reglas["reglas"]
+    ]
+    return forzados, dias
+
+
+# ============================================================
+# EVALUACIÓN (una vez por par distinto)
+# ============================================================
+
+@lru_cache(maxsize=None)
+def evaluar_regla(detalle: str, tipo_visita: str):
+    """
+    (DETALLE_VISITA, TIPO_VISITA) normalizados -> (TIPO_VISITA forzado o None, días ANS o None).
+    """
+    forzados, reglas = _reglas_compiladas()
+
+    tipo_forzado = next((t for cumple, t in forzados if cumple(detalle)), None)
+    tipo = tipo_forzado or tipo_visita
+
+    for cumple, tipos, dias in reglas:
+        if cumple(detalle) and (not tipos or tipo in tipos):
+            return tipo_forzado, dias
+    return tipo_forzado, None
+
+
+def clasificar_ans(detalles, tipos_visita) -> pd.DataFrame:
+    """
+    Vectorizado: evalúa las reglas una vez por par distinto (DETALLE, TIPO) y
+    reparte el resultado. Devuelve TIPO_VISITA (forzado o el original) y
+    DIAS_ANS (float, NaN si ninguna regla aplica), con el índice de `detalles`.
+    """
+    detalles = pd.Series(detalles)
+    tipos_visita = pd.Series(tipos_visita, index=detalles.index)
+
+    d = normalizar_texto(detalles, mayusculas=True)
+    t = normalizar_texto(tipos_visita, mayusculas=True)
+    codigos, unicos = pd.factorize(d + "\x1f" + t)
+
+    evaluados = [evaluar_regla(*par.split("\x1f", 1)) for par in unicos]
+    forzado = np.array([f for f, _ in evaluados] + [None], dtype=object)[codigos]
+    dias = np.array([np.nan if n is None else n for _, n in evaluados] + [np.nan], dtype=float)[codigos]
+
+    tipo_final = tipos_visita.where(pd.isna(forzado), forzado)
+    return pd.DataFrame({"TIPO_VISITA": tipo_final, "DIAS_ANS": dias}, index=detalles.index)
+
+
+# ============================================================
+# ESTADO POR DÍAS RESTANTES
+# ============================================================
+
+@lru_cache(maxsize=None)
+def umbrales_estado():
+    """
+    ([(hasta_dias o None, estado), ...], estado sin días).
+    """
+    reglas = _cargar_reglas()
+    umbrales = [(e.get("hasta_dias"), e["estado"]) for e in reglas["estados"]]
+    return umbrales, reglas.get("sin_dias", "")
+
+
+def estado_por_dias(dias):
+    umbrales, sin_dias = umbrales_estado()
+    if dias is None:
+        return sin_dias
+    return next((estado for hasta, estado in umbrales if hasta is None or dias <= hasta), sin_dias)
+
+
+def estados_por_dias(dias):
+    """
+    Versión vectorizada de estado_por_dias (NaN -> sin_dias).
+    """
+    umbrales, sin_dias = umbrales_estado()
+    dias = np.asarray(dias, dtype=float)
+    condiciones = [np.isnan(dias)] + [
+        np.ones(dias.shape, dtype=bool) if hasta is None else dias <= hasta for hasta, _ in umbrales
+    ]
+    return np.select(condiciones, [sin_dias] + [e for _, e in umbrales], default=sin_dias).astype(object)
@@ -7,40 +7,13 @@ from datetime import date, timedelta
 import tkinter as tk
 from tkinter import ttk
 
+from src.calendario_habil import festivos_colombia
+
 MESES_ES = [
     "", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
     "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
 ]
 
-# ============================================================
-# CONFIGURACIÓN FESTIVOS (mantén aquí los festivos del ANS)
-# ============================================================
-FESTIVOS = {
-    # 2025
-    date(2025, 1, 1), date(2025, 1, 6), date(2025, 3, 24), date(2025, 4, 17), date(2025, 4, 18),
-    date(2025, 5, 1), date(2025, 5, 26), date(2025, 6, 16), date(2025, 6, 23), date(2025, 7, 7),
-    date(2025, 8, 7), date(2025, 8, 18), date(2025, 10, 13), date(2025, 11, 3), date(2025, 11, 17),
-    date(2025, 12, 8), date(2025, 12, 25),
-
-    # 2026
-    date(2026, 1, 1), date(2026, 1, 12), date(2026, 3, 23), date(2026, 4, 2), date(2026, 4, 3),
-    date(2026, 5, 1), date(2026, 5, 18), date(2026, 6, 8), date(2026, 6, 15), date(2026, 6, 29),
-    date(2026, 7, 20), date(2026, 8, 7), date(2026, 8, 17), date(2026, 10, 12), date(2026, 11, 2),
-    date(2026, 11, 16), date(2026, 12, 8), date(2026, 12, 25),
-
-    # 2027
-    date(2027, 1, 1), date(2027, 1, 11), date(2027, 3, 22), date(2027, 4, 1), date(2027, 4, 2),
-    date(2027, 5, 1), date(2027, 5, 24), date(2027, 6, 14), date(2027, 6, 21), date(2027, 7, 20),
-    date(2027, 8, 7), date(2027, 8, 16), date(2027, 10, 18), date(2027, 11, 1), date(2027, 11, 15),
-    date(2027, 12, 8), date(2027, 12, 25),
-
-    # 2028
-    date(2028, 1, 1), date(2028, 1, 10), date(2028, 3, 20), date(2028, 4, 13), date(2028, 4, 14),
-    date(2028, 5, 1), date(2028, 5, 29), date(2028, 6, 19), date(2028, 6, 26), date(2028, 7, 20),
-    date(2028, 8, 7), date(2028, 8, 21), date(2028, 10, 16), date(2028, 11, 6), date(2028, 11, 13),
-    date(2028, 12, 8), date(2028, 12, 25),
-}
-
 @dataclass(frozen=True)
 class Theme:
     # Estética similar a tu 2da imagen (compacta)
@@ -176,6 +149,9 @@ class CalendarioANS(tk.Toplevel):
 
         hoy = date.today()
 
+        # Festivos de Colombia (mismo calendario que usa el cálculo de ANS)
+        festivos = festivos_colombia(self.year)
+
         for r, week in enumerate(weeks, start=1):
             # Semana ISO en columna 0
             wk = self._iso_week_for_row(self.year, self.month, week)
@@ -204,7 +180,7 @@ class CalendarioANS(tk.Toplevel):
 
                 d = date(self.year, self.month, daynum)
                 is_weekend = day_idx in (5, 6)  # Sa=5, Do=6
-                is_festivo = d in FESTIVOS
+                is_festivo = d in festivos
 
                 bg = self.theme.grid_bg
                 fg = self.theme.weekday_fg
@@ -300,6 +276,9 @@ class YearView(tk.Toplevel):
 
         self.lbl.config(text=str(self.year))
 
+        # Festivos de Colombia (mismo calendario que usa el cálculo de ANS)
+        festivos = festivos_colombia(self.year)
+
         # 12 meses en 3 filas x 4 columnas
         meses = list(range(1, 13))
         idx = 0
@@ -364,7 +343,7 @@ class YearView(tk.Toplevel):
 
                         d = date(self.year, m, daynum)
                         is_weekend = day_idx in (5, 6)
-                        is_festivo = d in FESTIVOS
+                        is_festivo = d in festivos
 
                         bg = self.theme.grid_bg
                         fg = self.theme.weekday_fg
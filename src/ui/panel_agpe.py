@@ -26,11 +26,28 @@ from src.mapas.generar_mapa_agpe import generar_mapa_leaflet_agpe
 from src.export.append_agpe_ans import append_agpe_ans
 from src.extract.consolidar_c09_c07 import consolidar_c09_c07
 from src.export.preparar_agpe_clean_excel import preparar_agpe_clean_excel
+from src.extract.vigilar_data_raw import CANDADO_CONSOLIDACION, LoteAplazado, VigilanteDataRaw, revisar_vista_clean
 
 # --------------------------------------------------
 # Funciones del formulario (NO TOCAR LÓGICA)
 # --------------------------------------------------
+def _consolidacion_ocupada():
+    """
+    Toma CANDADO_CONSOLIDACION sin bloquear la ventana. Si el vigilante está
+    procesando un lote, avisa y devuelve True (el candado no queda tomado).
+    """
+    if CANDADO_CONSOLIDACION.acquire(blocking=False):
+        return False
+    messagebox.showinfo(
+        "AGPE",
+        "La vigilancia de data_raw está consolidando un lote.\nIntente de nuevo en unos segundos."
+    )
+    return True
+
+
 def ejecutar_merge():
+    if _consolidacion_ocupada():
+        return
     try:
         lbl_estado.config(text="⏳ Generando AGPE_CLEAN...")
         ventana.update_idletasks()
@@ -48,8 +65,14 @@ def ejecutar_merge():
         lbl_estado.config(text="❌ Error generando AGPE_CLEAN")
         messagebox.showerror("Error", f"Ocurrió un error:\n\n{e}")
 
+    finally:
+        CANDADO_CONSOLIDACION.release()
+
 
 def ejecutar_append():
+    # El append lee y vacía AGPE_CLEAN: no puede cruzarse con un lote del vigilante
+    if _consolidacion_ocupada():
+        return
     try:
         lbl_estado.config(text="⏳ Actualizando AGPE_ANS...")
         ventana.update_idletasks()
@@ -73,6 +96,9 @@ def ejecutar_append():
             f"Ocurrió un error inesperado:\n\n{e}"
         )
 
+    finally:
+        CANDADO_CONSOLIDACION.release()
+
 
 def ejecutar_mapa():
     try:
@@ -92,11 +118,51 @@ def ejecutar_mapa():
         messagebox.showerror("Error", f"Ocurrió un error:\n\n{e}")
 
 
+def _lote_vigilante(archivos):
+    # Corre en el hilo del vigilante: la UI se actualiza con ventana.after
+    editada = revisar_vista_clean(APP_DIR / "data_clean" / "AGPE_CLEAN.xlsx")
+    ventana.after(0, lambda: lbl_estado.config(text=f"⏳ Consolidando {len(archivos)} archivo(s) nuevos..."))
+    consolidar_c09_c07(incremental=True)
+    preparar_agpe_clean_excel()
+    conservadas = " (ediciones de AGPE_CLEAN conservadas)" if editada else ""
+    ventana.after(0, lambda: lbl_estado.config(text=f"✅ AGPE_CLEAN actualizado automáticamente{conservadas}"))
+
+
+def _error_vigilante(e):
+    if isinstance(e, LoteAplazado):
+        ventana.after(0, lambda: lbl_estado.config(text=f"⏸️ Lote en espera: {e}"))
+        return
+    ventana.after(0, lambda: lbl_estado.config(text=f"❌ Error en vigilancia: {e}"))
+
+
+vigilante = VigilanteDataRaw(
+    carpeta=APP_DIR / "data_raw",
+    al_procesar=_lote_vigilante,
+    al_error=_error_vigilante,
+)
+
+
+def alternar_vigilancia():
+    try:
+        if vigilante.activo:
+            vigilante.detener()
+            btn_vigilar.config(text="👁️ Vigilar data_raw")
+            lbl_estado.config(text="⏹️ Vigilancia de data_raw detenida")
+        else:
+            vigilante.iniciar()
+            btn_vigilar.config(text="⏹️ Detener vigilancia")
+            lbl_estado.config(text="👁️ Vigilando data_raw...")
+    except Exception as e:
+        messagebox.showerror("Error", f"No se pudo iniciar la vigilancia:\n\n{e}")
+
+
 def mostrar_calendario():
     abrir_calendario(ventana)
 
 
 def salir_panel():
+    if vigilante.activo:
+        vigilante.detener()
     ventana.destroy()
 
 
@@ -340,6 +406,18 @@ tk.Button(
     command=mostrar_calendario
 ).pack(side="right", padx=(0, 8))
 
+btn_vigilar = tk.Button(
+    frame_footer_in,
+    text="👁️ Vigilar data_raw",
+    font=("Segoe UI", 9, "bold"),
+    bg="#EAEDED",
+    fg="#117A65",
+    relief="flat",
+    cursor="hand2",
+    command=alternar_vigilancia
+)
+btn_vigilar.pack(side="right", padx=(0, 8))
+
 tk.Label(
     frame_footer_in,
     text="© 2025 Elite Ingenieros S.A.S.",